@@ -8,7 +8,11 @@
 SCRIPT_DIR="/www/wwwroot/juhemusic"
 VENV_DIR="$SCRIPT_DIR/.venv"
 PYTHON_LOG="$SCRIPT_DIR/server.log"
-NODE_LOG="$SCRIPT_DIR/node.log"
+# Pre-fork server (serve_prod.py); WEB_WORKERS / WEB_THREADS size it. With
+# QQ_BRIDGE_SPAWN=1 it runs one QQ bridge per worker from port 8003 up, so no
+# node may be started on those ports separately.
+PYTHON_CMD="python serve_prod.py"
+BRIDGE_CMD="qq_bridge_server.js"
 
 # 颜色输出
 GREEN='\033[0;32m'
@@ -23,8 +27,8 @@ echo ""
 
 # 检查Python服务
 check_python() {
-    if pgrep -f "python server.py" > /dev/null; then
-        echo -e "${GREEN}✓${NC} Python Server is running (PID: $(pgrep -f 'python server.py'))"
+    if pgrep -f "$PYTHON_CMD" > /dev/null; then
+        echo -e "${GREEN}✓${NC} Python Server is running (PID: $(pgrep -f "$PYTHON_CMD"))"
         return 0
     else
         echo -e "${RED}✗${NC} Python Server is NOT running"
@@ -34,8 +38,8 @@ check_python() {
 
 # 检查Node服务
 check_node() {
-    if pgrep -f "node qq_bridge_server.js" > /dev/null; then
-        echo -e "${GREEN}✓${NC} QQ Bridge Server is running (PID: $(pgrep -f 'node qq_bridge_server.js'))"
+    if pgrep -f "$BRIDGE_CMD" > /dev/null; then
+        echo -e "${GREEN}✓${NC} QQ Bridge Servers are running (PID: $(pgrep -f "$BRIDGE_CMD" | tr '\n' ' '))"
         return 0
     else
         echo -e "${RED}✗${NC} QQ Bridge Server is NOT running"
@@ -61,30 +65,30 @@ check_ports() {
 # 停止Python服务
 stop_python() {
     echo -ne "Stopping Python Server... "
-    pkill -f "python server.py"
+    pkill -f "$PYTHON_CMD"
     sleep 2
-    if ! pgrep -f "python server.py" > /dev/null; then
+    if ! pgrep -f "$PYTHON_CMD" > /dev/null; then
         echo -e "${GREEN}OK${NC}"
     else
         echo -e "${RED}FAILED${NC}"
         echo "Force killing..."
-        pkill -9 -f "python server.py"
+        pkill -9 -f "$PYTHON_CMD"
         sleep 1
     fi
 }
 
-# 停止Node服务
+# 停止Node服务（包括旧版单独启动、占用 8003 的 bridge）
 stop_node() {
     echo -ne "Stopping QQ Bridge Server... "
     fuser -k 8003/tcp 2>/dev/null
-    pkill -f "node qq_bridge_server.js"
+    pkill -f "$BRIDGE_CMD"
     sleep 2
-    if ! pgrep -f "node qq_bridge_server.js" > /dev/null; then
+    if ! pgrep -f "$BRIDGE_CMD" > /dev/null; then
         echo -e "${GREEN}OK${NC}"
     else
         echo -e "${RED}FAILED${NC}"
         echo "Force killing..."
-        pkill -9 -f "node qq_bridge_server.js"
+        pkill -9 -f "$BRIDGE_CMD"
         fuser -k -9 8003/tcp 2>/dev/null
         sleep 1
     fi
@@ -100,12 +104,12 @@ start_python() {
         source "$VENV_DIR/bin/activate"
     fi
     
-    # 启动服务
-    nohup python server.py > "$PYTHON_LOG" 2>&1 &
+    # 启动服务（QQ bridge 由 serve_prod.py 按 worker 启动，日志也写入 $PYTHON_LOG）
+    QQ_BRIDGE_SPAWN=1 nohup $PYTHON_CMD > "$PYTHON_LOG" 2>&1 &
     sleep 3
     
-    if pgrep -f "python server.py" > /dev/null; then
-        echo -e "${GREEN}OK${NC} (PID: $(pgrep -f 'python server.py'))"
+    if pgrep -f "$PYTHON_CMD" > /dev/null; then
+        echo -e "${GREEN}OK${NC} (PID: $(pgrep -f "$PYTHON_CMD"))"
         return 0
     else
         echo -e "${RED}FAILED${NC}"
@@ -114,23 +118,6 @@ start_python() {
     fi
 }
 
-# 启动Node服务
-start_node() {
-    echo -ne "Starting QQ Bridge Server... "
-    cd "$SCRIPT_DIR"
-    nohup node qq_bridge_server.js > "$NODE_LOG" 2>&1 &
-    sleep 3
-    
-    if pgrep -f "node qq_bridge_server.js" > /dev/null; then
-        echo -e "${GREEN}OK${NC} (PID: $(pgrep -f 'node qq_bridge_server.js'))"
-        return 0
-    else
-        echo -e "${RED}FAILED${NC}"
-        echo "Check log: tail -f $NODE_LOG"
-        return 1
-    fi
-}
-
 # 主菜单
 show_menu() {
     echo ""
@@ -140,10 +127,9 @@ show_menu() {
     echo "  3) Stop services"
     echo "  4) Restart services"
     echo "  5) View Python log"
-    echo "  6) View Node log"
     echo "  0) Exit"
     echo ""
-    read -p "Enter choice [0-6]: " choice
+    read -p "Enter choice [0-5]: " choice
 }
 
 # 状态检查
@@ -161,7 +147,6 @@ if [ "$1" == "start" ]; then
     stop_python
     stop_node
     start_python
-    start_node
     status
     exit 0
 elif [ "$1" == "stop" ]; then
@@ -173,7 +158,6 @@ elif [ "$1" == "restart" ]; then
     stop_node
     sleep 1
     start_python
-    start_node
     echo ""
     status
     exit 0
@@ -191,8 +175,8 @@ while true; do
             status
             ;;
         2)
+            stop_node
             start_python
-            start_node
             echo ""
             status
             ;;
@@ -205,7 +189,6 @@ while true; do
             stop_node
             sleep 1
             start_python
-            start_node
             echo ""
             status
             ;;
@@ -214,11 +197,6 @@ while true; do
             sleep 2
             tail -f "$PYTHON_LOG"
             ;;
-        6)
-            echo "Press Ctrl+C to exit log view"
-            sleep 2
-            tail -f "$NODE_LOG"
-            ;;
         0)
             echo "Goodbye!"
             exit 0
@@ -1,11 +1,32 @@
-from flask import Flask, jsonify, request, Response
+from flask import Flask, g, jsonify, request, Response
 from qishui_updater import get_feed_list, get_track_info
 from qishui_decrypt import decrypt_audio
 import requests
 import io
+import os
+import time
 
 app = Flask(__name__)
 
+# server.py 通过 X-Trace-Id 传递追踪ID；超过该耗时的请求会打印日志
+TRACE_SLOW_MS = float(os.getenv("TRACE_SLOW_MS", "1000"))
+
+@app.before_request
+def _start_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def _trace_response(response):
+    """回传追踪ID，并通过 Server-Timing 报告本服务耗时"""
+    ms = (time.perf_counter() - g.request_start) * 1000
+    trace_id = request.headers.get("X-Trace-Id")
+    if trace_id:
+        response.headers["X-Trace-Id"] = trace_id
+    response.headers["Server-Timing"] = f"total;dur={ms:.1f}"
+    if ms >= TRACE_SLOW_MS:
+        print(f"[trace {trace_id or '-'}] {request.method} {request.full_path} {ms:.0f}ms")
+    return response
+
 @app.route('/feed', methods=['GET'])
 def feed():
     """
@@ -1,8 +1,11 @@
 const http = require('http');
 const QQMusic = require('./qqmusic_flac-main/qqmusic_flac-main/qqapi');
 
-const PORT = 8003;
+// server.py runs several isolated bridges on consecutive ports (QQ_BRIDGE_SPAWN=1).
+const PORT = parseInt(process.env.QQ_BRIDGE_PORT || process.argv[2] || '8003', 10);
 const HOST = '127.0.0.1';
+// server.py passes X-Trace-Id; parses slower than this are logged with it.
+const TRACE_SLOW_MS = parseFloat(process.env.TRACE_SLOW_MS || '1000');
 
 // Tiers to check (parallel fetch optimization)
 const TIERS = {
@@ -19,12 +22,31 @@ const TIERS = {
 };
 
 const server = http.createServer(async (req, res) => {
+  if (req.method === 'GET' && req.url === '/health') {
+    res.writeHead(200, { 'Content-Type': 'application/json' });
+    res.end(JSON.stringify({ status: 'ok', pid: process.pid, port: PORT }));
+    return;
+  }
+
   if (req.method !== 'POST') {
     res.writeHead(405);
     res.end('Method Not Allowed');
     return;
   }
 
+  const started = process.hrtime.bigint();
+  const traceId = req.headers['x-trace-id'] || '';
+  const elapsedMs = () => Number(process.hrtime.bigint() - started) / 1e6;
+  const traceHeaders = () => {
+    const ms = elapsedMs();
+    if (ms >= TRACE_SLOW_MS) {
+      console.log(`[trace ${traceId || '-'}] port=${PORT} parse ${ms.toFixed(0)}ms`);
+    }
+    const headers = { 'Content-Type': 'application/json', 'Server-Timing': `total;dur=${ms.toFixed(1)}` };
+    if (traceId) headers['X-Trace-Id'] = traceId;
+    return headers;
+  };
+
   let body = '';
   req.on('data', chunk => {
     body += chunk.toString();
@@ -128,11 +150,11 @@ const server = http.createServer(async (req, res) => {
         music_url,
       };
 
-      res.writeHead(200, { 'Content-Type': 'application/json' });
+      res.writeHead(200, traceHeaders());
       res.end(JSON.stringify(out));
 
     } catch (e) {
-      res.writeHead(500, { 'Content-Type': 'application/json' });
+      res.writeHead(500, traceHeaders());
       res.end(JSON.stringify({ error: e.message || String(e) }));
     }
   });
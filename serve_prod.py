@@ -0,0 +1,347 @@
+#!/usr/bin/env python3
+"""Pre-fork production serving mode for server.py.
+
+The master binds the listening socket once and forks WEB_WORKERS processes,
+each running server.APP on a werkzeug server with a fixed pool of
+WEB_THREADS request threads; when every thread is busy a worker stops
+accepting and the kernel hands new connections to its siblings. Workers
+import server.py after the fork, so the master never holds threads, locks or
+sockets of its own besides the listener.
+
+Workers share the /parse and /search results and the parse single-flight
+through the SQLite file at SHARED_CACHE_DB (see server.SharedCache), so more
+workers do not mean more upstream calls. Each worker logs traces to its own
+logs/trace.<slot>.jsonl.
+
+A worker exits after WEB_MAX_REQUESTS (+ random jitter) requests once its
+in-flight requests are done and is replaced. Signals to the master:
+
+    TERM / INT   drain workers (up to --graceful-timeout) and exit
+    HUP          replace the workers one at a time, draining each first
+
+Each QQ bridge port belongs to exactly one worker, because a bridge must only
+see the parses its owner's QQBridgePool serializes. With QQ_BRIDGE_SPAWN=1
+the master runs at least one Node bridge per worker itself; otherwise
+QQ_BRIDGE_PORTS must list a port per worker, and the worker count is clamped
+to the number of ports. HUP replaces a worker only after the old one has
+exited, one slot at a time, so two processes never share a bridge.
+
+    python serve_prod.py --workers 4 --threads 32
+"""
+import argparse
+import os
+import random
+import signal
+import socket
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+
+ROOT = Path(__file__).resolve().parent
+
+class WorkerRequestHandler(WSGIRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Idle keep-alive connections give their pool thread back after this long.
+    timeout = 5.0
+
+class PooledWSGIServer(BaseWSGIServer):
+    """werkzeug server handling connections on a bounded thread pool."""
+
+    multithread = True
+
+    def __init__(self, host: str, port: int, app, threads: int, fd: int) -> None:
+        super().__init__(host, port, app, handler=WorkerRequestHandler, fd=fd)
+        self.pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="http")
+        self.slots = threading.BoundedSemaphore(threads)
+
+    def process_request(self, request, client_address) -> None:
+        # Blocks the accept loop while all threads are busy.
+        self.slots.acquire()
+        self.pool.submit(self._handle, request, client_address)
+
+    def _handle(self, request, client_address) -> None:
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self.slots.release()
+
+class RecyclingApp:
+    """WSGI wrapper that calls on_limit once max_requests have started."""
+
+    def __init__(self, app, max_requests: int, on_limit) -> None:
+        self.app = app
+        self.max_requests = max_requests
+        self.on_limit = on_limit
+        self.served = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, environ, start_response):
+        with self._lock:
+            self.served += 1
+            last = self.served == self.max_requests
+        if last:
+            self.on_limit()
+        return self.app(environ, start_response)
+
+def slot_ports(slot: int, ports: List[int], workers: int) -> List[int]:
+    """Bridge ports owned by one worker; no port is given to two workers."""
+    if len(ports) < workers:
+        raise ValueError(f"{len(ports)} bridge ports cannot cover {workers} workers")
+    return ports[slot::workers]
+
+def slot_trace_log(slot: int) -> str:
+    base = Path(os.environ.get("TRACE_LOG") or ROOT / "logs" / "trace.jsonl")
+    return str(base.with_name(f"{base.stem}.{slot}{base.suffix}"))
+
+def run_worker(slot: int, fd: int, args: argparse.Namespace, bridge_ports: List[int], master_pid: int) -> None:
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # Ctrl+C reaches the master, which sends TERM
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    os.environ["TRACE_LOG"] = slot_trace_log(slot)
+    if bridge_ports:
+        os.environ["QQ_BRIDGE_SPAWN"] = "0"
+        os.environ["QQ_BRIDGE_PORTS"] = ",".join(str(p) for p in slot_ports(slot, bridge_ports, args.workers))
+
+    sys.path.insert(0, str(ROOT))
+    import server
+
+    WorkerRequestHandler.timeout = args.keepalive
+    srv = PooledWSGIServer(args.host, args.port, None, args.threads, fd)
+    stopping = threading.Event()
+
+    def stop(reason: str) -> None:
+        if stopping.is_set():
+            return
+        stopping.set()
+        print(f"[Worker {slot}] pid={os.getpid()} stopping: {reason}")
+        # shutdown() waits for serve_forever, so it cannot run on the serving thread.
+        threading.Thread(target=srv.shutdown, daemon=True).start()
+
+    limit = args.max_requests + random.randint(0, max(0, args.max_requests_jitter)) if args.max_requests > 0 else 0
+    srv.app = RecyclingApp(server.APP, limit, lambda: stop(f"served {limit} requests"))
+    signal.signal(signal.SIGTERM, lambda *_: stop("TERM"))
+
+    def watch_master() -> None:
+        while not stopping.is_set():
+            if os.getppid() != master_pid:
+                stop("master exited")
+            time.sleep(1)
+
+    threading.Thread(target=watch_master, name="watch-master", daemon=True).start()
+    print(f"[Worker {slot}] pid={os.getpid()} threads={args.threads} max_requests={limit or 'unlimited'}")
+    srv.serve_forever()
+    srv.pool.shutdown(wait=True)
+
+class Arbiter:
+    """Forks the workers, replaces the ones that exit, supervises spawned bridges."""
+
+    def __init__(self, args: argparse.Namespace) -> None:
+        self.args = args
+        self.workers: Dict[int, int] = {}  # pid -> slot
+        self.started: Dict[int, float] = {}
+        self.bridges: Dict[int, subprocess.Popen] = {}
+        self.bridge_ports: List[int] = []
+        self.sock: Optional[socket.socket] = None
+        self.stopping = False
+        self.reloading = False
+        self.reload_queue: List[int] = []  # old worker pids still to replace
+        self.reload_pid: Optional[int] = None
+        self.reload_deadline = 0.0
+
+    def run(self) -> None:
+        args = self.args
+        self.sock = socket.create_server((args.host, args.port), backlog=args.backlog)
+        self.sock.set_inheritable(True)
+        os.environ.setdefault("SHARED_CACHE_DB", str(ROOT / "cache" / "shared.sqlite3"))
+        clear_leases(Path(os.environ["SHARED_CACHE_DB"]))
+        self.start_bridges()
+
+        signal.signal(signal.SIGTERM, self._on_stop)
+        signal.signal(signal.SIGINT, self._on_stop)
+        signal.signal(signal.SIGHUP, self._on_reload)
+        print(f"[Master] pid={os.getpid()} listening on {args.host}:{args.port} workers={args.workers}")
+
+        while not self.stopping:
+            self.reap()
+            if self.reloading:
+                self.reloading = False
+                self.reload()
+            self.spawn_missing()
+            self.roll_reload()
+            self.check_bridges()
+            time.sleep(0.5)
+        self.shutdown()
+
+    def _on_stop(self, *_) -> None:
+        self.stopping = True
+
+    def _on_reload(self, *_) -> None:
+        self.reloading = True
+
+    def spawn(self, slot: int) -> None:
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                run_worker(slot, self.sock.fileno(), self.args, self.bridge_ports, os.getppid())
+            except BaseException as e:
+                print(f"[Worker {slot}] crashed: {e!r}")
+                code = 1
+            finally:
+                sys.stdout.flush()
+                os._exit(code)
+        self.workers[pid] = slot
+        self.started[pid] = time.monotonic()
+
+    def spawn_missing(self) -> None:
+        live = set(self.workers.values())
+        for slot in range(self.args.workers):
+            if slot not in live:
+                self.spawn(slot)
+
+    def reap(self) -> None:
+        while self.workers:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            slot = self.workers.pop(pid, None)
+            started = self.started.pop(pid, time.monotonic())
+            if slot is None:
+                continue
+            print(f"[Master] worker {slot} pid={pid} exited with {os.waitstatus_to_exitcode(status)}")
+            if time.monotonic() - started < 1:
+                # Crashing on import (e.g. a bad deploy): don't fork in a tight loop.
+                time.sleep(1)
+
+    def reload(self) -> None:
+        self.reload_queue = list(self.workers)
+        self.reload_pid = None
+        print(f"[Master] reloading {len(self.reload_queue)} workers")
+
+    def roll_reload(self) -> None:
+        """Replace the old workers one slot at a time.
+
+        A slot's worker is drained and reaped before spawn_missing forks its
+        replacement, so the slot's bridge ports never have two owners, while
+        the other slots keep serving.
+        """
+        if self.reload_pid in self.workers:
+            if time.monotonic() >= self.reload_deadline:
+                print(f"[Master] worker pid={self.reload_pid} did not drain in time, killing")
+                self.kill(self.reload_pid, signal.SIGKILL)
+            return
+        self.reload_pid = None
+        while self.reload_queue:
+            pid = self.reload_queue.pop(0)
+            if pid in self.workers:
+                self.reload_pid = pid
+                self.reload_deadline = time.monotonic() + self.args.graceful_timeout
+                self.kill(pid, signal.SIGTERM)
+                return
+
+    def kill(self, pid: int, sig: int) -> None:
+        try:
+            os.kill(pid, sig)
+        except ProcessLookupError:
+            pass
+
+    def shutdown(self) -> None:
+        print(f"[Master] stopping {len(self.workers)} workers")
+        for pid in list(self.workers):
+            self.kill(pid, signal.SIGTERM)
+        deadline = time.monotonic() + self.args.graceful_timeout
+        while self.workers and time.monotonic() < deadline:
+            self.reap()
+            time.sleep(0.1)
+        for pid in list(self.workers):
+            print(f"[Master] worker pid={pid} did not drain in time, killing")
+            self.kill(pid, signal.SIGKILL)
+        self.reap()
+        for proc in self.bridges.values():
+            if proc.poll() is None:
+                proc.terminate()
+        self.sock.close()
+
+    def start_bridges(self) -> None:
+        if os.environ.get("QQ_BRIDGE_SPAWN", "0") != "1":
+            ports = os.environ.get("QQ_BRIDGE_PORTS", "8003")
+            self.bridge_ports = [int(p) for p in ports.split(",") if p.strip()]
+            if not self.bridge_ports:
+                raise SystemExit("QQ_BRIDGE_PORTS is empty; set it or QQ_BRIDGE_SPAWN=1")
+            if len(self.bridge_ports) < self.args.workers:
+                print(f"[Master] only {len(self.bridge_ports)} QQ bridge ports for {self.args.workers} workers; "
+                      f"running {len(self.bridge_ports)} workers (set QQ_BRIDGE_SPAWN=1 or list more ports)")
+                self.args.workers = len(self.bridge_ports)
+            return
+        base = int(os.environ.get("QQ_BRIDGE_BASE_PORT", "8003"))
+        count = max(1, self.args.workers, int(os.environ.get("QQ_BRIDGE_WORKERS", str(os.cpu_count() or 2))))
+        self.bridge_ports = [base + i for i in range(count)]
+        for port in self.bridge_ports:
+            self.launch_bridge(port)
+
+    def launch_bridge(self, port: int) -> None:
+        env = os.environ.copy()
+        env["QQ_BRIDGE_PORT"] = str(port)
+        script = ROOT / "qq_bridge_server.js"
+        proc = subprocess.Popen([os.environ.get("NODE_BIN", "node"), str(script)], cwd=str(ROOT), env=env)
+        self.bridges[port] = proc
+        print(f"[QQ Bridge] Started worker pid={proc.pid} port={port}")
+
+    def check_bridges(self) -> None:
+        # Hung bridges are taken out of rotation by each worker's QQBridgePool;
+        # the master only brings back the ones that exited.
+        for port, proc in list(self.bridges.items()):
+            if proc.poll() is not None:
+                print(f"[QQ Bridge] Worker port={port} exited with {proc.returncode}, restarting")
+                self.launch_bridge(port)
+
+def clear_leases(db_path: Path) -> None:
+    """Drop single-flight leases left by workers of a previous run."""
+    if not db_path.exists():
+        return
+    try:
+        db = sqlite3.connect(str(db_path), timeout=10)
+        try:
+            db.execute("DELETE FROM leases")
+            db.commit()
+        finally:
+            db.close()
+    except sqlite3.Error:
+        pass
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    ap.add_argument("--port", type=int, default=int(os.getenv("PORT", "8002")))
+    ap.add_argument("--workers", type=int, default=int(os.getenv("WEB_WORKERS", str(os.cpu_count() or 2))),
+                    help="worker processes")
+    ap.add_argument("--threads", type=int, default=int(os.getenv("WEB_THREADS", "32")),
+                    help="request threads per worker")
+    ap.add_argument("--max-requests", type=int, default=int(os.getenv("WEB_MAX_REQUESTS", "10000")),
+                    help="recycle a worker after this many requests, 0 = never")
+    ap.add_argument("--max-requests-jitter", type=int, default=int(os.getenv("WEB_MAX_REQUESTS_JITTER", "1000")),
+                    help="random extra requests so workers do not recycle together")
+    ap.add_argument("--graceful-timeout", type=float, default=float(os.getenv("WEB_GRACEFUL_TIMEOUT", "30")),
+                    help="seconds a stopping worker gets to finish in-flight requests")
+    ap.add_argument("--keepalive", type=float, default=float(os.getenv("WEB_KEEPALIVE", "5")),
+                    help="idle keep-alive timeout per connection")
+    ap.add_argument("--backlog", type=int, default=int(os.getenv("WEB_BACKLOG", "2048")))
+    args = ap.parse_args()
+    args.workers = max(1, args.workers)
+    args.threads = max(1, args.threads)
+    Arbiter(args).run()
+
+if __name__ == "__main__":
+    main()
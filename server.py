@@ -1,17 +1,33 @@
 #!/usr/bin/env python3
+import asyncio
+import contextvars
 import json
+import logging
+import logging.handlers
 import os
+import random
 import re
+import sqlite3
 import subprocess
 import sys
+import threading
+import unicodedata
+import uuid
 from dataclasses import dataclass
 from pathlib import Path
 from typing import Any, Dict, List, Optional, Tuple
 import requests
+from requests.adapters import HTTPAdapter
+from http.cookiejar import DefaultCookiePolicy
 import atexit
 import time
+from contextlib import contextmanager
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed, wait
+from datetime import datetime, timedelta, timezone
+from urllib.parse import parse_qsl, urljoin, urlsplit
 
-from flask import Flask, jsonify, request
+from flask import Flask, Response, g, jsonify, request
 
 @dataclass
 class Config:
@@ -25,13 +41,116 @@ class Config:
     qq_cookie_path: str = os.getenv("QQ_COOKIE_PATH", "")
     wyy_cookie_path: str = os.getenv("WYY_COOKIE_PATH", "")
 
+    # Local qishui service (qishui/qishui_api.py)
+    qishui_api: str = os.getenv("QISHUI_API", "http://127.0.0.1:8372")
+
+    # /parse result cache. Entry TTLs follow the expiry signed into the CDN urls;
+    # the default applies when no url carries one (e.g. QQ vkey links).
+    parse_cache_size: int = int(os.getenv("PARSE_CACHE_SIZE", "2048"))
+    parse_cache_default_ttl: float = float(os.getenv("PARSE_CACHE_DEFAULT_TTL", "300"))
+    parse_cache_max_ttl: float = float(os.getenv("PARSE_CACHE_MAX_TTL", "1800"))
+    parse_cache_margin: float = float(os.getenv("PARSE_CACHE_MARGIN", "60"))
+
+    # QQ bridge workers. Each qq_bridge_server.js instance serves one parse at a
+    # time; with QQ_BRIDGE_SPAWN=1 server.py launches QQ_BRIDGE_WORKERS of them on
+    # consecutive ports, otherwise it uses the already running QQ_BRIDGE_PORTS.
+    qq_bridge_spawn: bool = os.getenv("QQ_BRIDGE_SPAWN", "0") == "1"
+    qq_bridge_workers: int = int(os.getenv("QQ_BRIDGE_WORKERS", str(os.cpu_count() or 2)))
+    qq_bridge_base_port: int = int(os.getenv("QQ_BRIDGE_BASE_PORT", "8003"))
+    qq_bridge_ports: str = os.getenv("QQ_BRIDGE_PORTS", "8003")
+    qq_bridge_health_interval: float = float(os.getenv("QQ_BRIDGE_HEALTH_INTERVAL", "5"))
+    qq_bridge_acquire_timeout: float = float(os.getenv("QQ_BRIDGE_ACQUIRE_TIMEOUT", "30"))
+
+    # Keep-alive connection pools for outbound calls. HTTP_POOL_SIZES overrides
+    # the per-upstream size, e.g. "qq_bridge=16,qishui=8".
+    http_pool_size: int = int(os.getenv("HTTP_POOL_SIZE", "32"))
+    http_pool_sizes: str = os.getenv("HTTP_POOL_SIZES", "")
+
+    # Ask song detail which levels the song/account can play before fanning out
+    # url_v1 calls; off means always request every level.
+    wyy_probe_privileges: bool = os.getenv("WYY_PROBE_PRIVILEGES", "1") == "1"
+    # Levels requested while the probe is still running, and how long a
+    # song's probed levels are reused per account.
+    wyy_likely_levels: str = os.getenv("WYY_LIKELY_LEVELS", "lossless,exhigh")
+    wyy_privilege_cache_size: int = int(os.getenv("WYY_PRIVILEGE_CACHE_SIZE", "20000"))
+    wyy_privilege_ttl: float = float(os.getenv("WYY_PRIVILEGE_TTL", "21600"))
+
+    # Extra accounts live next to the primary cookie file as cookie.2, cookie_b,
+    # ...; the directory is rescanned at most every COOKIE_RELOAD_INTERVAL s.
+    cookie_reload_interval: float = float(os.getenv("COOKIE_RELOAD_INTERVAL", "10"))
+    cookie_cooldown: float = float(os.getenv("COOKIE_COOLDOWN", "30"))
+    cookie_max_cooldown: float = float(os.getenv("COOKIE_MAX_COOLDOWN", "600"))
+
+    # Shared pool for the per-song Netease url_v1 fan-out
+    wyy_fanout_workers: int = int(os.getenv("WYY_FANOUT_WORKERS", "32"))
+
+    # POST /parse/batch: max urls per request and concurrent parses per platform
+    batch_max_urls: int = int(os.getenv("BATCH_MAX_URLS", "500"))
+    batch_wyy_concurrency: int = int(os.getenv("BATCH_WYY_CONCURRENCY", "4"))
+    batch_qq_concurrency: int = int(os.getenv("BATCH_QQ_CONCURRENCY", "4"))
+    batch_qishui_concurrency: int = int(os.getenv("BATCH_QISHUI_CONCURRENCY", "4"))
+
+    # /search?platform=all: platforms still running after SEARCH_ALL_TIMEOUT s
+    # are reported in "errors" and the merged list is returned without them.
+    search_all_timeout: float = float(os.getenv("SEARCH_ALL_TIMEOUT", "3"))
+    search_fanout_workers: int = int(os.getenv("SEARCH_FANOUT_WORKERS", "16"))
+
+    # /search result cache; one entry per (platform, keyword) serves every
+    # limit up to the one it was fetched with.
+    search_cache_size: int = int(os.getenv("SEARCH_CACHE_SIZE", "1024"))
+    search_cache_ttl: float = float(os.getenv("SEARCH_CACHE_TTL", "300"))
+
+    # Persistent short share link -> canonical url store (SQLite)
+    short_link_db: str = os.getenv("SHORT_LINK_DB", "")
+
+    # Request tracing. Every request gets one summary line in TRACE_LOG (JSONL,
+    # rotated at TRACE_LOG_MAX_BYTES); requests slower than TRACE_SLOW_MS also
+    # get their full span list.
+    trace_enabled: bool = os.getenv("TRACE_ENABLED", "1") == "1"
+    trace_log: str = os.getenv("TRACE_LOG", "")
+    trace_log_max_bytes: int = int(os.getenv("TRACE_LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+    trace_log_backups: int = int(os.getenv("TRACE_LOG_BACKUPS", "5"))
+    trace_slow_ms: float = float(os.getenv("TRACE_SLOW_MS", "1000"))
+
+    # Cache shared by serve_prod.py workers (SQLite); empty disables it.
+    # serve_prod.py sets it to cache/shared.sqlite3 unless given.
+    shared_cache_db: str = os.getenv("SHARED_CACHE_DB", "")
+    shared_cache_size: int = int(os.getenv("SHARED_CACHE_SIZE", "20000"))
+    shared_lease_ttl: float = float(os.getenv("SHARED_LEASE_TTL", "45"))
+
+    # /playlist song/detail batches: ids per request, requests in flight per
+    # playlist, and the shared pool running them.
+    wyy_detail_chunk: int = int(os.getenv("WYY_DETAIL_CHUNK", "100"))
+    wyy_detail_concurrency: int = int(os.getenv("WYY_DETAIL_CONCURRENCY", "6"))
+    wyy_detail_workers: int = int(os.getenv("WYY_DETAIL_WORKERS", "32"))
+    # Keep each playlist's track details between visits (music_api.PlaylistStore)
+    wyy_playlist_incremental: bool = os.getenv("WYY_PLAYLIST_INCREMENTAL", "1") == "1"
+    # /urls: song ids per url/v1 request (the eapi takes a list of ids)
+    wyy_url_batch: int = int(os.getenv("WYY_URL_BATCH", "200"))
+
+    # Largest page /playlist?limit= may ask for
+    playlist_max_limit: int = int(os.getenv("PLAYLIST_MAX_LIMIT", "1000"))
+
+    # Per-upstream resilience, see Upstream. Attempt timeouts follow the recent
+    # p99 latency times UPSTREAM_TIMEOUT_MULTIPLIER, between UPSTREAM_TIMEOUT_MIN
+    # and each upstream's fixed ceiling. Retries only happen while the shared
+    # budget (RETRY_BUDGET_RATIO retries per call) has tokens left.
+    upstream_retries: int = int(os.getenv("UPSTREAM_RETRIES", "1"))
+    upstream_timeout_min: float = float(os.getenv("UPSTREAM_TIMEOUT_MIN", "2"))
+    upstream_timeout_multiplier: float = float(os.getenv("UPSTREAM_TIMEOUT_MULTIPLIER", "3"))
+    retry_budget_ratio: float = float(os.getenv("RETRY_BUDGET_RATIO", "0.1"))
+    breaker_failures: int = int(os.getenv("BREAKER_FAILURES", "5"))
+    breaker_reset: float = float(os.getenv("BREAKER_RESET", "30"))
+
 APP = Flask(__name__)
 CFG = Config()
 
 def api_ok(data: Any) -> Tuple[Any, int]:
+    g.api_code = 200
     return jsonify({"code": 200, "msg": "ok", "data": data}), 200
 
 def api_err(msg: str, code: int = 500) -> Tuple[Any, int]:
+    g.api_code = code
     return jsonify({"code": code, "msg": msg, "data": None}), 200
 
 def find_cookie_path(explicit: str, candidates: List[str]) -> Path:
@@ -71,13 +190,985 @@ WYY_COOKIE_STR = read_cookie_string(WYY_COOKIE_PATH)
 QQ_COOKIE_KV = parse_cookie_to_dict(QQ_COOKIE_STR)
 WYY_COOKIE_KV = parse_cookie_to_dict(WYY_COOKIE_STR)
 
+# Upstream answers that mean "slow down" rather than "this request is wrong"
+THROTTLE_MARKERS = ("-460", "-462", "频繁", "cheating", "rate limit", "too many")
+
+def is_throttle_error(e: BaseException) -> bool:
+    msg = str(e).lower()
+    return any(m in msg for m in THROTTLE_MARKERS)
+
+class CookieAccount:
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.mtime = 0.0
+        self.cookie_str = ""
+        self.kv: Dict[str, str] = {}
+        self.in_use = 0
+        self.last_used = 0.0
+        self.requests = 0
+        self.errors = 0
+        self.throttles = 0
+        self.consecutive_throttles = 0
+        self.cooldown_until = 0.0
+
+    def load(self) -> None:
+        self.mtime = self.path.stat().st_mtime
+        self.cookie_str = read_cookie_string(self.path)
+        self.kv = parse_cookie_to_dict(self.cookie_str)
+
+class CookiePool:
+    """Accounts for one platform, spread across requests.
+
+    The pool holds the primary cookie file plus its numbered or named siblings
+    (qq/cookie, qq/cookie.2, qq/cookie_alt, qq/cookie_3.txt, ...). Each request leases the
+    least busy, least recently used account that is not cooling down after a
+    rate-limit answer. Changed, added or removed files are picked up without a
+    restart.
+    """
+
+    def __init__(self, platform: str, primary: Path) -> None:
+        self.platform = platform
+        self.primary = primary
+        self.accounts: Dict[Path, CookieAccount] = {}
+        self._lock = threading.Lock()
+        self._last_scan = 0.0
+        self._scan()
+
+    def _is_account_file(self, path: Path) -> bool:
+        """cookie, cookie.2, cookie_b, cookie_2.txt; not editor or backup files like cookie.bak, cookie~."""
+        base = self.primary.name[:-4] if self.primary.name.endswith(".txt") else self.primary.name
+        return re.fullmatch(rf"{re.escape(base)}(?:\.\d+|_[A-Za-z0-9]+)?(?:\.txt)?", path.name) is not None
+
+    def _scan(self) -> None:
+        self._last_scan = time.monotonic()
+        found = sorted(
+            p for p in self.primary.parent.iterdir()
+            if self._is_account_file(p) and p.is_file()
+        )
+        for path in found:
+            acct = self.accounts.get(path)
+            try:
+                if acct is None:
+                    acct = CookieAccount(path)
+                    acct.load()
+                    self.accounts[path] = acct
+                    print(f"[Cookies] {self.platform}: loaded {path.name}")
+                elif path.stat().st_mtime != acct.mtime:
+                    acct.load()
+                    acct.consecutive_throttles = 0
+                    acct.cooldown_until = 0.0
+                    print(f"[Cookies] {self.platform}: reloaded {path.name}")
+            except OSError as e:
+                print(f"[Cookies] {self.platform}: cannot read {path}: {e}")
+        for path in list(self.accounts):
+            if path not in found:
+                del self.accounts[path]
+                print(f"[Cookies] {self.platform}: dropped {path.name}")
+
+    def acquire(self) -> CookieAccount:
+        with self._lock:
+            if time.monotonic() - self._last_scan >= CFG.cookie_reload_interval:
+                self._scan()
+            usable = [a for a in self.accounts.values() if a.cookie_str]
+            if not usable:
+                raise RuntimeError(f"No {self.platform} cookie available")
+            now = time.time()
+            ready = [a for a in usable if a.cooldown_until <= now]
+            if ready:
+                acct = min(ready, key=lambda a: (a.in_use, a.last_used))
+            else:
+                # Everyone is throttled: use whoever recovers first.
+                acct = min(usable, key=lambda a: a.cooldown_until)
+            acct.in_use += 1
+            acct.last_used = now
+            acct.requests += 1
+            return acct
+
+    def report(self, acct: CookieAccount, error: Optional[BaseException]) -> None:
+        """Record an upstream failure seen with this account (errors that were handled included)."""
+        if error is None:
+            return
+        with self._lock:
+            acct.errors += 1
+            if is_throttle_error(error):
+                acct.throttles += 1
+                acct.consecutive_throttles += 1
+                backoff = CFG.cookie_cooldown * (2 ** (acct.consecutive_throttles - 1))
+                acct.cooldown_until = time.time() + min(backoff, CFG.cookie_max_cooldown)
+
+    def release(self, acct: CookieAccount, error: Optional[BaseException] = None, succeeded: bool = True) -> None:
+        self.report(acct, error)
+        with self._lock:
+            acct.in_use -= 1
+            if error is None and succeeded:
+                acct.consecutive_throttles = 0
+
+    @contextmanager
+    def lease(self):
+        acct = self.acquire()
+        error: Optional[Exception] = None
+        succeeded = False
+        try:
+            yield acct
+            succeeded = True
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            # Also on GeneratorExit / CancelledError (a closed generator or a
+            # cancelled task), which are not failures of the account.
+            self.release(acct, error, succeeded)
+
+    def stats(self) -> List[Dict[str, Any]]:
+        now = time.time()
+        with self._lock:
+            return [
+                {
+                    "file": a.path.name,
+                    "in_use": a.in_use,
+                    "requests": a.requests,
+                    "errors": a.errors,
+                    "throttles": a.throttles,
+                    "cooldown": round(max(0.0, a.cooldown_until - now), 1),
+                }
+                for a in self.accounts.values()
+            ]
+
+QQ_COOKIES = CookiePool("qq", QQ_COOKIE_PATH)
+WYY_COOKIES = CookiePool("wyy", WYY_COOKIE_PATH)
+
+class Metrics:
+    """Minimal Prometheus text-format registry for /metrics.
+
+    Counters and histograms are keyed by metric name plus a sorted label tuple.
+    Gauges are callbacks evaluated at scrape time, so they never go stale.
+    """
+
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+    def __init__(self) -> None:
+        self._help: Dict[str, Tuple[str, str]] = {}
+        self._counters: Dict[Tuple[str, Tuple], float] = {}
+        self._hists: Dict[Tuple[str, Tuple], List[float]] = {}
+        self._gauges: List[Tuple[str, Any]] = []
+        self._lock = threading.Lock()
+
+    def describe(self, name: str, kind: str, text: str) -> None:
+        self._help[name] = (kind, text)
+
+    def inc(self, name: str, labels: Dict[str, str], value: float = 1.0) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0.0) + value
+
+    def observe(self, name: str, labels: Dict[str, str], value: float) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            h = self._hists.get(key)
+            if h is None:
+                # one slot per bucket, then +Inf, sum
+                h = self._hists[key] = [0.0] * (len(self.BUCKETS) + 2)
+            for i, bound in enumerate(self.BUCKETS):
+                if value <= bound:
+                    h[i] += 1
+            h[-2] += 1
+            h[-1] += value
+
+    def gauge(self, name: str, text: str, fn) -> None:
+        """fn() returns [(labels, value), ...]"""
+        self.describe(name, "gauge", text)
+        self._gauges.append((name, fn))
+
+    @staticmethod
+    def _fmt(labels) -> str:
+        if not labels:
+            return ""
+        body = ",".join('%s="%s"' % (k, str(v).replace("\\", "\\\\").replace('"', '\\"')) for k, v in labels)
+        return "{" + body + "}"
+
+    def render(self) -> str:
+        lines: List[str] = []
+        seen = set()
+
+        def header(name: str) -> None:
+            if name not in seen and name in self._help:
+                kind, text = self._help[name]
+                lines.append(f"# HELP {name} {text}")
+                lines.append(f"# TYPE {name} {kind}")
+            seen.add(name)
+
+        with self._lock:
+            counters = sorted(self._counters.items())
+            hists = sorted((k, list(v)) for k, v in self._hists.items())
+        for (name, labels), value in counters:
+            header(name)
+            lines.append(f"{name}{self._fmt(labels)} {value:g}")
+        for (name, labels), h in hists:
+            header(name)
+            for i, bound in enumerate(self.BUCKETS):
+                lines.append(f"{name}_bucket{self._fmt(labels + (('le', f'{bound:g}'),))} {h[i]:g}")
+            lines.append(f"{name}_bucket{self._fmt(labels + (('le', '+Inf'),))} {h[-2]:g}")
+            lines.append(f"{name}_sum{self._fmt(labels)} {h[-1]:.6f}")
+            lines.append(f"{name}_count{self._fmt(labels)} {h[-2]:g}")
+        for name, fn in self._gauges:
+            header(name)
+            try:
+                samples = fn()
+            except Exception as e:
+                print(f"[Metrics] gauge {name} failed: {e}")
+                continue
+            for labels, value in samples:
+                lines.append(f"{name}{self._fmt(tuple(sorted(labels.items())))} {value:g}")
+        return "\n".join(lines) + "\n"
+
+METRICS = Metrics()
+METRICS.describe("juhe_http_requests_total", "counter", "HTTP requests served, by route, platform and response code")
+METRICS.describe("juhe_http_request_duration_seconds", "histogram", "HTTP request latency by route and platform")
+METRICS.describe("juhe_upstream_requests_total", "counter", "Upstream calls by upstream and outcome")
+METRICS.describe("juhe_upstream_duration_seconds", "histogram", "Upstream call latency by upstream")
+METRICS.describe("juhe_qq_bridge_wait_seconds", "histogram", "Time spent waiting for an idle QQ bridge worker")
+
+TRACE_HEADER = "X-Trace-Id"
+
+class Trace:
+    """Spans recorded while serving one request, possibly from several threads."""
+
+    def __init__(self, trace_id: str) -> None:
+        self.trace_id = trace_id
+        self.started_at = time.time()
+        self.t0 = time.perf_counter()
+        self.spans: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    def add(self, name: str, start: float, duration: float, attrs: Dict[str, Any], error: Optional[str]) -> None:
+        rec = {
+            "name": name,
+            "start_ms": round((start - self.t0) * 1000, 2),
+            "ms": round(duration * 1000, 2),
+            "thread": threading.current_thread().name,
+        }
+        rec.update(attrs)
+        if error:
+            rec["error"] = error
+        with self._lock:
+            self.spans.append(rec)
+
+CURRENT_TRACE: "contextvars.ContextVar[Optional[Trace]]" = contextvars.ContextVar("juhe_trace", default=None)
+# attrs of the innermost open span, for annotate()
+CURRENT_SPAN: "contextvars.ContextVar[Optional[Dict[str, Any]]]" = contextvars.ContextVar("juhe_span", default=None)
+
+def new_trace_id(incoming: Optional[str]) -> str:
+    """Keep a caller supplied id if it looks sane, else mint one."""
+    if incoming and re.fullmatch(r"[A-Za-z0-9._-]{8,64}", incoming):
+        return incoming
+    return uuid.uuid4().hex[:16]
+
+@contextmanager
+def span(name: str, **attrs: Any):
+    """Time a block into the current request's trace; yields attrs so callers can annotate it."""
+    trace = CURRENT_TRACE.get()
+    if trace is None:
+        yield attrs
+        return
+    start = time.perf_counter()
+    error = None
+    token = CURRENT_SPAN.set(attrs)
+    try:
+        yield attrs
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        CURRENT_SPAN.reset(token)
+        trace.add(name, start, time.perf_counter() - start, attrs, error)
+
+def annotate(**attrs: Any) -> None:
+    """Add attributes to the innermost open span, if any."""
+    current = CURRENT_SPAN.get()
+    if current is not None:
+        current.update(attrs)
+
+def trace_headers() -> Dict[str, str]:
+    """Headers that carry the trace id to our own services (bridge, qishui 8372)."""
+    trace = CURRENT_TRACE.get()
+    return {TRACE_HEADER: trace.trace_id} if trace is not None else {}
+
+def annotate_server_timing(resp: Any) -> None:
+    """Record the time a traced service reports in Server-Timing on the current span."""
+    m = re.search(r"dur=([\d.]+)", resp.headers.get("Server-Timing", "") or "")
+    if m:
+        annotate(remote_ms=float(m.group(1)))
+
+def submit_traced(executor: ThreadPoolExecutor, fn, *args: Any) -> Future:
+    """executor.submit that keeps the caller's trace in the worker thread."""
+    return executor.submit(contextvars.copy_context().run, fn, *args)
+
+class TraceLog:
+    """Rotating JSONL trace log: a summary line per request, spans for slow ones."""
+
+    def __init__(self, path: Path, max_bytes: int, backups: int, slow_ms: float) -> None:
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.slow_ms = slow_ms
+        self._logger: Optional[logging.Logger] = None
+        self._lock = threading.Lock()
+        self.written = 0
+        self.slow = 0
+
+    def _get_logger(self) -> logging.Logger:
+        with self._lock:
+            if self._logger is None:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                handler = logging.handlers.RotatingFileHandler(
+                    str(self.path), maxBytes=self.max_bytes, backupCount=self.backups, encoding="utf-8"
+                )
+                handler.setFormatter(logging.Formatter("%(message)s"))
+                logger = logging.getLogger("juhe.trace")
+                logger.setLevel(logging.INFO)
+                logger.propagate = False
+                logger.addHandler(handler)
+                self._logger = logger
+            return self._logger
+
+    def write(self, trace: Trace, method: str, path: str, code: Any) -> None:
+        duration_ms = (time.perf_counter() - trace.t0) * 1000
+        rec: Dict[str, Any] = {
+            "ts": round(trace.started_at, 3),
+            "trace_id": trace.trace_id,
+            "method": method,
+            "path": path,
+            "code": code,
+            "ms": round(duration_ms, 2),
+            "span_count": len(trace.spans),
+        }
+        slow = duration_ms >= self.slow_ms
+        if slow:
+            rec["slow"] = True
+            with trace._lock:
+                rec["spans"] = sorted(trace.spans, key=lambda sp: sp["start_ms"])
+        try:
+            self._get_logger().info(json.dumps(rec, ensure_ascii=False, separators=(",", ":"), default=str))
+        except Exception as e:
+            print(f"[Trace] write failed: {e}")
+            return
+        self.written += 1
+        self.slow += slow
+
+    def stats(self) -> Dict[str, Any]:
+        return {"path": str(self.path), "written": self.written, "slow": self.slow, "slow_ms": self.slow_ms}
+
+TRACE_LOG = TraceLog(
+    Path(CFG.trace_log) if CFG.trace_log else Path(__file__).resolve().parent / "logs" / "trace.jsonl",
+    CFG.trace_log_max_bytes,
+    CFG.trace_log_backups,
+    CFG.trace_slow_ms,
+)
+
+@contextmanager
+def upstream_call(name: str):
+    """Count and time one upstream call.
+
+    Upstreams: wyy_eapi (url_v1), wyy_api (song detail, search, playlist),
+    wyy_web (public fallback), qq_musicu (u.y.qq.com), qq_bridge, qishui (8372)
+    and short_link.
+    """
+    start = time.perf_counter()
+    outcome = "ok"
+    try:
+        with span(f"upstream.{name}") as attrs:
+            yield attrs
+    except Exception:
+        outcome = "error"
+        raise
+    finally:
+        METRICS.observe("juhe_upstream_duration_seconds", {"upstream": name}, time.perf_counter() - start)
+        METRICS.inc("juhe_upstream_requests_total", {"upstream": name, "outcome": outcome})
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling an upstream whose breaker is open."""
+
+def is_transient_error(e: Optional[BaseException]) -> bool:
+    """Timeouts, refused/reset connections, 5xx and 429.
+
+    Only these are retried and counted by the breakers. music_api re-raises
+    requests errors as APIException, so the implicit exception chain is
+    followed as well.
+    """
+    for _ in range(5):
+        if e is None:
+            return False
+        if isinstance(e, (requests.Timeout, requests.ConnectionError, TimeoutError, ConnectionError)):
+            return True
+        status = getattr(getattr(e, "response", None), "status_code", None) or getattr(e, "status", None)
+        if isinstance(status, int) and (status >= 500 or status == 429):
+            return True
+        e = e.__cause__ or e.__context__
+    return False
+
+class RetryBudget:
+    """Token bucket shared by every upstream.
+
+    Each call deposits `ratio` of a token and each retry spends a whole one, so
+    retries add at most ~ratio extra load when everything is failing at once.
+    """
+
+    def __init__(self, ratio: float, max_tokens: float = 10.0) -> None:
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self.tokens = max_tokens
+        self.spent = 0
+        self.denied = 0
+        self._lock = threading.Lock()
+
+    def deposit(self) -> None:
+        with self._lock:
+            self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        with self._lock:
+            if self.tokens < 1:
+                self.denied += 1
+                return False
+            self.tokens -= 1
+            self.spent += 1
+            return True
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"tokens": round(self.tokens, 2), "spent": self.spent, "denied": self.denied}
+
+RETRY_BUDGET = RetryBudget(CFG.retry_budget_ratio)
+
+class Upstream:
+    """Circuit breaker, jittered retries and adaptive timeout for one upstream.
+
+    closed: calls go through; BREAKER_FAILURES transient failures in a row open it.
+    open: calls fail immediately with CircuitOpenError for BREAKER_RESET seconds.
+    half_open: a single probe call goes through; success closes, failure reopens.
+    Non-transient errors (bad answers, parse errors) neither count as failures
+    nor close the breaker.
+
+    fn(timeout) performs one attempt. The timeout starts at the ceiling and,
+    once MIN_SAMPLES latencies are known, tracks p99 * UPSTREAM_TIMEOUT_MULTIPLIER.
+    Attempts that hit the timeout are kept as samples so a slower upstream
+    pushes the timeout back up instead of failing forever.
+    """
+
+    MIN_SAMPLES = 20
+    WINDOW = 200
+    BACKOFF_BASE = 0.1
+    BACKOFF_CAP = 2.0
+
+    def __init__(self, name: str, ceiling: float, retries: Optional[int] = None) -> None:
+        self.name = name
+        self.ceiling = ceiling
+        self.retries = CFG.upstream_retries if retries is None else retries
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.opens = 0
+        self.rejected = 0
+        self._probing = False
+        self._latencies: deque = deque(maxlen=self.WINDOW)
+        self._timeout = ceiling
+        self._lock = threading.Lock()
+
+    def timeout(self) -> float:
+        with self._lock:
+            return self._timeout
+
+    def _admit(self) -> None:
+        with self._lock:
+            if self.state == "open" and time.monotonic() - self.opened_at >= CFG.breaker_reset:
+                self.state = "half_open"
+                self._probing = False
+            if self.state == "closed" or (self.state == "half_open" and not self._probing):
+                self._probing = self.state == "half_open"
+                return
+            self.rejected += 1
+        METRICS.inc("juhe_upstream_requests_total", {"upstream": self.name, "outcome": "rejected"})
+        raise CircuitOpenError(f"{self.name} unavailable (circuit open)")
+
+    def _record(self, elapsed: Optional[float], outcome: str) -> None:
+        """outcome: "ok", "failed" (transient) or "neutral" (the upstream answered with an error)."""
+        with self._lock:
+            if elapsed is not None:
+                self._latencies.append(elapsed)
+                if len(self._latencies) >= self.MIN_SAMPLES:
+                    ordered = sorted(self._latencies)
+                    p99 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))]
+                    self._timeout = min(self.ceiling, max(CFG.upstream_timeout_min, p99 * CFG.upstream_timeout_multiplier))
+            self._probing = False
+            if outcome == "neutral":
+                # Says nothing about availability: keep the failure count, and
+                # a half-open breaker lets the next call probe again.
+                return
+            if outcome == "ok":
+                self.failures = 0
+                self.state = "closed"
+                return
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= CFG.breaker_failures:
+                if self.state != "open":
+                    self.opens += 1
+                    print(f"[Upstream] {self.name} circuit open after {self.failures} failures")
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+    def _retry_delay(self, e: Exception, elapsed: float, timeout: float, attempt: int, transient) -> Optional[float]:
+        """Record a failed attempt; the backoff before the next one, or None to give up."""
+        bad = transient(e)
+        # Only timeouts say something about latency; refusals and local errors
+        # (e.g. no idle bridge worker) would skew the percentile.
+        self._record(elapsed if bad and elapsed >= timeout * 0.9 else None, "failed" if bad else "neutral")
+        if not bad or attempt >= self.retries or self.state == "open" or not RETRY_BUDGET.withdraw():
+            return None
+        return random.uniform(0, min(self.BACKOFF_CAP, self.BACKOFF_BASE * 2 ** (attempt + 1)))
+
+    def call(self, fn, transient=is_transient_error) -> Any:
+        RETRY_BUDGET.deposit()
+        attempt = 0
+        while True:
+            self._admit()
+            timeout = self.timeout()
+            start = time.perf_counter()
+            try:
+                with upstream_call(self.name):
+                    result = fn(timeout)
+            except Exception as e:
+                delay = self._retry_delay(e, time.perf_counter() - start, timeout, attempt, transient)
+                if delay is None:
+                    raise
+                attempt += 1
+                with span(f"upstream.{self.name}.backoff", attempt=attempt):
+                    time.sleep(delay)
+                continue
+            self._record(time.perf_counter() - start, "ok")
+            return result
+
+    async def call_async(self, fn, transient=is_transient_error) -> Any:
+        """call() for coroutines; fn(timeout) returns an awaitable."""
+        RETRY_BUDGET.deposit()
+        attempt = 0
+        while True:
+            self._admit()
+            timeout = self.timeout()
+            start = time.perf_counter()
+            try:
+                with upstream_call(self.name):
+                    result = await fn(timeout)
+            except Exception as e:
+                delay = self._retry_delay(e, time.perf_counter() - start, timeout, attempt, transient)
+                if delay is None:
+                    raise
+                attempt += 1
+                with span(f"upstream.{self.name}.backoff", attempt=attempt):
+                    await asyncio.sleep(delay)
+                continue
+            self._record(time.perf_counter() - start, "ok")
+            return result
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "state": self.state,
+                "timeout": round(self._timeout, 3),
+                "failures": self.failures,
+                "opens": self.opens,
+                "rejected": self.rejected,
+                "samples": len(self._latencies),
+            }
+
+# Ceilings are the fixed timeouts these calls used before.
+UPSTREAMS = {
+    "wyy_eapi": Upstream("wyy_eapi", 30),
+    "wyy_api": Upstream("wyy_api", 30),
+    "wyy_web": Upstream("wyy_web", 10),
+    "qq_musicu": Upstream("qq_musicu", 30),
+    "qq_bridge": Upstream("qq_bridge", 30),
+    "qishui": Upstream("qishui", 15),
+    "short_link": Upstream("short_link", 10),
+}
+
+class ExpiringLRUCache:
+    """Thread-safe LRU cache whose entries carry their own TTL."""
+
+    def __init__(self, max_size: int) -> None:
+        self.max_size = max(1, max_size)
+        self._data: "OrderedDict[Any, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: Any, record: bool = True) -> Any:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += record
+                return None
+            expires_at, value = entry
+            if expires_at <= now:
+                del self._data[key]
+                self.expirations += 1
+                self.misses += record
+                return None
+            self._data.move_to_end(key)
+            self.hits += record
+            return value
+
+    def set(self, key: Any, value: Any, ttl: float) -> None:
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def record(self, hit: bool) -> None:
+        """Count a lookup whose outcome the caller decided after get(record=False)."""
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+class SharedCache:
+    """Second cache tier and single-flight leases shared by worker processes.
+
+    serve_prod.py forks several server.py workers; each keeps its own
+    ExpiringLRUCache in front of this SQLite (WAL) file so an entry fetched by
+    one worker serves the others. A lease marks a key as being computed: the
+    other workers wait for its result instead of calling the upstream too.
+    Leases expire on their own, so a worker that dies mid-call only delays the
+    next one by SHARED_LEASE_TTL.
+    """
+
+    PURGE_INTERVAL = 60.0
+    POLL_INTERVAL = 0.05
+
+    def __init__(self, db_path: Path, max_size: int, lease_ttl: float) -> None:
+        self.db_path = db_path
+        self.max_size = max(1, max_size)
+        self.lease_ttl = lease_ttl
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._db: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._last_purge = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self.evictions = 0
+        self.leases = 0
+        self.lease_waits = 0
+
+    def _conn(self) -> sqlite3.Connection:
+        if self._db is None:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            db = sqlite3.connect(str(self.db_path), timeout=10, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS leases ("
+                "key TEXT PRIMARY KEY, owner TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            db.commit()
+            self._db = db
+        return self._db
+
+    @staticmethod
+    def key(namespace: str, key: Any) -> str:
+        return json.dumps([namespace, key], ensure_ascii=False, separators=(",", ":"))
+
+    def get(self, namespace: str, key: Any, record: bool = True) -> Optional[Tuple[Any, float]]:
+        """(value, remaining ttl) or None."""
+        now = time.time()
+        with self._lock:
+            row = self._conn().execute(
+                "SELECT value, expires_at FROM entries WHERE key = ?", (self.key(namespace, key),)
+            ).fetchone()
+            if row is None or row[1] <= now:
+                self.misses += record
+                self.expirations += record and row is not None
+                return None
+            self.hits += record
+        return json.loads(row[0]), row[1] - now
+
+    def set(self, namespace: str, key: Any, value: Any, ttl: float) -> None:
+        if ttl <= 0:
+            return
+        now = time.time()
+        data = json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+        with self._lock:
+            db = self._conn()
+            db.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?)", (self.key(namespace, key), data, now + ttl))
+            if now - self._last_purge >= self.PURGE_INTERVAL:
+                self._last_purge = now
+                self._purge(db, now)
+            db.commit()
+
+    def _purge(self, db: sqlite3.Connection, now: float) -> None:
+        db.execute("DELETE FROM entries WHERE expires_at <= ?", (now,))
+        db.execute("DELETE FROM leases WHERE expires_at <= ?", (now,))
+        # Over the cap: drop the entries closest to expiring.
+        cur = db.execute(
+            "DELETE FROM entries WHERE key IN ("
+            "SELECT key FROM entries ORDER BY expires_at LIMIT max(0, (SELECT COUNT(*) FROM entries) - ?))",
+            (self.max_size,),
+        )
+        self.evictions += max(0, cur.rowcount)
+
+    def _try_lease(self, k: str) -> bool:
+        now = time.time()
+        with self._lock:
+            db = self._conn()
+            cur = db.execute(
+                "INSERT INTO leases VALUES (?, ?, ?) ON CONFLICT(key) DO UPDATE SET "
+                "owner = excluded.owner, expires_at = excluded.expires_at WHERE leases.expires_at <= ?",
+                (k, self.owner, now + self.lease_ttl, now),
+            )
+            db.commit()
+            return cur.rowcount == 1
+
+    def _release(self, k: str) -> None:
+        with self._lock:
+            db = self._conn()
+            db.execute("DELETE FROM leases WHERE key = ? AND owner = ?", (k, self.owner))
+            db.commit()
+
+    def do(self, namespace: str, key: Any, fn, ttl_of) -> Tuple[Any, float]:
+        """Cached value for key, computing it with fn() in at most one process.
+
+        Returns (value, ttl); ttl_of(value) decides how long a fresh value is
+        shared.
+        """
+        hit = self.get(namespace, key)
+        if hit is not None:
+            return hit
+        k = self.key(namespace, key)
+        leased = self._try_lease(k)
+        if not leased:
+            with self._lock:
+                self.lease_waits += 1
+            deadline = time.monotonic() + self.lease_ttl
+            with span("shared_cache.wait"):
+                while not leased and time.monotonic() < deadline:
+                    time.sleep(self.POLL_INTERVAL)
+                    hit = self.get(namespace, key, record=False)
+                    if hit is not None:
+                        return hit
+                    leased = self._try_lease(k)
+            # The previous holder may have stored it just before releasing.
+            hit = self.get(namespace, key, record=False) if leased else None
+            if hit is not None:
+                self._release(k)
+                return hit
+        if not leased:
+            # Holder is stuck past the lease lifetime: compute without it.
+            value = fn()
+            return value, ttl_of(value)
+        with self._lock:
+            self.leases += 1
+        try:
+            value = fn()
+            ttl = ttl_of(value)
+            self.set(namespace, key, value, ttl)
+            return value, ttl
+        finally:
+            self._release(k)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            size = self._conn().execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+            lookups = self.hits + self.misses
+            return {
+                "size": size,
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "leases": self.leases,
+                "lease_waits": self.lease_waits,
+            }
+
+CST = timezone(timedelta(hours=8))
+# Netease CDN: http://m701.music.126.net/20240101123456/<sign>/... (expiry in Beijing time)
+WYY_URL_EXPIRY_RE = re.compile(r"^/(\d{14})/")
+URL_EXPIRY_PARAMS = ("x-expires", "expires", "x-oss-expires")
+
+def url_expiry(url: str) -> Optional[float]:
+    """Return the unix timestamp a signed CDN url stops working, if it says so."""
+    try:
+        parts = urlsplit(url)
+    except ValueError:
+        return None
+    m = WYY_URL_EXPIRY_RE.match(parts.path)
+    if m:
+        try:
+            return datetime.strptime(m.group(1), "%Y%m%d%H%M%S").replace(tzinfo=CST).timestamp()
+        except ValueError:
+            pass
+    for k, v in parse_qsl(parts.query):
+        if k.lower() in URL_EXPIRY_PARAMS and v.isdigit():
+            return float(v)
+    return None
+
+def parse_result_ttl(result: Dict[str, Any]) -> float:
+    """Cache lifetime for a /parse result: until its earliest signed url expires."""
+    urls = [str((result.get("best") or {}).get("url") or "")]
+    for item in (result.get("qualities") or {}).values():
+        if isinstance(item, dict):
+            urls.append(str(item.get("url") or ""))
+    expiries = [e for e in (url_expiry(u) for u in urls if u) if e is not None]
+    if not expiries:
+        return CFG.parse_cache_default_ttl
+    ttl = min(expiries) - time.time() - CFG.parse_cache_margin
+    return max(0.0, min(ttl, CFG.parse_cache_max_ttl))
+
+PARSE_CACHE = ExpiringLRUCache(CFG.parse_cache_size)
+SHARED_CACHE = SharedCache(Path(CFG.shared_cache_db), CFG.shared_cache_size, CFG.shared_lease_ttl) if CFG.shared_cache_db else None
+
+class UpstreamSessions:
+    """One pooled keep-alive requests.Session per upstream.
+
+    Upstreams: qq_music (u.y.qq.com), wyy_web (music.163.com), qq_bridge
+    (Node bridges), qishui (local 8372 service) and short_link (share-link
+    redirects). Sessions never store response cookies, so per-request cookies
+    from different accounts cannot leak into each other.
+    """
+
+    def __init__(self, default_size: int, sizes: str) -> None:
+        self.default_size = max(1, default_size)
+        self.sizes: Dict[str, int] = {}
+        for part in sizes.split(","):
+            if "=" in part:
+                name, size = part.split("=", 1)
+                self.sizes[name.strip()] = max(1, int(size))
+        self._sessions: Dict[str, requests.Session] = {}
+        self._lock = threading.Lock()
+
+    def get(self, name: str) -> requests.Session:
+        s = self._sessions.get(name)
+        if s is not None:
+            return s
+        with self._lock:
+            s = self._sessions.get(name)
+            if s is None:
+                s = requests.Session()
+                s.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+                adapter = HTTPAdapter(pool_connections=10, pool_maxsize=self.sizes.get(name, self.default_size))
+                s.mount("http://", adapter)
+                s.mount("https://", adapter)
+                self._sessions[name] = s
+            return s
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        out: Dict[str, Dict[str, int]] = {}
+        with self._lock:
+            sessions = list(self._sessions.items())
+        for name, s in sessions:
+            adapter = s.get_adapter("https://")
+            pools = adapter.poolmanager.pools
+            connections = requests_made = 0
+            for key in list(pools.keys()):
+                pool = pools.get(key)
+                if pool is None:
+                    continue
+                connections += pool.num_connections
+                requests_made += pool.num_requests
+            out[name] = {
+                "pool_size": self.sizes.get(name, self.default_size),
+                "connections": connections,
+                "requests": requests_made,
+                "reused": max(0, requests_made - connections),
+            }
+        return out
+
+HTTP = UpstreamSessions(CFG.http_pool_size, CFG.http_pool_sizes)
+
+class SingleFlight:
+    """Collapse concurrent calls with the same key into one execution.
+
+    The first caller (leader) runs the function; callers arriving while it is
+    in flight wait on the leader's future and get the same result or error.
+    """
+
+    def __init__(self, name: str = "flight") -> None:
+        self.name = name
+        self._inflight: Dict[Any, Future] = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.followers = 0
+
+    def do(self, key: Any, fn, *args, **kwargs) -> Any:
+        with self._lock:
+            fut = self._inflight.get(key)
+            if fut is not None:
+                self.followers += 1
+                leader = False
+            else:
+                fut = Future()
+                self._inflight[key] = fut
+                self.leaders += 1
+                leader = True
+        if not leader:
+            with span(f"{self.name}.wait"):
+                return fut.result()
+
+        try:
+            fut.set_result(fn(*args, **kwargs))
+        except BaseException as e:
+            fut.set_exception(e)
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+        return fut.result()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "inflight": len(self._inflight),
+                "leaders": self.leaders,
+                "followers": self.followers,
+            }
+
+PARSE_FLIGHT = SingleFlight("parse_flight")
+
 def detect_platform(url: str) -> str:
     u = url.lower()
     if "music.163.com" in u or "163cn.tv" in u:
         return "wyy"
     if "y.qq.com" in u:
         return "qq"
-    if "qishui.douyin.com" in u or "music.douyin.com/qishui" in u or "track_id=" in u:
+    if "qishui.douyin.com" in u or "music.douyin.com/qishui" in u or "v.douyin.com" in u or "track_id=" in u:
         return "qishui"
     raise ValueError("Unsupported url")
 
@@ -99,24 +1190,301 @@ def extract_qq_songmid(url: str) -> str:
         return m.group(1)
     raise ValueError("Cannot extract QQ song mid")
 
-import threading
+SHORT_LINK_RE = re.compile(r"https?://(?:163cn\.tv|qishui\.douyin\.com/s|v\.douyin\.com)/[^\s\"'<>]+", re.I)
 
-QQ_LOCK = threading.Lock()
+class ShortLinkResolver:
+    """Short share link -> canonical url, persisted in SQLite.
 
-def run_node_qq_parse(url: str) -> Dict[str, Any]:
-    target = "http://127.0.0.1:8003/"
-    payload = {
-        "url": url,
-        "cookie": QQ_COOKIE_STR
-    }
+    Short links never change target, so each one is resolved once: redirects
+    are followed hop by hop from the Location header (bodies are never read)
+    until the url is no longer a short link. Concurrent resolutions of the
+    same link share one upstream walk.
+    """
+
+    MAX_HOPS = 5
+    REDIRECT_CODES = (301, 302, 303, 307, 308)
+
+    def __init__(self, db_path: Path) -> None:
+        self.db_path = db_path
+        self._db: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._flight = SingleFlight("short_link_flight")
+        self.hits = 0
+        self.resolved = 0
+        self.failures = 0
+
+    def _conn(self) -> sqlite3.Connection:
+        if self._db is None:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            db = sqlite3.connect(str(self.db_path), check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS short_links ("
+                "short TEXT PRIMARY KEY, target TEXT NOT NULL, resolved_at REAL NOT NULL)"
+            )
+            db.commit()
+            self._db = db
+        return self._db
+
+    def lookup(self, short: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn().execute("SELECT target FROM short_links WHERE short = ?", (short,)).fetchone()
+        return row[0] if row else None
+
+    def _store(self, short: str, target: str) -> None:
+        with self._lock:
+            db = self._conn()
+            db.execute("INSERT OR REPLACE INTO short_links VALUES (?, ?, ?)", (short, target, time.time()))
+            db.commit()
+
+    def _walk(self, short: str) -> str:
+        url = short
+        for _ in range(self.MAX_HOPS):
+            def hop(timeout: float) -> requests.Response:
+                r = HTTP.get("short_link").get(url, allow_redirects=False, stream=True, timeout=timeout)
+                r.close()
+                return r
+            r = UPSTREAMS["short_link"].call(hop)
+            location = r.headers.get("Location")
+            if r.status_code not in self.REDIRECT_CODES or not location:
+                break
+            url = urljoin(url, location)
+            if not SHORT_LINK_RE.match(url):
+                self._store(short, url)
+                with self._lock:
+                    self.resolved += 1
+                return url
+        raise RuntimeError(f"short link did not redirect to a song url: {short}")
+
+    def resolve(self, text: str) -> str:
+        """Canonical url for the first short link in text; other text is returned as is."""
+        m = SHORT_LINK_RE.search(text)
+        if not m:
+            return text
+        short = m.group(0)
+        with span("short_link.resolve") as attrs:
+            target = self.lookup(short)
+            attrs["cached"] = target is not None
+            if target is not None:
+                with self._lock:
+                    self.hits += 1
+                return target
+            try:
+                return self._flight.do(short, self._walk, short)
+            except Exception:
+                with self._lock:
+                    self.failures += 1
+                raise
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            size = self._conn().execute("SELECT COUNT(*) FROM short_links").fetchone()[0]
+            return {
+                "size": size,
+                "hits": self.hits,
+                "resolved": self.resolved,
+                "failures": self.failures,
+                "flight": self._flight.stats(),
+            }
+
+SHORT_LINKS = ShortLinkResolver(
+    Path(CFG.short_link_db) if CFG.short_link_db else Path(__file__).resolve().parent / "cache" / "short_links.sqlite3"
+)
+
+def resolve_short_link(url: str) -> str:
+    """url with a share short link replaced by its target; unchanged when it cannot be resolved."""
+    if not SHORT_LINK_RE.search(url):
+        return url
     try:
-        # Enforce sequential access to the Node bridge to prevent library state pollution
-        with QQ_LOCK:
-            resp = requests.post(target, json=payload, timeout=30)
-        resp.raise_for_status()
-        return resp.json()
-    except requests.RequestException as e:
-        raise RuntimeError(f"QQ Bridge Server Error: {e}")
+        resolved = SHORT_LINKS.resolve(url)
+        print(f"[Short Link] {url} -> {resolved}")
+        return resolved
+    except Exception as e:
+        print(f"[Short Link] Resolve failed for {url}: {e}")
+        return url
+
+class QQBridgeWorker:
+    def __init__(self, port: int) -> None:
+        self.port = port
+        self.url = f"http://127.0.0.1:{port}/"
+        self.proc: Optional[subprocess.Popen] = None
+        self.busy = False
+        self.healthy = True
+        self.failed_checks = 0
+        self.last_used = 0.0
+        self.restarts = 0
+        self.served = 0
+
+class QQBridgePool:
+    """Pool of isolated qq_bridge_server.js processes.
+
+    The QQ library keeps per-process state, so every worker handles a single
+    parse at a time; concurrency comes from running several of them. Requests
+    go to the least recently used idle worker. A background thread pings each
+    worker and restarts the ones server.py spawned when they die or hang.
+    """
+
+    FAILED_CHECKS_BEFORE_RESTART = 3
+
+    def __init__(self, ports: List[int], spawn: bool) -> None:
+        self.workers = [QQBridgeWorker(p) for p in ports]
+        self.spawn = spawn
+        if spawn:
+            # Spawned workers join the rotation once their first health check passes.
+            for w in self.workers:
+                w.healthy = False
+        self.script = Path(__file__).resolve().parent / "qq_bridge_server.js"
+        self._cond = threading.Condition()
+        self._started = False
+
+    def ensure_started(self) -> None:
+        with self._cond:
+            if self._started:
+                return
+            self._started = True
+        if self.spawn:
+            for w in self.workers:
+                self._launch(w)
+            atexit.register(self.shutdown)
+        threading.Thread(target=self._health_loop, name="qq-bridge-health", daemon=True).start()
+
+    def _launch(self, w: QQBridgeWorker) -> None:
+        env = os.environ.copy()
+        env["QQ_BRIDGE_PORT"] = str(w.port)
+        w.proc = subprocess.Popen([CFG.node_bin, str(self.script)], cwd=str(self.script.parent), env=env)
+        w.failed_checks = 0
+        print(f"[QQ Bridge] Started worker pid={w.proc.pid} port={w.port}")
+
+    def _restart(self, w: QQBridgeWorker) -> None:
+        if w.proc is not None and w.proc.poll() is None:
+            w.proc.kill()
+            try:
+                w.proc.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                pass
+        w.restarts += 1
+        self._launch(w)
+
+    def _ping(self, w: QQBridgeWorker) -> bool:
+        # Any HTTP answer means the event loop is alive; older bridges reply 405 to GET.
+        try:
+            HTTP.get("qq_bridge").get(w.url + "health", timeout=2)
+            return True
+        except requests.RequestException:
+            return False
+
+    def _health_loop(self) -> None:
+        while True:
+            for w in self.workers:
+                self.check(w)
+            # Poll quickly while a worker is starting or down so it rejoins soon.
+            recovering = any(not w.healthy for w in self.workers)
+            time.sleep(min(0.5, CFG.qq_bridge_health_interval) if recovering else CFG.qq_bridge_health_interval)
+
+    def check(self, w: QQBridgeWorker) -> None:
+        dead = self.spawn and (w.proc is None or w.proc.poll() is not None)
+        ok = not dead and self._ping(w)
+        with self._cond:
+            w.failed_checks = 0 if ok else w.failed_checks + 1
+            was_healthy, w.healthy = w.healthy, ok
+            if ok and not was_healthy:
+                self._cond.notify_all()
+        if ok != was_healthy:
+            print(f"[QQ Bridge] Worker port={w.port} {'up' if ok else 'down'}")
+        if self.spawn and (dead or w.failed_checks >= self.FAILED_CHECKS_BEFORE_RESTART):
+            self._restart(w)
+
+    def _take_idle(self) -> Optional[QQBridgeWorker]:
+        idle = [w for w in self.workers if w.healthy and not w.busy]
+        if not idle:
+            return None
+        w = min(idle, key=lambda x: x.last_used)
+        w.busy = True
+        return w
+
+    def try_acquire(self) -> Optional[QQBridgeWorker]:
+        """Non-blocking acquire for callers that must not block (server_async)."""
+        self.ensure_started()
+        with self._cond:
+            return self._take_idle()
+
+    def acquire(self, timeout: float) -> QQBridgeWorker:
+        self.ensure_started()
+        start = time.monotonic()
+        deadline = start + timeout
+        with span("qq_bridge.acquire") as attrs, self._cond:
+            while True:
+                w = self._take_idle()
+                if w is not None:
+                    METRICS.observe("juhe_qq_bridge_wait_seconds", {}, time.monotonic() - start)
+                    attrs["port"] = w.port
+                    return w
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise RuntimeError("QQ Bridge Server Error: no idle bridge worker")
+                self._cond.wait(remaining)
+
+    def release(self, w: QQBridgeWorker, broken: bool = False) -> None:
+        with self._cond:
+            w.busy = False
+            w.last_used = time.monotonic()
+            w.served += 1
+            if broken:
+                # Keep it out of rotation until the health loop sees it again.
+                w.healthy = False
+            self._cond.notify()
+
+    def call(self, payload: Dict[str, Any], timeout: float = 30) -> Dict[str, Any]:
+        w = self.acquire(CFG.qq_bridge_acquire_timeout)
+        broken = False
+        try:
+            resp = HTTP.get("qq_bridge").post(w.url, json=payload, headers=trace_headers(), timeout=timeout)
+            annotate(port=w.port)
+            annotate_server_timing(resp)
+            resp.raise_for_status()
+            return resp.json()
+        except (requests.ConnectionError, requests.Timeout):
+            broken = True
+            raise
+        finally:
+            self.release(w, broken)
+
+    def shutdown(self) -> None:
+        for w in self.workers:
+            if w.proc is not None and w.proc.poll() is None:
+                w.proc.terminate()
+
+    def stats(self) -> List[Dict[str, Any]]:
+        with self._cond:
+            return [
+                {
+                    "port": w.port,
+                    "pid": w.proc.pid if w.proc is not None else None,
+                    "healthy": w.healthy,
+                    "busy": w.busy,
+                    "served": w.served,
+                    "restarts": w.restarts,
+                }
+                for w in self.workers
+            ]
+
+def qq_bridge_ports() -> List[int]:
+    if CFG.qq_bridge_spawn:
+        return [CFG.qq_bridge_base_port + i for i in range(max(1, CFG.qq_bridge_workers))]
+    return [int(p) for p in CFG.qq_bridge_ports.split(",") if p.strip()]
+
+QQ_BRIDGE_POOL = QQBridgePool(qq_bridge_ports(), CFG.qq_bridge_spawn)
+
+def run_node_qq_parse(url: str) -> Dict[str, Any]:
+    with QQ_COOKIES.lease() as acct:
+        payload = {
+            "url": url,
+            "cookie": acct.cookie_str
+        }
+        try:
+            return UPSTREAMS["qq_bridge"].call(lambda timeout: QQ_BRIDGE_POOL.call(payload, timeout=timeout))
+        except requests.RequestException as e:
+            raise RuntimeError(f"QQ Bridge Server Error: {e}")
 # -----------------------------
 
 def run_php_qishui_parse(url: str) -> Dict[str, Any]:
@@ -146,67 +1514,87 @@ def run_php_qishui_parse(url: str) -> Dict[str, Any]:
     except Exception as e:
         raise RuntimeError(f"Qishui parse JSON decode failed: {e}")
 
-def wyy_parse(url: str, quality: str) -> Dict[str, Any]:
-    netease_dir = Path(__file__).resolve().parent / "网易云解析" / "Netease_url-main"
-    if not netease_dir.is_dir():
-        raise RuntimeError("Missing Netease_url-main")
-    sys.path.insert(0, str(netease_dir))
-    from music_api import url_v1  # type: ignore
-    from concurrent.futures import ThreadPoolExecutor, as_completed
+NETEASE_DIR = Path(__file__).resolve().parent / "网易云解析" / "Netease_url-main"
 
-    song_id = int(extract_wyy_song_id(url))
-    print(f"[WYY Parse] ID: {song_id}, Cookie len: {len(WYY_COOKIE_KV)}")
+# Full list of supported Netease qualities, best first
+WYY_PRIORITY = ["jymaster", "jyeffect", "sky", "hires", "lossless", "exhigh", "standard"]
 
-    # Full list of supported qualities
-    priority = ["jymaster", "jyeffect", "sky", "hires", "lossless", "exhigh", "standard"]
-    
-    qualities: Dict[str, Dict[str, Any]] = {}
+def wyy_quality_item(q: str, resp: Any) -> Optional[Dict[str, Any]]:
+    """Pick the playable entry out of one url_v1 response."""
+    if isinstance(resp, dict):
+        data = resp.get("data")
+        if isinstance(data, list) and data:
+            item = data[0]
+            if isinstance(item, dict):
+                u = str(item.get("url") or "")
+                br = item.get("br")
+                size = item.get("size")
+                print(f"  -> Q: {q}, URL: {'YES' if u else 'NO'}, BR: {br}, Size: {size}")
+                if u:
+                    return {
+                        "url": u,
+                        "level": str(item.get("level") or q),
+                        "type": item.get("type"),
+                        "br": br,
+                        "size": size,
+                    }
+    return None
 
-    # Helper function for threaded execution
-    def fetch_quality(q):
-        try:
-            resp = url_v1(song_id, q, WYY_COOKIE_KV)
-            if isinstance(resp, dict):
-                data = resp.get("data")
-                if isinstance(data, list) and data:
-                    item = data[0]
-                    if isinstance(item, dict):
-                        u = str(item.get("url") or "")
-                        br = item.get("br")
-                        size = item.get("size")
-                        print(f"  -> Q: {q}, URL: {'YES' if u else 'NO'}, BR: {br}, Size: {size}")
-                        if u:
-                            return q, {
-                                "url": u,
-                                "level": str(item.get("level") or q),
-                                "type": item.get("type"),
-                                "br": br,
-                                "size": size,
-                            }
-        except Exception as e:
-            print(f"  -> Q: {q} Error: {e}")
-            pass
-        return q, None
+# Netease levels from lowest to highest, as used by privilege plLevel/maxBrLevel
+WYY_LEVEL_RANK = {
+    "standard": 0, "higher": 1, "exhigh": 2, "lossless": 3, "hires": 4,
+    "jyeffect": 5, "sky": 6, "dolby": 7, "jymaster": 8,
+}
 
-    # Fetch all qualities in parallel to populate the selector
-    with ThreadPoolExecutor(max_workers=7) as executor:
-        future_to_quality = {executor.submit(fetch_quality, q): q for q in priority}
-        for future in as_completed(future_to_quality):
-            q, result = future.result()
-            if result:
-                qualities[q] = result
+def wyy_probe_levels(song_id: int, detail: Any) -> Optional[List[str]]:
+    """Levels worth requesting for a song, from its song-detail privilege.
 
-    if not qualities:
-        # Try one last ditch effort with standard quality and NO cookie (sometimes helps with IP restrictions?)
-        # Or maybe the song requires VIP and we don't have it.
-        print("[WYY Parse] All qualities failed. Trying standard without cookie...")
-        try:
-            _, res = fetch_quality("standard") # Retry standard
-            if res:
-                qualities["standard"] = res
-        except:
-            pass
+    plLevel is the best level the current account may play, maxBrLevel the best
+    the song exists in. Returns None when either is missing or unknown, in which
+    case the caller falls back to requesting every level.
+    """
+    if not isinstance(detail, dict):
+        return None
+    privileges = [p for p in detail.get("privileges") or [] if isinstance(p, dict)]
+    priv = next((p for p in privileges if str(p.get("id")) == str(song_id)), None)
+    if priv is None:
+        return None
+    if priv.get("plLevel") == "none":
+        # Not playable for this account; standard may still return a trial clip.
+        return ["standard"]
+    play_rank = WYY_LEVEL_RANK.get(str(priv.get("plLevel") or ""))
+    song_rank = WYY_LEVEL_RANK.get(str(priv.get("maxBrLevel") or ""))
+    if play_rank is None or song_rank is None:
+        return None
+    cap = min(play_rank, song_rank)
+    return [q for q in WYY_PRIORITY if WYY_LEVEL_RANK[q] <= cap]
+
+# Probed levels per (song, account)
+WYY_PRIVILEGES = ExpiringLRUCache(CFG.wyy_privilege_cache_size)
+WYY_LIKELY_LEVELS = [q for q in WYY_PRIORITY if q in CFG.wyy_likely_levels.split(",")]
+
+def wyy_first_levels(song_id: int, acct: CookieAccount) -> Tuple[List[str], bool]:
+    """Levels to request right away, and whether the privilege probe still has to run.
+
+    With the song's levels cached only those are requested. Otherwise standard
+    and WYY_LIKELY_LEVELS go out together with the probe, and the probe adds
+    whatever else the song has, so a miss costs no extra serial round trip.
+    """
+    if not CFG.wyy_probe_privileges:
+        return list(WYY_PRIORITY), False
+    known = WYY_PRIVILEGES.get((song_id, acct.path.name))
+    if known is not None:
+        return list(known), False
+    return ["standard"] + [q for q in WYY_LIKELY_LEVELS if q != "standard"], True
+
+def wyy_learn_levels(song_id: int, acct: CookieAccount, detail: Any) -> Optional[List[str]]:
+    """wyy_probe_levels, remembered for later parses of the same song and account."""
+    levels = wyy_probe_levels(song_id, detail)
+    if levels is not None:
+        WYY_PRIVILEGES.set((song_id, acct.path.name), levels, CFG.wyy_privilege_ttl)
+    return levels
 
+def wyy_build_result(song_id: int, quality: str, qualities: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
     if not qualities:
         raise RuntimeError("WYY parse failed: no playable url")
 
@@ -217,7 +1605,7 @@ def wyy_parse(url: str, quality: str) -> Dict[str, Any]:
     if quality and quality in qualities:
         best_q = quality
     else:
-        for q in priority:
+        for q in WYY_PRIORITY:
             if q in qualities:
                 best_q = q
                 break
@@ -233,7 +1621,7 @@ def wyy_parse(url: str, quality: str) -> Dict[str, Any]:
     final_qualities = {}
     seen_sizes = {}
     # Iterate in priority order to keep the best name
-    for q in priority:
+    for q in WYY_PRIORITY:
         if q in qualities:
             sz = qualities[q].get("size")
             if sz and sz > 0:
@@ -257,8 +1645,77 @@ def wyy_parse(url: str, quality: str) -> Dict[str, Any]:
         "qualities": final_qualities,
     }
 
-def qq_parse(url: str, quality: str) -> Dict[str, Any]:
-    data = run_node_qq_parse(url)
+# Shared by every parse instead of a fresh 7-thread pool per request
+WYY_FANOUT = ThreadPoolExecutor(max_workers=max(1, CFG.wyy_fanout_workers), thread_name_prefix="wyy-fanout")
+
+def wyy_fetch_qualities(song_id: int, acct: CookieAccount) -> Dict[str, Dict[str, Any]]:
+    from music_api import url_v1, name_v1  # type: ignore
+
+    qualities: Dict[str, Dict[str, Any]] = {}
+    rejected: List[CircuitOpenError] = []
+
+    # Helper function for threaded execution
+    def fetch_quality(q):
+        try:
+            resp = UPSTREAMS["wyy_eapi"].call(lambda timeout: url_v1(song_id, q, acct.kv, timeout))
+            return q, wyy_quality_item(q, resp)
+        except CircuitOpenError as e:
+            rejected.append(e)
+        except Exception as e:
+            print(f"  -> Q: {q} Error: {e}")
+            WYY_COOKIES.report(acct, e)
+        return q, None
+
+    def fetch_levels():
+        try:
+            detail = UPSTREAMS["wyy_api"].call(lambda timeout: name_v1(song_id, acct.kv, timeout))
+            return wyy_learn_levels(song_id, acct, detail)
+        except Exception as e:
+            print(f"  -> Privilege probe error: {e}")
+            WYY_COOKIES.report(acct, e)
+            return None
+
+    # Fetch the qualities in parallel to populate the selector. The first
+    # levels run while song detail tells us what else to ask for.
+    first, probe = wyy_first_levels(song_id, acct)
+    future_to_quality = {submit_traced(WYY_FANOUT, fetch_quality, q): q for q in first}
+    if probe:
+        levels = fetch_levels()
+        if levels is None:
+            levels = WYY_PRIORITY
+        else:
+            print(f"[WYY Parse] Probing levels: {levels}")
+        for q in levels:
+            if q not in first:
+                future_to_quality[submit_traced(WYY_FANOUT, fetch_quality, q)] = q
+    for future in as_completed(future_to_quality):
+        q, result = future.result()
+        if result:
+            qualities[q] = result
+
+    # Transient failures were already retried by UPSTREAMS["wyy_eapi"]
+    if not qualities and rejected:
+        raise rejected[0]
+
+    return qualities
+
+def wyy_parse(url: str, quality: str) -> Dict[str, Any]:
+    if not NETEASE_DIR.is_dir():
+        raise RuntimeError("Missing Netease_url-main")
+    sys.path.insert(0, str(NETEASE_DIR))
+
+    song_id = int(extract_wyy_song_id(resolve_short_link(url)))
+    with WYY_COOKIES.lease() as acct:
+        print(f"[WYY Parse] ID: {song_id}, Cookie: {acct.path.name} ({len(acct.kv)} keys)")
+        qualities = wyy_fetch_qualities(song_id, acct)
+
+    return wyy_build_result(song_id, quality, qualities)
+
+# Best first
+QQ_PRIORITY = ["atmos_51", "atmos_2", "master", "flac", "320", "ogg_320", "aac_192", "ogg_192", "128", "aac_96"]
+
+def qq_build_result(url: str, quality: str, data: Dict[str, Any]) -> Dict[str, Any]:
+    """Normalize a qq_bridge_server.js response."""
     music_info = data.get("music_info") or {}
     music_url = data.get("music_url") or {}
     if not isinstance(music_url, dict):
@@ -272,13 +1729,12 @@ def qq_parse(url: str, quality: str) -> Dict[str, Any]:
                 "bitrate": item.get("bitrate"),
             }
 
-    priority = ["atmos_51", "atmos_2", "master", "flac", "320", "ogg_320", "aac_192", "ogg_192", "128", "aac_96"]
     best = {}
 
     if quality and quality in normalized_qualities:
         best = {"quality": quality, "url": normalized_qualities[quality]["url"]}
     else:
-        for q in priority:
+        for q in QQ_PRIORITY:
             if q in normalized_qualities:
                 best = {"quality": q, "url": normalized_qualities[q]["url"]}
                 break
@@ -297,17 +1753,10 @@ def qq_parse(url: str, quality: str) -> Dict[str, Any]:
         "qualities": normalized_qualities,
     }
 
-def qishui_parse(url: str) -> Dict[str, Any]:
-    # Handle short links by resolving them first
-    if "qishui.douyin.com/s/" in url or "v.douyin.com" in url:
-        try:
-            print(f"[Qishui] Resolving short link: {url}")
-            r = requests.get(url, allow_redirects=True, timeout=10)
-            url = r.url
-            print(f"[Qishui] Resolved to: {url}")
-        except Exception as e:
-            print(f"[Qishui] Resolve failed: {e}")
+def qq_parse(url: str, quality: str) -> Dict[str, Any]:
+    return qq_build_result(url, quality, run_node_qq_parse(url))
 
+def qishui_track_id(url: str) -> str:
     # Extract ID from URL like https://...track_id=123... or just raw ID
     track_id = ""
     m = re.search(r"track_id=(\d+)", url)
@@ -318,79 +1767,96 @@ def qishui_parse(url: str) -> Dict[str, Any]:
     
     if not track_id:
         raise ValueError(f"Invalid Qishui URL/ID: {url}")
+    return track_id
 
-    print(f"[Qishui Parse] ID: {track_id}")
+def qishui_build_result(track_id: str, res: Dict[str, Any]) -> Dict[str, Any]:
+    """Normalize a qishui_api.py /track response."""
+    # Transform results
+    # Qishui API returns: { "audio_urls": { "Standard": { "play_url": "..." }, "lossless": { "play_url": "..." } } }
+    audio_urls = res.get("audio_urls", {})
     
-    # Call the local Qishui API service (Port 8372)
-    api_url = f"http://127.0.0.1:8372/track?id={track_id}"
-    try:
-        resp = requests.get(api_url, timeout=15)
-        resp.raise_for_status()
-        res = resp.json()
-        
-        # Transform results
-        # Qishui API returns: { "audio_urls": { "Standard": { "play_url": "..." }, "lossless": { "play_url": "..." } } }
-        audio_urls = res.get("audio_urls", {})
+    # Map Qishui quality names to internal standard labels
+    quality_map = {
+        "spatial": "sky",
+        "lossless": "lossless",
+        "highest": "exhigh",
+        "higher": "standard"
+    }
+    
+    qualities = {}
+    main_spade_a = ""
+    for q_key, q_data in audio_urls.items():
+        # Use raw_url because we decrypt on device
+        u = q_data.get("raw_url") or q_data.get("play_url")
+        sa = q_data.get("spade_a", "")
         
-        # Map Qishui quality names to internal standard labels
-        quality_map = {
-            "spatial": "sky",
-            "lossless": "lossless",
-            "highest": "exhigh",
-            "higher": "standard"
-        }
+        # Use our mapped name if exists, otherwise use original
+        internal_q = quality_map.get(q_key.lower(), q_key.lower())
         
-        qualities = {}
-        main_spade_a = ""
-        for q_key, q_data in audio_urls.items():
-            # Use raw_url because we decrypt on device
-            u = q_data.get("raw_url") or q_data.get("play_url")
-            sa = q_data.get("spade_a", "")
-            
-            # Use our mapped name if exists, otherwise use original
-            internal_q = quality_map.get(q_key.lower(), q_key.lower())
-            
-            if u:
-                qualities[internal_q] = {
-                    "url": u,
-                    "level": internal_q,
-                    "spade_a": sa
-                }
-                if sa and not main_spade_a:
-                    main_spade_a = sa
+        if u:
+            qualities[internal_q] = {
+                "url": u,
+                "level": internal_q,
+                "spade_a": sa
+            }
+            if sa and not main_spade_a:
+                main_spade_a = sa
+    
+    if not qualities:
+        raise RuntimeError("No playable URL found in Qishui response")
         
-        if not qualities:
-            raise RuntimeError("No playable URL found in Qishui response")
-            
-        # Priority for best quality: sky > lossless > exhigh > standard
-        priority = ["sky", "lossless", "exhigh", "standard"]
-        best_q = ""
-        for p in priority:
-            if p in qualities:
-                best_q = p
-                break
-        if not best_q:
-            best_q = list(qualities.keys())[0]
+    # Priority for best quality: sky > lossless > exhigh > standard
+    priority = ["sky", "lossless", "exhigh", "standard"]
+    best_q = ""
+    for p in priority:
+        if p in qualities:
+            best_q = p
+            break
+    if not best_q:
+        best_q = list(qualities.keys())[0]
 
-        best = {
-            "quality": best_q, 
-            "url": qualities[best_q]["url"],
-            "spade_a": qualities[best_q].get("spade_a", "")
-        }
-        
-        return {
-            "platform": "qishui",
-            "id": track_id,
-            "best": best,
-            "qualities": qualities,
-            "name": res.get("name"),
-            "spade_a": main_spade_a
-        }
+    best = {
+        "quality": best_q, 
+        "url": qualities[best_q]["url"],
+        "spade_a": qualities[best_q].get("spade_a", "")
+    }
+    
+    return {
+        "platform": "qishui",
+        "id": track_id,
+        "best": best,
+        "qualities": qualities,
+        "name": res.get("name"),
+        "spade_a": main_spade_a
+    }
+
+def qishui_parse(url: str) -> Dict[str, Any]:
+    # Handle short links by resolving them first
+    url = resolve_short_link(url)
+    track_id = qishui_track_id(url)
+    print(f"[Qishui Parse] ID: {track_id}")
+    
+    # Call the local Qishui API service (Port 8372)
+    api_url = f"{CFG.qishui_api}/track?id={track_id}"
+
+    def fetch(timeout: float) -> Dict[str, Any]:
+        resp = HTTP.get("qishui").get(api_url, headers=trace_headers(), timeout=timeout)
+        annotate_server_timing(resp)
+        resp.raise_for_status()
+        return resp.json()
+
+    try:
+        return qishui_build_result(track_id, UPSTREAMS["qishui"].call(fetch))
     except Exception as e:
         raise RuntimeError(f"Qishui API failed: {e}")
 
-def qq_search(keyword: str, limit: int) -> List[Dict[str, Any]]:
-    import requests
+QQ_SEARCH_URL = "https://u.y.qq.com/cgi-bin/musicu.fcg"
+QQ_SEARCH_HEADERS = {
+    "User-Agent": "Mozilla/5.0",
+    "Referer": "https://y.qq.com/",
+}
+
+def qq_search_params(keyword: str, limit: int) -> Dict[str, str]:
     payload = {
         "search": {
             "module": "music.search.SearchCgiService",
@@ -403,7 +1869,7 @@ def qq_search(keyword: str, limit: int) -> List[Dict[str, Any]]:
             },
         }
     }
-    params = {
+    return {
         "format": "json",
         "inCharset": "utf8",
         "outCharset": "utf-8",
@@ -411,18 +1877,8 @@ def qq_search(keyword: str, limit: int) -> List[Dict[str, Any]]:
         "needNewCode": "0",
         "data": json.dumps(payload, ensure_ascii=False, separators=(",", ":")),
     }
-    r = requests.get(
-        "https://u.y.qq.com/cgi-bin/musicu.fcg",
-        params=params,
-        headers={
-            "User-Agent": "Mozilla/5.0",
-            "Referer": "https://y.qq.com/",
-        },
-        cookies=QQ_COOKIE_KV,
-        timeout=30,
-    )
-    r.raise_for_status()
-    j = r.json()
+
+def qq_search_items(j: Dict[str, Any]) -> List[Dict[str, Any]]:
     items = (((j.get("search") or {}).get("data") or {}).get("body") or {}).get("song")
     lst = (items or {}).get("list") if isinstance(items, dict) else []
     if not isinstance(lst, list):
@@ -454,12 +1910,22 @@ def qq_search(keyword: str, limit: int) -> List[Dict[str, Any]]:
         )
     return out
 
-def wyy_search(keyword: str, limit: int) -> List[Dict[str, Any]]:
-    netease_dir = Path(__file__).resolve().parent / "网易云解析" / "Netease_url-main"
-    sys.path.insert(0, str(netease_dir))
-    from music_api import search_music  # type: ignore
+def qq_search(keyword: str, limit: int) -> List[Dict[str, Any]]:
+    with QQ_COOKIES.lease() as acct:
+        def fetch(timeout: float) -> Dict[str, Any]:
+            r = HTTP.get("qq_music").get(
+                QQ_SEARCH_URL,
+                params=qq_search_params(keyword, limit),
+                headers=QQ_SEARCH_HEADERS,
+                cookies=acct.kv,
+                timeout=timeout,
+            )
+            r.raise_for_status()
+            return r.json()
+
+        return qq_search_items(UPSTREAMS["qq_musicu"].call(fetch))
 
-    res = search_music(keyword, WYY_COOKIE_KV, limit)
+def wyy_search_items(res: Any) -> List[Dict[str, Any]]:
     out: List[Dict[str, Any]] = []
     if not isinstance(res, list):
         return out
@@ -480,107 +1946,659 @@ def wyy_search(keyword: str, limit: int) -> List[Dict[str, Any]]:
         )
     return out
 
-def wyy_playlist_parse(playlist_id: str) -> Dict[str, Any]:
-    netease_dir = Path(__file__).resolve().parent / "网易云解析" / "Netease_url-main"
-    sys.path.insert(0, str(netease_dir))
-    from music_api import playlist_detail  # type: ignore
-    
-    try:
-        pid = int(playlist_id)
-        print(f"[WYY Playlist] Requesting ID: {pid}")
-        
+def wyy_search(keyword: str, limit: int) -> List[Dict[str, Any]]:
+    sys.path.insert(0, str(NETEASE_DIR))
+    from music_api import search_music  # type: ignore
+
+    with WYY_COOKIES.lease() as acct:
+        res = UPSTREAMS["wyy_api"].call(lambda timeout: search_music(keyword, acct.kv, limit, timeout))
+    return wyy_search_items(res)
+
+SEARCH_PLATFORMS = ("qq", "wyy")
+SEARCH_PUNCT_RE = re.compile(r"[\W_]+")
+SEARCH_ARTIST_SPLIT_RE = re.compile(r"\s*(?:[/,，、&;]|\bfeat\.?\s|\bft\.?\s)\s*", re.I)
+# Reciprocal rank fusion constant; larger values flatten the rank bonus.
+SEARCH_RRF_K = 10
+
+def search_norm(text: str) -> str:
+    """Case, width and punctuation insensitive form used for dedupe."""
+    return SEARCH_PUNCT_RE.sub("", unicodedata.normalize("NFKC", text or "").lower())
+
+def search_song_key(name: str, artist: str) -> Tuple[str, Tuple[str, ...]]:
+    artists = sorted({search_norm(a) for a in SEARCH_ARTIST_SPLIT_RE.split(artist or "")} - {""})
+    return search_norm(name), tuple(artists)
+
+def search_item(platform: str, it: Dict[str, Any]) -> Dict[str, Any]:
+    """Common shape of a qq_search_items / wyy_search_items entry."""
+    sid = it.get("mid") if platform == "qq" else it.get("id")
+    return {
+        "platform": platform,
+        "id": sid,
+        "name": it.get("name") or "",
+        "artist": it.get("artist") or "",
+        "cover": it.get("cover") or "",
+        "share_url": it.get("share_url"),
+    }
+
+def merge_search_results(results: Dict[str, List[Dict[str, Any]]], limit: int) -> List[Dict[str, Any]]:
+    """Dedupe one song across platforms and rank by reciprocal rank fusion.
+
+    Each platform list contributes 1 / (SEARCH_RRF_K + rank) to a song, so a
+    song both platforms rank highly comes first. The entry keeps the fields of
+    its best ranked platform and lists every platform in "sources".
+    """
+    merged: Dict[Tuple, Dict[str, Any]] = {}
+    scores: Dict[Tuple, float] = {}
+    best_rank: Dict[Tuple, int] = {}
+    for platform in SEARCH_PLATFORMS:
+        for rank, it in enumerate(results.get(platform) or []):
+            item = search_item(platform, it)
+            key = search_song_key(item["name"], item["artist"])
+            if not key[0]:
+                key = (platform, item["id"])
+            entry = merged.get(key)
+            if entry is None:
+                entry = merged[key] = dict(item, sources=[])
+                scores[key] = 0.0
+                best_rank[key] = rank
+            elif rank < best_rank[key]:
+                entry.update(item)
+                best_rank[key] = rank
+            entry["sources"].append({"platform": platform, "id": item["id"], "share_url": item["share_url"]})
+            scores[key] += 1.0 / (SEARCH_RRF_K + rank)
+    ordered = sorted(merged, key=lambda k: -scores[k])
+    return [merged[k] for k in ordered[:limit]]
+
+class SearchCache:
+    """/search results keyed by (platform, normalized keyword).
+
+    An entry remembers the limit it was fetched with, so a request for a
+    smaller limit is a prefix of it. A result shorter than its limit is the
+    whole result set and serves any limit.
+    """
+
+    def __init__(self, max_size: int, ttl: float, shared: Optional[SharedCache] = None) -> None:
+        self.cache = ExpiringLRUCache(max_size)
+        self.ttl = ttl
+        self.shared = shared
+        self._lock = threading.Lock()
+        self.prefix_hits = 0
+        self.undersized = 0
+
+    @staticmethod
+    def key(platform: str, keyword: str) -> Tuple[str, str]:
+        return platform, " ".join(unicodedata.normalize("NFKC", keyword).lower().split())
+
+    def lookup(self, platform: str, keyword: str, limit: int) -> Optional[List[Dict[str, Any]]]:
+        key = self.key(platform, keyword)
+        entry = self.cache.get(key, record=False)
+        if entry is None and self.shared is not None:
+            hit = self.shared.get("search", key)
+            if hit is not None:
+                entry = tuple(hit[0])
+                self.cache.set(key, entry, hit[1])
+        if entry is None:
+            self.cache.record(False)
+            return None
+        cached_limit, items = entry
+        if cached_limit < limit and len(items) >= cached_limit:
+            with self._lock:
+                self.undersized += 1
+            self.cache.record(False)
+            return None
+        if cached_limit > limit:
+            with self._lock:
+                self.prefix_hits += 1
+        self.cache.record(True)
+        return items[:limit]
+
+    def store(self, platform: str, keyword: str, limit: int, items: List[Dict[str, Any]]) -> None:
+        if not items:
+            return
+        key = self.key(platform, keyword)
+        current = self.cache.get(key, record=False)
+        # A concurrent fetch with a bigger limit may have landed first.
+        if current is not None and current[0] > limit and len(current[1]) >= len(items):
+            return
+        self.cache.set(key, (limit, items), self.ttl)
+        if self.shared is not None:
+            self.shared.set("search", key, (limit, items), self.ttl)
+
+    def stats(self) -> Dict[str, Any]:
+        st = self.cache.stats()
+        with self._lock:
+            st["prefix_hits"] = self.prefix_hits
+            st["undersized"] = self.undersized
+        return st
+
+SEARCH_CACHE = SearchCache(CFG.search_cache_size, CFG.search_cache_ttl, SHARED_CACHE)
+
+def search_cached(platform: str, keyword: str, limit: int) -> List[Dict[str, Any]]:
+    items = SEARCH_CACHE.lookup(platform, keyword, limit)
+    if items is None:
+        items = (qq_search if platform == "qq" else wyy_search)(keyword, limit)
+        SEARCH_CACHE.store(platform, keyword, limit, items)
+    return items
+
+SEARCH_FANOUT = ThreadPoolExecutor(max_workers=max(2, CFG.search_fanout_workers), thread_name_prefix="search-fanout")
+
+def search_all(keyword: str, limit: int) -> Dict[str, Any]:
+    """Query every platform at once and merge whatever answers in time."""
+    futures = {
+        submit_traced(SEARCH_FANOUT, search_cached, p, keyword, limit): p for p in SEARCH_PLATFORMS
+    }
+    done, _ = wait(futures, timeout=CFG.search_all_timeout)
+    results: Dict[str, List[Dict[str, Any]]] = {}
+    errors: Dict[str, str] = {}
+    for fut, platform in futures.items():
+        if fut not in done:
+            errors[platform] = f"timed out after {CFG.search_all_timeout:g}s"
+        elif fut.exception() is not None:
+            errors[platform] = str(fut.exception())
+        else:
+            results[platform] = fut.result()
+    return search_all_result(results, errors, limit)
+
+def search_all_result(results: Dict[str, List[Dict[str, Any]]], errors: Dict[str, str], limit: int) -> Dict[str, Any]:
+    if not results:
+        raise RuntimeError("; ".join(f"{p}: {msg}" for p, msg in errors.items()))
+    return {
+        "platform": "all",
+        "list": merge_search_results(results, limit),
+        "partial": bool(errors),
+        "errors": errors,
+    }
+
+# Shared by the song/detail batches of /playlist and the url/v1 batches of /urls
+WYY_DETAIL_POOL = ThreadPoolExecutor(max_workers=max(1, CFG.wyy_detail_workers), thread_name_prefix="wyy-detail")
+
+def wyy_playlist_track(t: Dict[str, Any]) -> Dict[str, Any]:
+    """Normalize a music_api playlist track or a raw public-API track."""
+    artists = t.get("artists")
+    if not isinstance(artists, str):
+        artists = "/".join(a.get("name", "Unknown") for a in (t.get("ar") or artists or []))
+    album = t.get("album", "")
+    cover = t.get("picUrl", "")
+    if isinstance(album, dict) or "al" in t:
+        al = t.get("al") or album or {}
+        album, cover = al.get("name"), al.get("picUrl")
+    return {
+        "id": str(t.get("id", "")),
+        "title": t.get("name", ""),
+        "artist": artists,
+        "album": album,
+        "cover_url": cover,
+        "share_url": f"https://music.163.com/song?id={t.get('id', '')}"
+    }
+
+def wyy_playlist_fallback(pid: int) -> Optional[Dict[str, Any]]:
+    """Public playlist API; needs no cookie but only returns a prefix of big playlists."""
+    fallback_url = f"https://music.163.com/api/playlist/detail?id={pid}"
+    f_resp = UPSTREAMS["wyy_web"].call(lambda timeout: HTTP.get("wyy_web").get(fallback_url, headers={
+        "User-Agent": "Mozilla/5.0 (iPhone; CPU iPhone OS 16_0 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/16.0 Mobile/15E148 Safari/604.1",
+        "Referer": "https://music.163.com/"
+    }, timeout=timeout))
+    f_json = f_resp.json()
+    f_pl = f_json.get("result") or f_json.get("playlist") or {}
+    if not f_pl.get("tracks"):
+        print(f"[WYY Playlist] All attempts failed for ID {pid}. API Response: {f_json}")
+        return None
+    print(f"[WYY Playlist] Fallback Success! Found {len(f_pl['tracks'])} tracks.")
+    return f_pl
+
+def wyy_playlist_iter(playlist_id: str, offset: int = 0, limit: Optional[int] = None):
+    """Yield the playlist header, then its tracks one song/detail batch at a time.
+
+    Only trackIds[offset:offset + limit] are fetched. Up to
+    WYY_DETAIL_CONCURRENCY song/detail batches of WYY_DETAIL_CHUNK ids are in
+    flight ahead of the consumer, and batches are yielded in trackIds order.
+    The header's next_offset is the cursor for the following page (None on
+    the last one).
+    """
+    sys.path.insert(0, str(NETEASE_DIR))
+    from music_api import playlist_info, playlist_store, songs_detail  # type: ignore
+
+    pid = int(playlist_id)
+    print(f"[WYY Playlist] Requesting ID: {pid} offset={offset} limit={limit}")
+    with WYY_COOKIES.lease() as acct:
         # 1. Try with Library (v6 API, requires good cookies)
-        res = playlist_detail(pid, WYY_COOKIE_KV)
-        tracks_count = len(res.get("tracks", []))
-        
+        info = UPSTREAMS["wyy_api"].call(lambda timeout: playlist_info(pid, acct.kv, timeout))
+        track_ids = info.get("trackIds") or []
+        fallback = None
+
         # 2. Fallback: If library returns 0 tracks, try a simple public API call
-        if tracks_count == 0:
+        if not track_ids:
             print(f"[WYY Playlist] Library returned 0 tracks. Trying public fallback API...")
-            import requests
-            fallback_url = f"https://music.163.com/api/playlist/detail?id={pid}"
-            f_resp = requests.get(fallback_url, headers={
-                "User-Agent": "Mozilla/5.0 (iPhone; CPU iPhone OS 16_0 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/16.0 Mobile/15E148 Safari/604.1",
-                "Referer": "https://music.163.com/"
-            }, timeout=10)
-            f_json = f_resp.json()
-            f_pl = f_json.get("result") or f_json.get("playlist") or {}
-            f_tracks = f_pl.get("tracks") or []
-            
-            if f_tracks:
-                print(f"[WYY Playlist] Fallback Success! Found {len(f_tracks)} tracks.")
-                # Transform fallback tracks to match expected structure
-                processed_tracks = []
-                for t in f_tracks:
-                    ar_list = t.get("ar") or t.get("artists") or []
-                    artist_str = "/".join([a.get("name", "Unknown") for a in ar_list])
-                    processed_tracks.append({
-                        "id": str(t.get("id")),
-                        "name": t.get("name"),
-                        "artists": artist_str,
-                        "album": (t.get("al") or t.get("album") or {}).get("name"),
-                        "picUrl": (t.get("al") or t.get("album") or {}).get("picUrl")
-                    })
-                res = {
-                    "id": pid,
-                    "name": f_pl.get("name"),
-                    "coverImgUrl": f_pl.get("coverImgUrl"),
-                    "tracks": processed_tracks
-                }
-            else:
-                print(f"[WYY Playlist] All attempts failed for ID {pid}. API Response: {f_json}")
-
-        # Transform to internal standard format
-        tracks = []
-        for t in res.get("tracks", []):
-            tracks.append({
-                "id": str(t.get("id", "")),
-                "title": t.get("name", ""),
-                "artist": t.get("artists", ""),
-                "album": t.get("album", ""),
-                "cover_url": t.get("picUrl", ""),
-                "share_url": f"https://music.163.com/song?id={t.get('id', '')}"
-            })
-            
-        print(f"[WYY Playlist] Final Success: returning {len(tracks)} tracks.")
-        return {
+            fallback = wyy_playlist_fallback(pid)
+            if fallback:
+                info = {"id": pid, "name": fallback.get("name"), "coverImgUrl": fallback.get("coverImgUrl")}
+
+        total = len(fallback["tracks"]) if fallback else len(track_ids)
+        end = total if limit is None else min(total, offset + limit)
+        yield {
             "source": "wyy",
-            "id": str(res.get("id", "")),
-            "title": res.get("name", ""),
-            "cover_url": res.get("coverImgUrl", ""),
-            "list": tracks
+            "id": str(info.get("id", "")),
+            "title": info.get("name", ""),
+            "cover_url": info.get("coverImgUrl", ""),
+            "total": total,
+            "offset": offset,
+            "next_offset": end if end < total else None,
         }
+
+        chunk = max(1, CFG.wyy_detail_chunk)
+        spans = ((i, min(end, i + chunk)) for i in range(offset, end, chunk))
+        if fallback:
+            for i, j in spans:
+                yield [wyy_playlist_track(t) for t in fallback["tracks"][i:j]]
+            return
+
+        # Details seen on an earlier visit are reused while the song's trackIds
+        # version is unchanged; only new or changed ids go upstream.
+        store = playlist_store()
+        known = store.snapshot(pid, info.get("trackVersions") or {}) if CFG.wyy_playlist_incremental else {}
+
+        def fetch(ids: List[int]) -> List[Dict[str, Any]]:
+            missing = [sid for sid in ids if sid not in known]
+            fresh: Dict[int, Dict[str, Any]] = {}
+            if missing:
+                # Per-batch retries and breaker accounting happen in Upstream.call.
+                tracks = UPSTREAMS["wyy_api"].call(lambda timeout: songs_detail(missing, acct.kv, timeout))
+                if CFG.wyy_playlist_incremental:
+                    store.add_tracks(pid, tracks)
+                fresh = {int(t["id"]): t for t in tracks}
+            store.count_reused(len(ids) - len(missing))
+            return [known.get(sid) or fresh[sid] for sid in ids if sid in known or sid in fresh]
+
+        pending: "deque[Future]" = deque()
+        try:
+            for i, j in spans:
+                pending.append(submit_traced(WYY_DETAIL_POOL, fetch, track_ids[i:j]))
+                if len(pending) >= max(1, CFG.wyy_detail_concurrency):
+                    yield [wyy_playlist_track(t) for t in pending.popleft().result()]
+            while pending:
+                yield [wyy_playlist_track(t) for t in pending.popleft().result()]
+        finally:
+            for f in pending:
+                f.cancel()
+
+def wyy_store_stats() -> Dict[str, Any]:
+    """music_api's local stores: playlist snapshots and persistent song metadata."""
+    sys.path.insert(0, str(NETEASE_DIR))
+    from music_api import get_default_api  # type: ignore
+    api = get_default_api()
+    return {"playlist_store": api.playlist_store.stats(), "song_metadata": api.metadata_store.stats()}
+
+def wyy_playlist_parse(playlist_id: str, offset: int = 0, limit: Optional[int] = None) -> Dict[str, Any]:
+    try:
+        it = wyy_playlist_iter(playlist_id, offset, limit)
+        result = next(it)
+        result["list"] = [t for batch in it for t in batch]
+        print(f"[WYY Playlist] Final Success: returning {len(result['list'])} tracks.")
+        return result
     except Exception as e:
         import traceback
         traceback.print_exc()
         raise RuntimeError(f"Netease playlist parse error: {e}")
-        import traceback
-        traceback.print_exc()
-        raise RuntimeError(f"Netease playlist parse error: {e}")
+
+def playlist_page_args(args) -> Tuple[int, Optional[int]]:
+    """offset/limit query args; no limit means the rest of the playlist."""
+    offset = max(0, int(args.get("offset") or 0))
+    limit = args.get("limit")
+    if limit in (None, ""):
+        return offset, None
+    return offset, max(1, min(int(limit), CFG.playlist_max_limit))
+
+def wyy_playlist_ndjson(playlist_id: str, offset: int, limit: Optional[int]):
+    """NDJSON lines for /playlist?stream=1: header, one line per detail batch, end."""
+    it = wyy_playlist_iter(playlist_id, offset, limit)
+    try:
+        header = next(it)
+        yield ndjson_line(dict(header, type="playlist"))
+        pos = offset
+        for batch in it:
+            yield ndjson_line({"type": "tracks", "offset": pos, "list": batch})
+            pos += len(batch)
+        yield ndjson_line({"type": "end", "next_offset": header["next_offset"]})
+    except Exception as e:
+        yield ndjson_line({"type": "error", "code": 500, "msg": f"Netease playlist parse error: {e}"})
+    finally:
+        # Client gone: release the cookie lease and cancel queued detail batches now.
+        it.close()
+
+def wyy_collection_ids(kind: str, collection_id: int, acct: CookieAccount) -> Tuple[Dict[str, Any], List[int]]:
+    """Header fields and song ids, in order, of a playlist or an album."""
+    from music_api import album_detail, playlist_info  # type: ignore
+
+    if kind == "album":
+        album = UPSTREAMS["wyy_api"].call(lambda timeout: album_detail(collection_id, acct.kv, timeout))
+        header = {"title": album.get("name") or "", "cover_url": album.get("coverImgUrl") or ""}
+        return header, [int(s["id"]) for s in album.get("songs") or []]
+    info = UPSTREAMS["wyy_api"].call(lambda timeout: playlist_info(collection_id, acct.kv, timeout))
+    header = {"title": info.get("name") or "", "cover_url": info.get("coverImgUrl") or ""}
+    return header, [int(sid) for sid in info.get("trackIds") or []]
+
+def wyy_collection_urls(kind: str, collection_id: str, quality: str,
+                        offset: int = 0, limit: Optional[int] = None) -> Dict[str, Any]:
+    """Playable urls for songs[offset:offset + limit] of a playlist or album.
+
+    The ids go to url/v1 WYY_URL_BATCH at a time, so a 1000-track playlist
+    costs one info call plus five url calls. Songs the account cannot play at
+    any level are listed under "unavailable".
+    """
+    sys.path.insert(0, str(NETEASE_DIR))
+    from music_api import song_urls  # type: ignore
+
+    cid = int(collection_id)
+    with WYY_COOKIES.lease() as acct:
+        header, ids = wyy_collection_ids(kind, cid, acct)
+        total = len(ids)
+        end = total if limit is None else min(total, offset + limit)
+        ids = ids[offset:end]
+
+        def fetch(batch: List[int]) -> Dict[int, Dict[str, Any]]:
+            return UPSTREAMS["wyy_eapi"].call(
+                lambda timeout: song_urls(batch, quality, acct.kv, timeout, batch_size=len(batch))
+            )
+
+        step = max(1, CFG.wyy_url_batch)
+        futures = [submit_traced(WYY_DETAIL_POOL, fetch, ids[i:i + step]) for i in range(0, len(ids), step)]
+        try:
+            found: Dict[int, Dict[str, Any]] = {}
+            for f in futures:
+                found.update(f.result())
+        finally:
+            for f in futures:
+                f.cancel()
+
+    items, unavailable = [], []
+    for sid in ids:
+        item = found.get(sid) or {}
+        if not item.get("url"):
+            unavailable.append(str(sid))
+            continue
+        items.append({
+            "id": str(sid),
+            "url": item["url"],
+            "level": str(item.get("level") or quality),
+            "type": item.get("type"),
+            "br": item.get("br"),
+            "size": item.get("size"),
+        })
+    print(f"[WYY Urls] {kind} {cid}: {len(items)}/{len(ids)} playable")
+    return {
+        "source": "wyy",
+        "type": kind,
+        "id": str(cid),
+        **header,
+        "quality": quality,
+        "total": total,
+        "offset": offset,
+        "next_offset": end if end < total else None,
+        "list": items,
+        "unavailable": unavailable,
+    }
+
+def parse_cache_key(platform: str, url: str, quality: str) -> Tuple[str, str, str]:
+    song_id = url
+    try:
+        if platform == "wyy":
+            song_id = extract_wyy_song_id(url)
+        elif platform == "qq":
+            song_id = extract_qq_songmid(url)
+        elif platform == "qishui":
+            m = re.search(r"track_id=(\d+)", url)
+            if m:
+                song_id = m.group(1)
+            # qishui_parse ignores the requested quality
+            quality = ""
+    except ValueError:
+        pass
+    return platform, song_id, quality
+
+def _parse_uncached(key: Tuple[str, str, str], platform: str, url: str, quality: str) -> Dict[str, Any]:
+    # A leader that lost the race with a just-finished flight finds the result here.
+    cached = PARSE_CACHE.get(key, record=False)
+    if cached is not None:
+        return cached
+
+    def run() -> Dict[str, Any]:
+        with span(f"parse.{platform}"):
+            if platform == "wyy":
+                return wyy_parse(url, quality)
+            if platform == "qq":
+                return qq_parse(url, quality)
+            return qishui_parse(url)
+
+    if SHARED_CACHE is not None:
+        result, ttl = SHARED_CACHE.do("parse", key, run, parse_result_ttl)
+    else:
+        result = run()
+        ttl = parse_result_ttl(result)
+    PARSE_CACHE.set(key, result, ttl)
+    return result
+
+def parse_url(url: str, quality: str) -> Dict[str, Any]:
+    # Resolve first so a short link and its target share one cache entry.
+    url = resolve_short_link(url)
+    platform = detect_platform(url)
+    key = parse_cache_key(platform, url, quality)
+    cached = PARSE_CACHE.get(key)
+    if cached is not None:
+        return cached
+    return PARSE_FLIGHT.do(key, _parse_uncached, key, platform, url, quality)
+
+def request_platform(path: str, args) -> str:
+    """Platform label for a request: the url's platform for /parse, else the query arg."""
+    if path == "/parse":
+        try:
+            return detect_platform(args.get("url", ""))
+        except ValueError:
+            return "unknown"
+    if path == "/search":
+        return args.get("platform", "") or "none"
+    if path == "/playlist":
+        return args.get("source", "wyy")
+    return "none"
+
+@APP.before_request
+def _start_timer() -> None:
+    g.request_start = time.perf_counter()
+    if CFG.trace_enabled and request.path != "/metrics":
+        trace = Trace(new_trace_id(request.headers.get(TRACE_HEADER)))
+        g.trace = trace
+        CURRENT_TRACE.set(trace)
+
+@APP.after_request
+def _record_request(response):
+    start = getattr(g, "request_start", None)
+    if start is not None and request.path != "/metrics":
+        # Envelope code, not HTTP status: errors are reported with HTTP 200.
+        code = str(getattr(g, "api_code", response.status_code))
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        platform = request_platform(request.path, request.args)
+        METRICS.observe("juhe_http_request_duration_seconds", {"route": route, "platform": platform}, time.perf_counter() - start)
+        METRICS.inc("juhe_http_requests_total", {"route": route, "platform": platform, "code": code})
+    trace = g.pop("trace", None)
+    if trace is not None:
+        response.headers[TRACE_HEADER] = trace.trace_id
+        method, path, code = request.method, request.full_path.rstrip("?"), getattr(g, "api_code", response.status_code)
+
+        # Streamed bodies (/parse/batch, /playlist?stream=1) are still being
+        # produced here, so the trace is closed once the response is done.
+        def _finish_trace() -> None:
+            TRACE_LOG.write(trace, method, path, code)
+            CURRENT_TRACE.set(None)
+
+        response.call_on_close(_finish_trace)
+    return response
+
+def _cache_samples(cache: Any, name: str) -> List[Tuple[Dict[str, str], float]]:
+    st = cache.stats()
+    return [({"cache": name, "stat": k}, float(st[k])) for k in ("hits", "misses", "evictions", "expirations", "size", "hit_ratio")]
+
+def _pool_depths() -> List[Tuple[Dict[str, str], float]]:
+    pools = {"wyy_fanout": WYY_FANOUT, "wyy_detail": WYY_DETAIL_POOL, "search_fanout": SEARCH_FANOUT}
+    pools.update({f"batch_{p}": ex for p, ex in BATCH_EXECUTORS.items()})
+    return [({"pool": name}, float(ex._work_queue.qsize())) for name, ex in pools.items()]
+
+METRICS.gauge("juhe_cache", "Cache counters and sizes", lambda: (
+    _cache_samples(PARSE_CACHE, "parse") + _cache_samples(SEARCH_CACHE, "search")
+    + (_cache_samples(SHARED_CACHE, "shared") if SHARED_CACHE is not None else [])
+))
+METRICS.gauge("juhe_thread_pool_queue_depth", "Tasks waiting for a worker thread", _pool_depths)
+METRICS.gauge("juhe_qq_bridge_workers", "QQ bridge workers by state", lambda: [
+    ({"state": "busy"}, float(sum(1 for w in QQ_BRIDGE_POOL.workers if w.busy))),
+    ({"state": "healthy"}, float(sum(1 for w in QQ_BRIDGE_POOL.workers if w.healthy))),
+    ({"state": "total"}, float(len(QQ_BRIDGE_POOL.workers))),
+])
+METRICS.gauge("juhe_http_pool_requests", "Outbound requests and new connections per upstream session", lambda: [
+    ({"upstream": name, "kind": kind}, float(st[kind]))
+    for name, st in HTTP.stats().items() for kind in ("requests", "connections", "reused")
+])
+METRICS.gauge("juhe_upstream_circuit_open", "1 while the upstream's breaker is open or half-open", lambda: [
+    ({"upstream": name}, 0.0 if u.state == "closed" else 1.0) for name, u in UPSTREAMS.items()
+])
+METRICS.gauge("juhe_upstream_timeout_seconds", "Current adaptive attempt timeout per upstream", lambda: [
+    ({"upstream": name}, u.timeout()) for name, u in UPSTREAMS.items()
+])
+METRICS.gauge("juhe_retry_budget_tokens", "Retries currently allowed by the shared retry budget", lambda: [
+    ({}, RETRY_BUDGET.tokens)
+])
+
+@APP.route("/metrics", methods=["GET"])
+def metrics_route() -> Any:
+    return Response(METRICS.render(), mimetype="text/plain; version=0.0.4")
+
+# One executor per platform: its size is that platform's concurrency limit,
+# shared by every running batch so a large batch cannot flood one upstream.
+BATCH_EXECUTORS = {
+    "wyy": ThreadPoolExecutor(max_workers=max(1, CFG.batch_wyy_concurrency), thread_name_prefix="batch-wyy"),
+    "qq": ThreadPoolExecutor(max_workers=max(1, CFG.batch_qq_concurrency), thread_name_prefix="batch-qq"),
+    "qishui": ThreadPoolExecutor(max_workers=max(1, CFG.batch_qishui_concurrency), thread_name_prefix="batch-qishui"),
+}
+
+def parse_batch_item(index: int, url: str, quality: str) -> Dict[str, Any]:
+    try:
+        return {"index": index, "url": url, "code": 200, "msg": "ok", "data": parse_url(url, quality)}
+    except Exception as e:
+        return {"index": index, "url": url, "code": 500, "msg": str(e), "data": None}
+
+def ndjson_line(obj: Any) -> str:
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")) + "\n"
+
+@APP.route("/parse/batch", methods=["POST"])
+def parse_batch_route() -> Any:
+    """Resolve many urls at once, streaming one NDJSON line per url as it completes.
+
+    Body: {"urls": [...], "quality": "lossless"}. Lines carry the input "index"
+    so clients can reorder; each has the usual code/msg/data envelope.
+    """
+    body = request.get_json(silent=True) or {}
+    if not isinstance(body, dict):
+        return api_err("missing urls", 400)
+    urls = body.get("urls")
+    quality = str(body.get("quality") or "lossless").strip().lower()
+    if not isinstance(urls, list) or not urls:
+        return api_err("missing urls", 400)
+    if len(urls) > CFG.batch_max_urls:
+        return api_err(f"too many urls (max {CFG.batch_max_urls})", 400)
+
+    def generate():
+        futures = []
+        try:
+            for i, raw in enumerate(urls):
+                url = str(raw or "").strip()
+                try:
+                    platform = detect_platform(url)
+                except ValueError as e:
+                    yield ndjson_line({"index": i, "url": url, "code": 400, "msg": str(e), "data": None})
+                    continue
+                futures.append(submit_traced(BATCH_EXECUTORS[platform], parse_batch_item, i, url, quality))
+            for fut in as_completed(futures):
+                yield ndjson_line(fut.result())
+        finally:
+            # Client went away: drop the parses that have not started yet.
+            for fut in futures:
+                fut.cancel()
+
+    return Response(generate(), mimetype="application/x-ndjson")
 
 @APP.route("/playlist", methods=["GET"])
 def playlist_route() -> Tuple[Any, int]:
+    """Playlist tracks, optionally one page at a time.
+
+    offset/limit select trackIds[offset:offset + limit]; data.next_offset is
+    the cursor for the next page. stream=1 answers with NDJSON instead: a
+    "playlist" header line, a "tracks" line per detail batch as it arrives,
+    then an "end" (or "error") line.
+    """
     source = request.args.get("source", "wyy").strip().lower()
     id = request.args.get("id", "").strip()
     
     if not id:
         return api_err("missing id", 400)
-        
     try:
-        if source == "wyy":
-            return api_ok(wyy_playlist_parse(id))
+        offset, limit = playlist_page_args(request.args)
+    except ValueError:
+        return api_err("offset and limit must be integers", 400)
+    if source != "wyy":
         return api_err("source not supported in python side yet", 400)
+    if request.args.get("stream") == "1":
+        return Response(wyy_playlist_ndjson(id, offset, limit), mimetype="application/x-ndjson")
+
+    try:
+        return api_ok(wyy_playlist_parse(id, offset, limit))
     except Exception as e:
         return api_err(str(e), 500)
 
+@APP.route("/urls", methods=["GET"])
+def urls_route() -> Tuple[Any, int]:
+    """Playable urls for a whole Netease playlist or album at one quality.
+
+    type=playlist|album, id, quality (default lossless); offset/limit page
+    through the songs like /playlist.
+    """
+    kind = request.args.get("type", "playlist").strip().lower()
+    id = request.args.get("id", "").strip()
+    quality = request.args.get("quality", "lossless").strip().lower()
+    if not id:
+        return api_err("missing id", 400)
+    if kind not in ("playlist", "album"):
+        return api_err("type must be playlist or album", 400)
+    try:
+        offset, limit = playlist_page_args(request.args)
+        int(id)
+    except ValueError:
+        return api_err("id, offset and limit must be integers", 400)
+    try:
+        return api_ok(wyy_collection_urls(kind, id, quality, offset, limit))
+    except Exception as e:
+        return api_err(str(e), 500)
+
+def health_info() -> Dict[str, Any]:
+    return {
+        "service": "ok",
+        "qq_cookie": str(QQ_COOKIE_PATH),
+        "wyy_cookie": str(WYY_COOKIE_PATH),
+        "parse_cache": PARSE_CACHE.stats(),
+        "wyy_privileges": WYY_PRIVILEGES.stats(),
+        "search_cache": SEARCH_CACHE.stats(),
+        "shared_cache": SHARED_CACHE.stats() if SHARED_CACHE is not None else None,
+        "pid": os.getpid(),
+        "short_links": SHORT_LINKS.stats(),
+        "trace_log": TRACE_LOG.stats(),
+        "parse_flight": PARSE_FLIGHT.stats(),
+        "qq_bridge": QQ_BRIDGE_POOL.stats(),
+        "http_pools": HTTP.stats(),
+        "cookies": {"qq": QQ_COOKIES.stats(), "wyy": WYY_COOKIES.stats()},
+        "upstreams": {name: u.stats() for name, u in UPSTREAMS.items()},
+        "retry_budget": RETRY_BUDGET.stats(),
+        **wyy_store_stats(),
+    }
+
 @APP.route("/health", methods=["GET"])
 def health() -> Tuple[Any, int]:
-    return api_ok(
-        {
-            "service": "ok",
-            "qq_cookie": str(QQ_COOKIE_PATH),
-            "wyy_cookie": str(WYY_COOKIE_PATH),
-        }
-    )
+    return api_ok(health_info())
 
 @APP.route("/parse", methods=["GET"])
 def parse_route() -> Tuple[Any, int]:
@@ -589,14 +2607,7 @@ def parse_route() -> Tuple[Any, int]:
     if not url:
         return api_err("missing url", 400)
     try:
-        platform = detect_platform(url)
-        if platform == "wyy":
-            return api_ok(wyy_parse(url, quality))
-        if platform == "qq":
-            return api_ok(qq_parse(url, quality))
-        if platform == "qishui":
-            return api_ok(qishui_parse(url))
-        return api_err("unsupported platform", 400)
+        return api_ok(parse_url(url, quality))
     except Exception as e:
         return api_err(str(e), 500)
 
@@ -607,16 +2618,16 @@ def search_route() -> Tuple[Any, int]:
     limit = int(request.args.get("limit", "20"))
     if not keyword:
         return api_err("missing keyword", 400)
-    if platform not in ("qq", "wyy"):
-        return api_err("platform must be qq or wyy", 400)
+    if platform not in ("qq", "wyy", "all"):
+        return api_err("platform must be qq, wyy or all", 400)
     if limit < 1:
         limit = 1
     if limit > 50:
         limit = 50
     try:
-        if platform == "qq":
-            return api_ok({"platform": "qq", "list": qq_search(keyword, limit)})
-        return api_ok({"platform": "wyy", "list": wyy_search(keyword, limit)})
+        if platform == "all":
+            return api_ok(search_all(keyword, limit))
+        return api_ok({"platform": platform, "list": search_cached(platform, keyword, limit)})
     except Exception as e:
         return api_err(str(e), 500)
 
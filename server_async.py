@@ -0,0 +1,479 @@
+#!/usr/bin/env python3
+"""asyncio serving mode for server.py.
+
+Serves /parse, /search, /playlist and /health with the same JSON contract as
+server.py, but on a single aiohttp event loop instead of one OS thread per
+request. Upstream calls (Netease eapi, u.y.qq.com, the QQ bridge workers and
+the qishui 8372 service) use one shared aiohttp client session, so thousands
+of in-flight parses are just coroutines waiting on sockets.
+
+Cookies, the parse result cache, the QQ bridge pool and all response
+normalization are shared with server.py. /playlist still runs the
+synchronous music_api code in the default thread pool.
+
+    python server_async.py
+"""
+import asyncio
+import contextvars
+import functools
+import json
+import sys
+import time
+from typing import Any, Dict, Optional, Tuple
+
+import aiohttp
+from aiohttp import web
+
+import server
+from server import CFG, METRICS, PARSE_CACHE, UPSTREAMS, CircuitOpenError, span
+
+sys.path.insert(0, str(server.NETEASE_DIR))
+from music_api import APIConstants, NeteaseAPI  # type: ignore
+
+NETEASE = NeteaseAPI()
+
+def api_ok(data: Any) -> web.Response:
+    resp = web.json_response({"code": 200, "msg": "ok", "data": data})
+    resp["api_code"] = 200
+    return resp
+
+def api_err(msg: str, code: int = 500) -> web.Response:
+    resp = web.json_response({"code": code, "msg": msg, "data": None})
+    resp["api_code"] = code
+    return resp
+
+class AsyncSingleFlight:
+    """Event-loop counterpart of server.SingleFlight."""
+
+    def __init__(self) -> None:
+        self._inflight: Dict[Any, asyncio.Future] = {}
+        self.leaders = 0
+        self.followers = 0
+
+    async def do(self, key: Any, fn, *args) -> Any:
+        task = self._inflight.get(key)
+        if task is not None:
+            self.followers += 1
+            with span("parse_flight.wait"):
+                return await asyncio.shield(task)
+
+        self.leaders += 1
+        # The fetch runs as its own task and everyone awaits it through
+        # shield, so no caller going away (the leader included) cancels it
+        # for the others.
+        task = asyncio.ensure_future(fn(*args))
+        self._inflight[key] = task
+        task.add_done_callback(functools.partial(self._finish, key))
+        return await asyncio.shield(task)
+
+    def _finish(self, key: Any, task: "asyncio.Future") -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            # mark as retrieved so a flight nobody waits for any more does not log a warning
+            task.exception()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "inflight": len(self._inflight),
+            "leaders": self.leaders,
+            "followers": self.followers,
+        }
+
+PARSE_FLIGHT = AsyncSingleFlight()
+
+def client(request: web.Request) -> aiohttp.ClientSession:
+    return request.app["client"]
+
+def in_executor(fn, *args: Any) -> "asyncio.Future":
+    """run_in_executor that carries the request's trace into the worker thread."""
+    call = functools.partial(contextvars.copy_context().run, fn, *args)
+    return asyncio.get_running_loop().run_in_executor(None, call)
+
+def is_transient_error(e: BaseException) -> bool:
+    """server.is_transient_error plus aiohttp's connection and timeout errors."""
+    return isinstance(e, (aiohttp.ClientConnectionError, asyncio.TimeoutError)) or server.is_transient_error(e)
+
+async def eapi_post(http: aiohttp.ClientSession, url: str, params: str, cookies: Dict[str, str]) -> str:
+    request_cookies = APIConstants.DEFAULT_COOKIES.copy()
+    request_cookies.update(cookies)
+
+    async def fetch(timeout: float) -> str:
+        async with http.post(
+            url,
+            data={"params": params},
+            headers={"User-Agent": APIConstants.USER_AGENT, "Referer": APIConstants.REFERER},
+            cookies=request_cookies,
+            timeout=aiohttp.ClientTimeout(total=timeout),
+        ) as r:
+            r.raise_for_status()
+            return await r.text()
+
+    return await UPSTREAMS["wyy_eapi"].call_async(fetch, is_transient_error)
+
+async def wyy_fetch_qualities(http: aiohttp.ClientSession, song_id: int, acct: server.CookieAccount) -> Dict[str, Dict[str, Any]]:
+    rejected = []
+
+    async def fetch_quality(q: str, params: str) -> Tuple[str, Optional[Dict[str, Any]]]:
+        try:
+            text = await eapi_post(http, APIConstants.SONG_URL_V1, params, acct.kv)
+            return q, server.wyy_quality_item(q, NeteaseAPI.parse_song_url_response(text))
+        except CircuitOpenError as e:
+            rejected.append(e)
+        except Exception as e:
+            print(f"  -> Q: {q} Error: {e}")
+            server.WYY_COOKIES.report(acct, e)
+        return q, None
+
+    async def fetch_detail(timeout: float) -> Any:
+        async with http.post(
+            APIConstants.SONG_DETAIL_V3,
+            data={"c": json.dumps([{"id": song_id, "v": 0}])},
+            cookies=acct.kv,
+            timeout=aiohttp.ClientTimeout(total=timeout),
+        ) as r:
+            r.raise_for_status()
+            return await r.json(content_type=None)
+
+    async def fetch_levels() -> Optional[list]:
+        try:
+            detail = await UPSTREAMS["wyy_api"].call_async(fetch_detail, is_transient_error)
+            return server.wyy_learn_levels(song_id, acct, detail)
+        except Exception as e:
+            print(f"  -> Privilege probe error: {e}")
+            server.WYY_COOKIES.report(acct, e)
+            return None
+
+    # The first levels run alongside the privilege probe; see server.wyy_first_levels.
+    first, probe = server.wyy_first_levels(song_id, acct)
+    with span("wyy.encrypt", levels=len(first)):
+        params = NETEASE.build_song_url_params_many(song_id, first)
+    tasks = [asyncio.ensure_future(fetch_quality(q, params[q])) for q in first]
+    if probe:
+        levels = await fetch_levels()
+        if levels is None:
+            levels = server.WYY_PRIORITY
+        else:
+            print(f"[WYY Parse] Probing levels: {levels}")
+        rest = [q for q in levels if q not in first]
+        with span("wyy.encrypt", levels=len(rest)):
+            params = NETEASE.build_song_url_params_many(song_id, rest)
+        tasks += [fetch_quality(q, params[q]) for q in rest]
+    results = await asyncio.gather(*tasks)
+    qualities = {q: item for q, item in results if item}
+
+    if not qualities and rejected:
+        raise rejected[0]
+
+    return qualities
+
+async def resolve_short_link(url: str) -> str:
+    """server.resolve_short_link; a miss walks redirects with blocking requests, so it runs on the thread pool."""
+    if not server.SHORT_LINK_RE.search(url):
+        return url
+    return await in_executor(server.resolve_short_link, url)
+
+async def wyy_parse(http: aiohttp.ClientSession, url: str, quality: str) -> Dict[str, Any]:
+    song_id = int(server.extract_wyy_song_id(await resolve_short_link(url)))
+    with server.WYY_COOKIES.lease() as acct:
+        print(f"[WYY Parse] ID: {song_id}, Cookie: {acct.path.name} ({len(acct.kv)} keys)")
+        qualities = await wyy_fetch_qualities(http, song_id, acct)
+
+    return server.wyy_build_result(song_id, quality, qualities)
+
+async def bridge_post(http: aiohttp.ClientSession, url: str, acct: server.CookieAccount, timeout: float) -> Dict[str, Any]:
+    pool = server.QQ_BRIDGE_POOL
+    start = time.monotonic()
+    deadline = start + CFG.qq_bridge_acquire_timeout
+    delay = 0.005
+    w = pool.try_acquire()
+    while w is None:
+        if time.monotonic() >= deadline:
+            raise RuntimeError("QQ Bridge Server Error: no idle bridge worker")
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, 0.05)
+        w = pool.try_acquire()
+    METRICS.observe("juhe_qq_bridge_wait_seconds", {}, time.monotonic() - start)
+
+    broken = False
+    try:
+        async with http.post(
+            w.url,
+            json={"url": url, "cookie": acct.cookie_str},
+            headers=server.trace_headers(),
+            timeout=aiohttp.ClientTimeout(total=timeout),
+        ) as r:
+            server.annotate(port=w.port)
+            server.annotate_server_timing(r)
+            r.raise_for_status()
+            return await r.json(content_type=None)
+    except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+        broken = True
+        raise
+    finally:
+        pool.release(w, broken)
+
+async def run_node_qq_parse(http: aiohttp.ClientSession, url: str) -> Dict[str, Any]:
+    with server.QQ_COOKIES.lease() as acct:
+        try:
+            return await UPSTREAMS["qq_bridge"].call_async(
+                lambda timeout: bridge_post(http, url, acct, timeout), is_transient_error
+            )
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+            raise RuntimeError(f"QQ Bridge Server Error: {e!r}")
+        except aiohttp.ClientError as e:
+            raise RuntimeError(f"QQ Bridge Server Error: {e}")
+
+async def qq_parse(http: aiohttp.ClientSession, url: str, quality: str) -> Dict[str, Any]:
+    return server.qq_build_result(url, quality, await run_node_qq_parse(http, url))
+
+async def qishui_parse(http: aiohttp.ClientSession, url: str) -> Dict[str, Any]:
+    url = await resolve_short_link(url)
+    track_id = server.qishui_track_id(url)
+    print(f"[Qishui Parse] ID: {track_id}")
+
+    async def fetch(timeout: float) -> Any:
+        async with http.get(
+            f"{CFG.qishui_api}/track",
+            params={"id": track_id},
+            headers=server.trace_headers(),
+            timeout=aiohttp.ClientTimeout(total=timeout),
+        ) as r:
+            server.annotate_server_timing(r)
+            r.raise_for_status()
+            return await r.json(content_type=None)
+
+    try:
+        res = await UPSTREAMS["qishui"].call_async(fetch, is_transient_error)
+        return server.qishui_build_result(track_id, res)
+    except Exception as e:
+        raise RuntimeError(f"Qishui API failed: {e}")
+
+async def _parse_uncached(http: aiohttp.ClientSession, key: Tuple[str, str, str], platform: str, url: str, quality: str) -> Dict[str, Any]:
+    cached = PARSE_CACHE.get(key, record=False)
+    if cached is not None:
+        return cached
+
+    with span(f"parse.{platform}"):
+        if platform == "wyy":
+            result = await wyy_parse(http, url, quality)
+        elif platform == "qq":
+            result = await qq_parse(http, url, quality)
+        else:
+            result = await qishui_parse(http, url)
+    PARSE_CACHE.set(key, result, server.parse_result_ttl(result))
+    return result
+
+async def parse_url(http: aiohttp.ClientSession, url: str, quality: str) -> Dict[str, Any]:
+    url = await resolve_short_link(url)
+    platform = server.detect_platform(url)
+    key = server.parse_cache_key(platform, url, quality)
+    cached = PARSE_CACHE.get(key)
+    if cached is not None:
+        return cached
+    return await PARSE_FLIGHT.do(key, _parse_uncached, http, key, platform, url, quality)
+
+async def qq_search(http: aiohttp.ClientSession, keyword: str, limit: int) -> Any:
+    with server.QQ_COOKIES.lease() as acct:
+        async def fetch(timeout: float) -> Any:
+            async with http.get(
+                server.QQ_SEARCH_URL,
+                params=server.qq_search_params(keyword, limit),
+                headers=server.QQ_SEARCH_HEADERS,
+                cookies=acct.kv,
+                timeout=aiohttp.ClientTimeout(total=timeout),
+            ) as r:
+                r.raise_for_status()
+                return await r.json(content_type=None)
+
+        return server.qq_search_items(await UPSTREAMS["qq_musicu"].call_async(fetch, is_transient_error))
+
+async def wyy_search(http: aiohttp.ClientSession, keyword: str, limit: int) -> Any:
+    with server.WYY_COOKIES.lease() as acct:
+        async def fetch(timeout: float) -> Any:
+            async with http.post(
+                APIConstants.SEARCH_API,
+                data={"s": keyword, "type": 1, "limit": limit},
+                headers={"User-Agent": APIConstants.USER_AGENT, "Referer": APIConstants.REFERER},
+                cookies=acct.kv,
+                timeout=aiohttp.ClientTimeout(total=timeout),
+            ) as r:
+                r.raise_for_status()
+                return await r.json(content_type=None)
+
+        res = NeteaseAPI.parse_search_response(await UPSTREAMS["wyy_api"].call_async(fetch, is_transient_error))
+    return server.wyy_search_items(res)
+
+async def search_cached(http: aiohttp.ClientSession, platform: str, keyword: str, limit: int) -> Any:
+    items = server.SEARCH_CACHE.lookup(platform, keyword, limit)
+    if items is None:
+        items = await (qq_search if platform == "qq" else wyy_search)(http, keyword, limit)
+        server.SEARCH_CACHE.store(platform, keyword, limit, items)
+    return items
+
+async def search_all(http: aiohttp.ClientSession, keyword: str, limit: int) -> Dict[str, Any]:
+    """See server.search_all; platforms still running at the deadline are cancelled."""
+    tasks = {
+        asyncio.ensure_future(search_cached(http, p, keyword, limit)): p for p in server.SEARCH_PLATFORMS
+    }
+    done, pending = await asyncio.wait(tasks, timeout=CFG.search_all_timeout)
+    results: Dict[str, Any] = {}
+    errors: Dict[str, str] = {}
+    for task, platform in tasks.items():
+        if task in pending:
+            task.cancel()
+            errors[platform] = f"timed out after {CFG.search_all_timeout:g}s"
+        elif task.exception() is not None:
+            errors[platform] = str(task.exception())
+        else:
+            results[platform] = task.result()
+    return server.search_all_result(results, errors, limit)
+
+async def parse_route(request: web.Request) -> web.Response:
+    url = request.query.get("url", "").strip()
+    quality = request.query.get("quality", "lossless").strip().lower()
+    if not url:
+        return api_err("missing url", 400)
+    try:
+        return api_ok(await parse_url(client(request), url, quality))
+    except Exception as e:
+        return api_err(str(e), 500)
+
+async def search_route(request: web.Request) -> web.Response:
+    keyword = request.query.get("keyword", "").strip()
+    platform = request.query.get("platform", "").strip().lower()
+    limit = int(request.query.get("limit", "20"))
+    if not keyword:
+        return api_err("missing keyword", 400)
+    if platform not in ("qq", "wyy", "all"):
+        return api_err("platform must be qq, wyy or all", 400)
+    limit = max(1, min(limit, 50))
+    try:
+        if platform == "all":
+            return api_ok(await search_all(client(request), keyword, limit))
+        return api_ok({"platform": platform, "list": await search_cached(client(request), platform, keyword, limit)})
+    except Exception as e:
+        return api_err(str(e), 500)
+
+def close_generator(gen) -> None:
+    """gen.close(), waiting out a next() that is still running on another thread."""
+    while True:
+        try:
+            gen.close()
+            return
+        except ValueError:  # generator already executing
+            time.sleep(0.05)
+
+async def playlist_route(request: web.Request) -> web.StreamResponse:
+    source = request.query.get("source", "wyy").strip().lower()
+    id = request.query.get("id", "").strip()
+    if not id:
+        return api_err("missing id", 400)
+    try:
+        offset, limit = server.playlist_page_args(request.query)
+    except ValueError:
+        return api_err("offset and limit must be integers", 400)
+    if source != "wyy":
+        return api_err("source not supported in python side yet", 400)
+
+    loop = asyncio.get_running_loop()
+    if request.query.get("stream") == "1":
+        # Each detail batch is fetched by the sync generator on the thread pool.
+        resp = web.StreamResponse(headers={"Content-Type": "application/x-ndjson", **server.trace_headers()})
+        resp["api_code"] = 200
+        await resp.prepare(request)
+        lines = server.wyy_playlist_ndjson(id, offset, limit)
+        # One context for the whole generator so its spans land in this trace.
+        ctx = contextvars.copy_context()
+        try:
+            while True:
+                line = await loop.run_in_executor(None, ctx.run, next, lines, None)
+                if line is None:
+                    break
+                await resp.write(line.encode("utf-8"))
+        finally:
+            try:
+                lines.close()
+            except ValueError:
+                # Cancelled while a batch was still being fetched: close once
+                # that next() returns, so the lease and pending batches go too.
+                loop.run_in_executor(None, close_generator, lines)
+        await resp.write_eof()
+        return resp
+
+    try:
+        return api_ok(await in_executor(server.wyy_playlist_parse, id, offset, limit))
+    except Exception as e:
+        return api_err(str(e), 500)
+
+async def urls_route(request: web.Request) -> web.Response:
+    kind = request.query.get("type", "playlist").strip().lower()
+    id = request.query.get("id", "").strip()
+    quality = request.query.get("quality", "lossless").strip().lower()
+    if not id:
+        return api_err("missing id", 400)
+    if kind not in ("playlist", "album"):
+        return api_err("type must be playlist or album", 400)
+    try:
+        offset, limit = server.playlist_page_args(request.query)
+        int(id)
+    except ValueError:
+        return api_err("id, offset and limit must be integers", 400)
+    try:
+        return api_ok(await in_executor(server.wyy_collection_urls, kind, id, quality, offset, limit))
+    except Exception as e:
+        return api_err(str(e), 500)
+
+async def health(request: web.Request) -> web.Response:
+    # health_info runs SQLite COUNT/stat queries; keep them off the event loop.
+    info = await in_executor(server.health_info)
+    info["mode"] = "asyncio"
+    info["parse_flight"] = PARSE_FLIGHT.stats()
+    return api_ok(info)
+
+async def metrics_route(request: web.Request) -> web.Response:
+    return web.Response(text=METRICS.render(), content_type="text/plain", charset="utf-8")
+
+@web.middleware
+async def record_request(request: web.Request, handler):
+    start = time.perf_counter()
+    trace = None
+    if CFG.trace_enabled and request.path != "/metrics":
+        # Each request runs in its own task, so this does not leak across requests.
+        trace = server.Trace(server.new_trace_id(request.headers.get(server.TRACE_HEADER)))
+        server.CURRENT_TRACE.set(trace)
+    resp = await handler(request)
+    if trace is not None:
+        if not resp.prepared:
+            resp.headers[server.TRACE_HEADER] = trace.trace_id
+        server.TRACE_LOG.write(trace, request.method, request.path_qs, resp.get("api_code", resp.status))
+    if request.path != "/metrics":
+        route = request.match_info.route.resource.canonical if request.match_info.route.resource else "unmatched"
+        platform = server.request_platform(request.path, request.query)
+        code = str(resp.get("api_code", resp.status))
+        METRICS.observe("juhe_http_request_duration_seconds", {"route": route, "platform": platform}, time.perf_counter() - start)
+        METRICS.inc("juhe_http_requests_total", {"route": route, "platform": platform, "code": code})
+    return resp
+
+async def _open_client(app: web.Application) -> None:
+    connector = aiohttp.TCPConnector(limit=0, limit_per_host=CFG.http_pool_size, keepalive_timeout=60)
+    # DummyCookieJar: upstream Set-Cookie must not leak between requests
+    app["client"] = aiohttp.ClientSession(connector=connector, cookie_jar=aiohttp.DummyCookieJar())
+
+async def _close_client(app: web.Application) -> None:
+    await app["client"].close()
+
+def make_app() -> web.Application:
+    app = web.Application(middlewares=[record_request])
+    app.on_startup.append(_open_client)
+    app.on_cleanup.append(_close_client)
+    app.router.add_get("/parse", parse_route)
+    app.router.add_get("/search", search_route)
+    app.router.add_get("/playlist", playlist_route)
+    app.router.add_get("/urls", urls_route)
+    app.router.add_get("/health", health)
+    app.router.add_get("/metrics", metrics_route)
+    return app
+
+if __name__ == "__main__":
+    web.run_app(make_app(), host=CFG.host, port=CFG.port)
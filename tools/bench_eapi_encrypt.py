@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""Micro-benchmark for Netease eapi parameter encryption.
+
+Compares the original per-request CryptoUtils.encrypt_params (payload dumped
+twice, fresh padder and cipher, byte-by-byte hex) with the current
+encrypt_params and the batched encrypt_many, on url/v1 payloads like the
+ones wyy_parse builds. Outputs are checked to be identical first.
+
+    python tools/bench_eapi_encrypt.py
+    python tools/bench_eapi_encrypt.py --payloads 7 --rounds 5000
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+import time
+import urllib.parse
+from hashlib import md5
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Tuple
+
+from cryptography.hazmat.primitives import padding
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "网易云解析" / "Netease_url-main"))
+
+from music_api import APIConstants, CryptoUtils, NeteaseAPI  # noqa: E402
+
+LEVELS = ["standard", "exhigh", "lossless", "hires", "sky", "jyeffect", "jymaster"]
+
+
+def legacy_encrypt_params(url: str, payload: Dict[str, Any]) -> str:
+    """CryptoUtils.encrypt_params before encrypt_many existed."""
+    url_path = urllib.parse.urlparse(url).path.replace("/eapi/", "/api/")
+    digest = "".join([hex(d)[2:].zfill(2) for d in md5(
+        f"nobody{url_path}use{json.dumps(payload)}md5forencrypt".encode("utf-8")).digest()])
+    params = f"{url_path}-36cd479b6b5-{json.dumps(payload)}-36cd479b6b5-{digest}"
+    padder = padding.PKCS7(algorithms.AES(APIConstants.AES_KEY).block_size).padder()
+    padded_data = padder.update(params.encode()) + padder.finalize()
+    cipher = Cipher(algorithms.AES(APIConstants.AES_KEY), modes.ECB())
+    encryptor = cipher.encryptor()
+    enc = encryptor.update(padded_data) + encryptor.finalize()
+    return "".join([hex(d)[2:].zfill(2) for d in enc])
+
+
+def make_batch(n: int) -> List[Tuple[str, Dict[str, Any]]]:
+    return [
+        (APIConstants.SONG_URL_V1, NeteaseAPI.song_url_payload(1901371647 + i // len(LEVELS), LEVELS[i % len(LEVELS)]))
+        for i in range(n)
+    ]
+
+
+def timed(fn: Callable[[], Any], rounds: int) -> float:
+    start = time.perf_counter()
+    for _ in range(rounds):
+        fn()
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--payloads", type=int, default=7, help="payloads per batch (7 = one wyy_parse)")
+    ap.add_argument("--rounds", type=int, default=2000, help="batches per measurement")
+    ap.add_argument("--repeat", type=int, default=5, help="measurements; the best one is reported")
+    args = ap.parse_args()
+
+    batch = make_batch(args.payloads)
+    expected = [legacy_encrypt_params(u, p) for u, p in batch]
+    assert [CryptoUtils.encrypt_params(u, p) for u, p in batch] == expected, "encrypt_params output changed"
+    assert CryptoUtils.encrypt_many(batch) == expected, "encrypt_many output differs"
+
+    cases = {
+        "legacy encrypt_params": lambda: [legacy_encrypt_params(u, p) for u, p in batch],
+        "encrypt_params": lambda: [CryptoUtils.encrypt_params(u, p) for u, p in batch],
+        "encrypt_many": lambda: CryptoUtils.encrypt_many(batch),
+    }
+    total = args.payloads * args.rounds
+    baseline = None
+    print(f"{args.payloads} payloads x {args.rounds} rounds, best of {args.repeat}")
+    for name, fn in cases.items():
+        best = min(timed(fn, args.rounds) for _ in range(args.repeat))
+        per_payload = best / total * 1e6
+        baseline = baseline or per_payload
+        print(f"{name:<24}{per_payload:>9.2f} us/payload{baseline / per_payload:>8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,504 @@
+#!/usr/bin/env python3
+"""Offline load test for server.py / server_async.py.
+
+Starts local stand-ins for every upstream the parse/search/playlist paths
+touch (Netease eapi url/v1 and batch, song, playlist and album detail, lyric,
+cloudsearch, u.y.qq.com musicu.fcg, the QQ bridge and the qishui 8372
+service), points an in-process server at them and drives /parse, /search
+and /playlist at a fixed request rate. Latency is measured from each
+request's scheduled start, so a server that falls behind shows up in the
+percentiles instead of slowing the load down.
+
+    python tools/bench_server.py --rps 200 --duration 20
+    python tools/bench_server.py --mode async --latency-ms 80 --error-rate 0.02
+    python tools/bench_server.py --mix parse=1 --ids 50 --json out.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import logging
+import os
+import random
+import socket
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+from urllib.parse import parse_qs, urlencode, urlsplit
+
+ROOT = Path(__file__).resolve().parents[1]
+
+CST = timezone(timedelta(hours=8))
+
+
+def mock_song(song_id: int) -> Dict[str, Any]:
+    return {
+        "id": song_id,
+        "name": f"Song {song_id}",
+        "ar": [{"name": f"Artist {song_id % 50}"}],
+        "al": {"name": f"Album {song_id % 200}", "picUrl": f"http://mock.invalid/pic/{song_id}.jpg"},
+    }
+
+
+def eapi_payload(params: str) -> Dict[str, Any]:
+    """Plaintext payload of encrypted eapi params ({} if they cannot be read)."""
+    from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+
+    try:
+        decryptor = Cipher(algorithms.AES(b"e82ckenh8dichen8"), modes.ECB()).decryptor()
+        plain = decryptor.update(bytes.fromhex(params)) + decryptor.finalize()
+        return json.loads(plain[:-plain[-1]].decode("utf-8").split("-36cd479b6b5-")[1])
+    except (ValueError, IndexError):
+        return {}
+
+
+def eapi_ids(params: str) -> List[int]:
+    """Song ids inside encrypted url/v1 params ([] if they cannot be read)."""
+    try:
+        return [int(i) for i in eapi_payload(params)["ids"]]
+    except (KeyError, TypeError, ValueError):
+        return []
+
+
+class MockUpstreams(ThreadingHTTPServer):
+    """One HTTP server answering for every upstream; paths tell them apart."""
+
+    daemon_threads = True
+
+    def __init__(self, latency_ms: float, jitter_ms: float, error_rate: float, playlist_size: int) -> None:
+        super().__init__(("127.0.0.1", 0), MockHandler)
+        self.latency = latency_ms / 1000.0
+        self.jitter = jitter_ms / 1000.0
+        self.error_rate = error_rate
+        self.playlist_size = playlist_size
+        self.lock = threading.Lock()
+        self.calls: Dict[str, int] = {}
+        self.errors: Dict[str, int] = {}
+
+    @property
+    def base(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def count(self, name: str, failed: bool) -> None:
+        with self.lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+            if failed:
+                self.errors[name] = self.errors.get(name, 0) + 1
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, so the server's pools are exercised
+    server: MockUpstreams
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+    def _reply(self, obj: Any, status: int = 200) -> None:
+        body = json.dumps(obj).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        trace_id = self.headers.get("X-Trace-Id")
+        if trace_id:
+            self.send_header("X-Trace-Id", trace_id)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _form(self) -> Dict[str, str]:
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length).decode("utf-8", errors="replace") if length else ""
+        if self.headers.get("Content-Type", "").startswith("application/json"):
+            return json.loads(raw or "{}")
+        return {k: v[0] for k, v in parse_qs(raw).items()}
+
+    def _simulate(self, name: str) -> bool:
+        """Sleep the configured latency; True when this call should fail."""
+        srv = self.server
+        time.sleep(srv.latency + random.uniform(0, srv.jitter))
+        failed = random.random() < srv.error_rate
+        srv.count(name, failed)
+        if failed:
+            self._reply({"code": 500, "message": "injected failure"}, 500)
+        return failed
+
+    def do_GET(self) -> None:
+        parts = urlsplit(self.path)
+        query = {k: v[0] for k, v in parse_qs(parts.query).items()}
+        if parts.path == "/health":
+            self._reply({"status": "ok", "pid": os.getpid(), "port": self.server.server_address[1]})
+        elif parts.path == "/cgi-bin/musicu.fcg":
+            if not self._simulate("qq_musicu"):
+                self._reply(self._qq_search(query))
+        elif parts.path == "/track":
+            if not self._simulate("qishui"):
+                self._reply(self._qishui_track(query.get("id", "0")))
+        elif parts.path.startswith("/api/v1/album/"):
+            if not self._simulate("wyy_album"):
+                aid = int(parts.path.rsplit("/", 1)[-1] or 0)
+                ids = [aid * 100 + i for i in range(12)]
+                self._reply({"code": 200, "album": {"id": aid, "name": f"Album {aid}", "artist": {"name": "mock"}},
+                             "songs": [mock_song(i) for i in ids]})
+        else:
+            self._reply({"error": "not found"}, 404)
+
+    def do_POST(self) -> None:
+        path = urlsplit(self.path).path
+        form = self._form()
+        if path == "/":
+            if not self._simulate("qq_bridge"):
+                self._reply(self._qq_bridge(str(form.get("url", ""))))
+        elif path.endswith("/player/url/v1"):
+            if not self._simulate("wyy_eapi"):
+                self._reply(self._wyy_url(eapi_ids(str(form.get("params", "")))))
+        elif path == "/api/v3/song/detail":
+            if not self._simulate("wyy_detail"):
+                self._reply(self._wyy_detail(str(form.get("c") or "[]")))
+        elif path == "/api/song/lyric":
+            if not self._simulate("wyy_lyric"):
+                self._reply(self._wyy_lyric(int(form.get("id") or 0)))
+        elif path == "/eapi/batch":
+            if not self._simulate("wyy_batch"):
+                self._reply(self._wyy_batch(eapi_payload(str(form.get("params", "")))))
+        elif path == "/api/cloudsearch/pc":
+            if not self._simulate("wyy_search"):
+                limit = int(form.get("limit") or 10)
+                seed = abs(hash(form.get("s", ""))) % 100000
+                self._reply({"code": 200, "result": {"songs": [mock_song(seed + i) for i in range(limit)]}})
+        elif path == "/api/v6/playlist/detail":
+            if not self._simulate("wyy_playlist"):
+                pid = int(form.get("id") or 0)
+                self._reply({"code": 200, "playlist": {
+                    "id": pid,
+                    "name": f"Playlist {pid}",
+                    "coverImgUrl": "http://mock.invalid/cover.jpg",
+                    "creator": {"nickname": "mock"},
+                    "trackCount": self.server.playlist_size,
+                    "trackIds": [{"id": pid * 10000 + i} for i in range(self.server.playlist_size)],
+                }})
+        else:
+            self._reply({"error": "not found"}, 404)
+
+    @staticmethod
+    def _wyy_detail(c: str) -> Dict[str, Any]:
+        ids = [int(x["id"]) for x in json.loads(c)]
+        return {
+            "code": 200,
+            "songs": [mock_song(i) for i in ids],
+            "privileges": [{"id": i, "plLevel": "lossless", "maxBrLevel": "hires"} for i in ids],
+        }
+
+    @staticmethod
+    def _wyy_lyric(song_id: int) -> Dict[str, Any]:
+        return {"code": 200, "lrc": {"lyric": f"[00:00.00]Song {song_id}\n"}, "tlyric": {"lyric": ""}}
+
+    def _wyy_batch(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """/eapi/batch: each "/api/..." key carries one sub-request's JSON params."""
+        result: Dict[str, Any] = {"code": 200}
+        for path, raw in payload.items():
+            if not path.startswith("/api/"):
+                continue
+            params = json.loads(raw)
+            if path == "/api/v3/song/detail":
+                result[path] = self._wyy_detail(params.get("c") or "[]")
+            elif path == "/api/song/lyric":
+                result[path] = self._wyy_lyric(int(params.get("id") or 0))
+            elif path.endswith("/player/url/v1"):
+                result[path] = self._wyy_url([int(i) for i in json.loads(params.get("ids") or "[]")])
+            else:
+                result[path] = {"code": 404, "message": "not mocked"}
+        return result
+
+    @staticmethod
+    def _wyy_url(ids: List[int]) -> Dict[str, Any]:
+        # Same signed-path shape as the real CDN so parse_result_ttl applies.
+        stamp = (datetime.now(CST) + timedelta(minutes=20)).strftime("%Y%m%d%H%M%S")
+        return {"code": 200, "data": [{
+            "id": song_id,
+            "url": f"http://m801.music.126.net/{stamp}/mock/{random.getrandbits(32):08x}.flac",
+            "br": 999000,
+            "size": 30000000,
+            "type": "flac",
+        } for song_id in ids or [0]]}
+
+    @staticmethod
+    def _qq_search(query: Dict[str, str]) -> Dict[str, Any]:
+        param = json.loads(query.get("data") or "{}").get("search", {}).get("param", {})
+        limit = int(param.get("num_per_page") or 10)
+        seed = abs(hash(param.get("query", ""))) % 100000
+        songs = [{
+            "mid": f"00{seed + i:012d}",
+            "name": f"Song {seed + i}",
+            "singer": [{"name": f"Artist {(seed + i) % 50}"}],
+            "album": {"mid": f"A{seed + i}"},
+        } for i in range(limit)]
+        return {"search": {"data": {"body": {"song": {"list": songs}}}}}
+
+    @staticmethod
+    def _qq_bridge(url: str) -> Dict[str, Any]:
+        mid = url.rstrip("/").rsplit("/", 1)[-1]
+        vkey = f"{random.getrandbits(64):016x}"
+        return {
+            "music_info": {"mid": mid},
+            "music_url": {
+                q: {"url": f"http://isure.stream.qqmusic.qq.com/{q}{mid}?vkey={vkey}", "bitrate": q}
+                for q in ("flac", "320", "128")
+            },
+        }
+
+    @staticmethod
+    def _qishui_track(track_id: str) -> Dict[str, Any]:
+        url = f"http://mock.invalid/qishui/{track_id}.m4a"
+        return {
+            "track_id": track_id,
+            "name": f"Track {track_id}",
+            "audio_urls": {"lossless": {"play_url": url, "raw_url": url, "is_encrypted": False, "spade_a": None}},
+        }
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def configure_env(mock: MockUpstreams, workdir: Path, trace: bool) -> None:
+    """Point server.py at the mocks; must run before server is imported."""
+    port = str(mock.server_address[1])
+    os.environ["QQ_BRIDGE_SPAWN"] = "0"
+    os.environ["QQ_BRIDGE_PORTS"] = port
+    os.environ["QISHUI_API"] = mock.base
+    os.environ["SHORT_LINK_DB"] = str(workdir / "short_links.sqlite3")
+    # Mock "Song N" rows must never reach the real song metadata store.
+    os.environ["NETEASE_METADATA_DB"] = str(workdir / "song_metadata.sqlite3")
+    os.environ["TRACE_LOG"] = str(workdir / "trace.jsonl")
+    os.environ["TRACE_ENABLED"] = "1" if trace else "0"
+    for platform in ("qq", "wyy"):
+        var = f"{platform.upper()}_COOKIE_PATH"
+        if not os.environ.get(var):
+            cookie = workdir / f"{platform}_cookie"
+            cookie.write_text("uin=10000; MUSIC_U=bench", encoding="utf-8")
+            os.environ[var] = str(cookie)
+
+
+def patch_upstream_urls(mock: MockUpstreams) -> None:
+    import server
+
+    sys.path.insert(0, str(server.NETEASE_DIR))
+    from music_api import APIConstants  # type: ignore
+
+    APIConstants.SONG_URL_V1 = f"{mock.base}/eapi/song/enhance/player/url/v1"
+    APIConstants.SONG_DETAIL_V3 = f"{mock.base}/api/v3/song/detail"
+    APIConstants.SEARCH_API = f"{mock.base}/api/cloudsearch/pc"
+    APIConstants.PLAYLIST_DETAIL_API = f"{mock.base}/api/v6/playlist/detail"
+    APIConstants.ALBUM_DETAIL_API = f"{mock.base}/api/v1/album/"
+    APIConstants.LYRIC_API = f"{mock.base}/api/song/lyric"
+    APIConstants.BATCH_API = f"{mock.base}/eapi/batch"
+    server.QQ_SEARCH_URL = f"{mock.base}/cgi-bin/musicu.fcg"
+
+
+def start_threaded() -> str:
+    import server
+    from werkzeug.serving import make_server
+
+    srv = make_server("127.0.0.1", 0, server.APP, threaded=True)
+    threading.Thread(target=srv.serve_forever, name="bench-server", daemon=True).start()
+    return f"http://127.0.0.1:{srv.server_port}"
+
+
+def start_async() -> str:
+    import asyncio
+
+    from aiohttp import web
+
+    import server_async
+
+    port = free_port()
+    ready = threading.Event()
+
+    def run() -> None:
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        runner = web.AppRunner(server_async.make_app())
+        loop.run_until_complete(runner.setup())
+        loop.run_until_complete(web.TCPSite(runner, "127.0.0.1", port).start())
+        ready.set()
+        loop.run_forever()
+
+    threading.Thread(target=run, name="bench-server", daemon=True).start()
+    ready.wait(10)
+    return f"http://127.0.0.1:{port}"
+
+
+def parse_mix(spec: str) -> List[Tuple[str, float]]:
+    mix = []
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in ("parse", "search", "playlist"):
+            raise SystemExit(f"unknown endpoint in --mix: {name}")
+        mix.append((name, float(weight or 1)))
+    return mix
+
+
+def build_request(kind: str, ids: int, rng: random.Random) -> Tuple[str, str]:
+    """(label, path) for one request of the given kind."""
+    n = rng.randrange(ids)
+    if kind == "parse":
+        platform = rng.choice(("wyy", "qq", "qishui"))
+        url = {
+            "wyy": f"https://music.163.com/song?id={100000 + n}",
+            "qq": f"https://y.qq.com/n/ryqq/songDetail/00{n:012d}",
+            "qishui": f"https://music.douyin.com/qishui/share/track?track_id={700000 + n}",
+        }[platform]
+        return f"parse:{platform}", "/parse?" + urlencode({"url": url, "quality": "lossless"})
+    if kind == "search":
+        platform = rng.choice(("qq", "wyy", "all"))
+        return f"search:{platform}", f"/search?platform={platform}&keyword=artist{n % 200}&limit=20"
+    return "playlist", f"/playlist?id={1 + n % 100}&limit=100"
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    k = min(len(sorted_values) - 1, max(0, int(round(pct / 100.0 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[k]
+
+
+def run_load(base: str, rps: float, duration: float, mix: List[Tuple[str, float]], ids: int,
+             concurrency: int, timeout: float, seed: int) -> Tuple[List[Tuple[str, float, bool]], float]:
+    import requests
+
+    rng = random.Random(seed)
+    names = [m[0] for m in mix]
+    weights = [m[1] for m in mix]
+    local = threading.local()
+    results: List[Tuple[str, float, bool]] = []
+    lock = threading.Lock()
+
+    def fire(label: str, path: str, scheduled: float) -> None:
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+        ok = False
+        try:
+            r = session.get(base + path, timeout=timeout)
+            ok = r.status_code == 200 and r.json().get("code") == 200
+        except Exception:
+            ok = False
+        latency = time.perf_counter() - scheduled
+        with lock:
+            results.append((label, latency, ok))
+
+    total = int(rps * duration)
+    interval = 1.0 / rps
+    pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="bench-client")
+    start = time.perf_counter()
+    for i in range(total):
+        scheduled = start + i * interval
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        label, path = build_request(rng.choices(names, weights)[0], ids, rng)
+        pool.submit(fire, label, path, scheduled)
+    pool.shutdown(wait=True)
+    return results, time.perf_counter() - start
+
+
+def summarize(results: List[Tuple[str, float, bool]], elapsed: float) -> Dict[str, Dict[str, float]]:
+    groups: Dict[str, List[Tuple[float, bool]]] = {}
+    for label, latency, ok in results:
+        groups.setdefault(label, []).append((latency, ok))
+        groups.setdefault("total", []).append((latency, ok))
+    report = {}
+    for label, rows in sorted(groups.items(), key=lambda kv: (kv[0] == "total", kv[0])):
+        lat = sorted(r[0] * 1000 for r in rows)
+        errors = sum(1 for r in rows if not r[1])
+        report[label] = {
+            "count": len(rows),
+            "errors": errors,
+            "error_rate": round(errors / len(rows), 4),
+            "throughput": round(len(rows) / elapsed, 2),
+            "p50_ms": round(percentile(lat, 50), 2),
+            "p95_ms": round(percentile(lat, 95), 2),
+            "p99_ms": round(percentile(lat, 99), 2),
+            "max_ms": round(lat[-1], 2),
+        }
+    return report
+
+
+def print_report(report: Dict[str, Dict[str, float]]) -> None:
+    cols = ("count", "errors", "error_rate", "throughput", "p50_ms", "p95_ms", "p99_ms", "max_ms")
+    print(f"{'endpoint':<16}" + "".join(f"{c:>12}" for c in cols))
+    for label, row in report.items():
+        print(f"{label:<16}" + "".join(f"{row[c]:>12g}" for c in cols))
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--mode", choices=("threaded", "async"), default="threaded", help="server.py or server_async.py")
+    ap.add_argument("--rps", type=float, default=100, help="target request rate")
+    ap.add_argument("--duration", type=float, default=10, help="seconds of load")
+    ap.add_argument("--warmup", type=float, default=2, help="seconds of unrecorded load first")
+    ap.add_argument("--mix", default="parse=6,search=3,playlist=1", help="endpoint weights")
+    ap.add_argument("--ids", type=int, default=1000, help="distinct songs/keywords; fewer means more cache hits")
+    ap.add_argument("--concurrency", type=int, default=256, help="max in-flight client requests")
+    ap.add_argument("--timeout", type=float, default=30, help="client timeout per request")
+    ap.add_argument("--latency-ms", type=float, default=30, help="mock upstream base latency")
+    ap.add_argument("--jitter-ms", type=float, default=20, help="extra uniform random mock latency")
+    ap.add_argument("--error-rate", type=float, default=0.0, help="fraction of mock calls answering HTTP 500")
+    ap.add_argument("--playlist-size", type=int, default=300, help="trackIds per mock playlist")
+    ap.add_argument("--trace", action="store_true", help="keep request tracing enabled")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--json", dest="json_out", help="also write the report to this file")
+    ap.add_argument("--server-logs", action="store_true", help="show the server's own prints")
+    args = ap.parse_args()
+
+    mock = MockUpstreams(args.latency_ms, args.jitter_ms, args.error_rate, args.playlist_size)
+    threading.Thread(target=mock.serve_forever, name="bench-mock", daemon=True).start()
+
+    workdir = Path(tempfile.mkdtemp(prefix="juhe-bench-"))
+    configure_env(mock, workdir, args.trace)
+    sys.path.insert(0, str(ROOT))
+
+    quiet = contextlib.nullcontext()
+    if not args.server_logs:
+        logging.getLogger("werkzeug").setLevel(logging.ERROR)
+        logging.getLogger("aiohttp.access").setLevel(logging.ERROR)
+        quiet = contextlib.redirect_stdout(io.StringIO())
+    with quiet:
+        patch_upstream_urls(mock)
+        base = start_threaded() if args.mode == "threaded" else start_async()
+        mix = parse_mix(args.mix)
+        if args.warmup > 0:
+            print(f"[bench] warmup {args.warmup:g}s", file=sys.stderr)
+            run_load(base, args.rps, args.warmup, mix, args.ids, args.concurrency, args.timeout, args.seed + 1)
+        print(f"[bench] {args.mode} server at {base}: {args.rps:g} rps for {args.duration:g}s", file=sys.stderr)
+        results, elapsed = run_load(base, args.rps, args.duration, mix, args.ids, args.concurrency, args.timeout, args.seed)
+
+    import server
+
+    report = summarize(results, elapsed)
+    print_report(report)
+    print(f"\nupstream calls: {json.dumps(mock.calls, sort_keys=True)}")
+    if mock.errors:
+        print(f"injected errors: {json.dumps(mock.errors, sort_keys=True)}")
+    print(f"parse cache: {json.dumps(server.PARSE_CACHE.stats())}")
+    print(f"search cache: {json.dumps(server.SEARCH_CACHE.stats())}")
+    print("breakers: " + json.dumps({k: u.stats()["state"] for k, u in server.UPSTREAMS.items()}, sort_keys=True))
+    if args.json_out:
+        Path(args.json_out).write_text(json.dumps({
+            "args": vars(args),
+            "report": report,
+            "upstream_calls": mock.calls,
+            "injected_errors": mock.errors,
+        }, indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
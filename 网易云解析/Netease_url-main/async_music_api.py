@@ -0,0 +1,224 @@
+"""网易云音乐异步API模块
+
+AsyncNeteaseAPI 提供与 NeteaseAPI 相同的接口（协程版本）：
+- 音乐URL获取
+- 歌曲详情获取
+- 歌词获取
+- 搜索功能
+- 歌单和专辑详情
+
+所有请求共用一个 aiohttp.ClientSession（连接池 + keep-alive），加密参数、
+响应解析和歌曲元数据存储与 NeteaseAPI 共用，单线程即可并发发起大量请求。
+"""
+
+import asyncio
+import json
+from typing import Any, Dict, List, Optional
+
+import aiohttp
+
+from metadata_store import MetadataStore
+from music_api import APIConstants, APIException, NeteaseAPI
+
+
+class AsyncNeteaseAPI:
+    """网易云音乐API异步客户端
+
+    须在事件循环内使用；用完调用 close()，或以 ``async with`` 管理生命周期。
+    """
+
+    def __init__(self, session: Optional[aiohttp.ClientSession] = None, pool_size: int = 100,
+                 metadata_store: Optional[MetadataStore] = None):
+        """
+        Args:
+            session: 外部传入的 ClientSession（由调用方负责关闭），为空时按需创建
+            pool_size: 自建 session 时每个主机的最大连接数
+            metadata_store: 歌曲元数据存储，默认与 NeteaseAPI 相同
+        """
+        self._session = session
+        self._owns_session = session is None
+        self.pool_size = pool_size
+        # 复用同步客户端的参数构造、响应解析和元数据存储（不经由它发请求，
+        # 也就不会创建它的连接池）；元数据存储读写是阻塞的 SQLite，放到线程里执行
+        self.api = NeteaseAPI(metadata_store=metadata_store)
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=0, limit_per_host=self.pool_size, keepalive_timeout=60)
+            # DummyCookieJar: 不保存响应下发的 cookie，不同账号的请求互不影响
+            self._session = aiohttp.ClientSession(connector=connector, cookie_jar=aiohttp.DummyCookieJar())
+            self._owns_session = True
+        return self._session
+
+    async def close(self) -> None:
+        """关闭自建的 session"""
+        if self._owns_session and self._session is not None:
+            await self._session.close()
+
+    async def __aenter__(self) -> "AsyncNeteaseAPI":
+        return self
+
+    async def __aexit__(self, *exc: Any) -> None:
+        await self.close()
+
+    async def _request_text(self, method: str, url: str, what: str, timeout: float, **kwargs: Any) -> str:
+        """发送请求并返回响应文本"""
+        try:
+            async with self.session.request(
+                method, url, timeout=aiohttp.ClientTimeout(total=timeout), **kwargs
+            ) as response:
+                response.raise_for_status()
+                return await response.text()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise APIException(f"{what}请求失败: {e!r}")
+
+    async def _request(self, method: str, url: str, what: str, timeout: float, **kwargs: Any) -> Any:
+        """发送请求并返回解析后的 JSON"""
+        text = await self._request_text(method, url, what, timeout, **kwargs)
+        try:
+            return json.loads(text)
+        except json.JSONDecodeError as e:
+            raise APIException(f"解析{what}响应失败: {e}")
+
+    @staticmethod
+    def _headers() -> Dict[str, str]:
+        return {'User-Agent': APIConstants.USER_AGENT, 'Referer': APIConstants.REFERER}
+
+    async def get_song_url(self, song_id: int, quality: str, cookies: Dict[str, str],
+                           timeout: float = 30) -> Dict[str, Any]:
+        """获取歌曲播放URL，参数与 NeteaseAPI.get_song_url 相同"""
+        request_cookies = APIConstants.DEFAULT_COOKIES.copy()
+        request_cookies.update(cookies)
+        params = self.api.build_song_url_params(song_id, quality)
+        response_text = await self._request_text('POST', APIConstants.SONG_URL_V1, "获取歌曲URL", timeout,
+                                                 data={'params': params}, headers=self._headers(),
+                                                 cookies=request_cookies)
+        try:
+            return self.api.parse_song_url_response(response_text)
+        except (json.JSONDecodeError, KeyError) as e:
+            raise APIException(f"解析响应数据失败: {e}")
+
+    async def get_song_urls(self, song_ids: List[int], quality: str, cookies: Dict[str, str],
+                            timeout: float = 30, batch_size: int = 200) -> Dict[int, Dict[str, Any]]:
+        """批量获取歌曲播放URL，参数与 NeteaseAPI.get_song_urls 相同（各批次并发请求）"""
+        request_cookies = APIConstants.DEFAULT_COOKIES.copy()
+        request_cookies.update(cookies)
+        ids = list(dict.fromkeys(int(sid) for sid in song_ids))
+        batch_size = max(1, batch_size)
+        batches = [ids[i:i + batch_size] for i in range(0, len(ids), batch_size)]
+        params = self.api.crypto_utils.encrypt_many(
+            [(APIConstants.SONG_URL_V1, self.api.songs_url_payload(batch, quality)) for batch in batches]
+        )
+
+        async def fetch(batch_params: str) -> List[Dict[str, Any]]:
+            response_text = await self._request_text('POST', APIConstants.SONG_URL_V1, "获取歌曲URL", timeout,
+                                                     data={'params': batch_params}, headers=self._headers(),
+                                                     cookies=request_cookies)
+            try:
+                return self.api.parse_song_url_response(response_text).get('data') or []
+            except (json.JSONDecodeError, KeyError) as e:
+                raise APIException(f"解析响应数据失败: {e}")
+
+        results = await asyncio.gather(*(fetch(p) for p in params))
+        return self.api.index_song_urls(ids, [item for batch in results for item in batch])
+
+    async def get_song_detail(self, song_id: int, cookies: Optional[Dict[str, str]] = None,
+                              timeout: float = 30, cached: bool = False) -> Dict[str, Any]:
+        """获取歌曲详细信息，参数与 NeteaseAPI.get_song_detail 相同"""
+        if cached:
+            song = (await asyncio.to_thread(self.api.lookup_songs, [song_id])).get(int(song_id))
+            if song is not None:
+                return {'code': 200, 'songs': [song], 'privileges': []}
+
+        data = {'c': json.dumps([{"id": song_id, "v": 0}])}
+        result = self.api.parse_song_detail_response(
+            await self._request('POST', APIConstants.SONG_DETAIL_V3, "获取歌曲详情", timeout,
+                                data=data, cookies=cookies)
+        )
+        await asyncio.to_thread(self.api.remember_songs, result.get('songs') or [])
+        return result
+
+    async def get_lyric(self, song_id: int, cookies: Dict[str, str], timeout: float = 30) -> Dict[str, Any]:
+        """获取歌词信息"""
+        return self.api.parse_lyric_response(
+            await self._request('POST', APIConstants.LYRIC_API, "获取歌词", timeout,
+                                data=self.api.lyric_form(song_id), headers=self._headers(), cookies=cookies)
+        )
+
+    async def search_music(self, keywords: str, cookies: Dict[str, str], limit: int = 10,
+                           timeout: float = 30) -> List[Dict[str, Any]]:
+        """搜索音乐"""
+        result = await self._request('POST', APIConstants.SEARCH_API, "搜索", timeout,
+                                     data={'s': keywords, 'type': 1, 'limit': limit},
+                                     headers=self._headers(), cookies=cookies)
+        try:
+            return self.api.parse_search_response(result)
+        except KeyError as e:
+            raise APIException(f"解析搜索响应失败: {e}")
+
+    async def get_playlist_info(self, playlist_id: int, cookies: Dict[str, str],
+                                timeout: float = 30) -> Dict[str, Any]:
+        """获取歌单基本信息及全部歌曲ID（不含歌曲详情）"""
+        result = await self._request('POST', APIConstants.PLAYLIST_DETAIL_API, "获取歌单详情", timeout,
+                                     data={'id': playlist_id}, headers=self._headers(), cookies=cookies)
+        try:
+            return self.api.parse_playlist_info_response(result)
+        except KeyError as e:
+            raise APIException(f"解析歌单详情响应失败: {e}")
+
+    async def get_songs_detail(self, song_ids: List[int], cookies: Dict[str, str],
+                               timeout: float = 30) -> List[Dict[str, Any]]:
+        """批量获取歌曲详情（歌单曲目格式，只为元数据存储中没有的歌曲发请求）"""
+        known = await asyncio.to_thread(self.api.lookup_songs, song_ids)
+        missing = [int(sid) for sid in song_ids if int(sid) not in known]
+        if missing:
+            result = await self._request('POST', APIConstants.SONG_DETAIL_V3, "获取歌曲详情", timeout,
+                                         data={'c': json.dumps([{'id': sid, 'v': 0} for sid in missing])},
+                                         headers=self._headers(), cookies=cookies)
+            fetched = self.api.parse_song_detail_response(result).get('songs', [])
+            await asyncio.to_thread(self.api.remember_songs, fetched)
+            known.update((int(song['id']), song) for song in fetched)
+        try:
+            return [self.api.format_track(known[int(sid)]) for sid in song_ids if int(sid) in known]
+        except KeyError as e:
+            raise APIException(f"解析歌曲详情响应失败: {e}")
+
+    async def get_playlist_detail(self, playlist_id: int, cookies: Dict[str, str], timeout: float = 30,
+                                  chunk_size: int = 100, max_concurrency: int = 8,
+                                  retries: int = 1) -> Dict[str, Any]:
+        """获取歌单详情；歌曲详情分块并发获取，失败的分块单独重试"""
+        info = await self.get_playlist_info(playlist_id, cookies, timeout)
+        track_ids = info.pop('trackIds')
+        info.pop('trackVersions')
+
+        semaphore = asyncio.Semaphore(max(1, max_concurrency))
+        chunk_size = max(1, chunk_size)
+
+        async def fetch_chunk(ids: List[int]) -> List[Dict[str, Any]]:
+            async with semaphore:
+                for attempt in range(retries + 1):
+                    try:
+                        return await self.get_songs_detail(ids, cookies, timeout)
+                    except APIException:
+                        if attempt >= retries:
+                            raise
+                        await asyncio.sleep(0.2 * (2 ** attempt))
+            return []
+
+        chunks = await asyncio.gather(*(
+            fetch_chunk(track_ids[i:i + chunk_size]) for i in range(0, len(track_ids), chunk_size)
+        ))
+        info['tracks'] = [t for chunk in chunks for t in chunk]
+        return info
+
+    async def get_album_detail(self, album_id: int, cookies: Dict[str, str],
+                               timeout: float = 30) -> Dict[str, Any]:
+        """获取专辑详情"""
+        result = await self._request('GET', f'{APIConstants.ALBUM_DETAIL_API}{album_id}', "获取专辑详情",
+                                     timeout, headers=self._headers(), cookies=cookies)
+        try:
+            # parse_album_response 会写元数据存储
+            return await asyncio.to_thread(self.api.parse_album_response, result)
+        except KeyError as e:
+            raise APIException(f"解析专辑详情响应失败: {e}")
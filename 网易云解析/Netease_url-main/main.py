@@ -21,7 +21,7 @@ from flask import Flask, request, send_file, render_template, Response
 try:
     from music_api import (
         NeteaseAPI, APIException, QualityLevel,
-        url_v1, name_v1, lyric_v1, search_music, 
+        url_v1, name_v1, lyric_v1, song_bundle, search_music, 
         playlist_detail, album_detail
     )
     from cookie_manager import CookieManager, CookieException
@@ -337,10 +337,11 @@ def get_song_info():
             return APIResponse.success(result, "获取歌词成功")
         
         elif info_type == 'json':
-            # 获取完整的歌曲信息（用于前端解析）
-            song_info = name_v1(music_id)
-            url_info = url_v1(music_id, level, cookies)
-            lyric_info = lyric_v1(music_id, cookies)
+            # 获取完整的歌曲信息（用于前端解析），详情、URL、歌词合并为一次请求
+            bundle = song_bundle(music_id, level, cookies)
+            song_info = bundle['detail']
+            url_info = bundle['url']
+            lyric_info = bundle['lyric']
             
             if not song_info or 'songs' not in song_info or not song_info['songs']:
                 return APIResponse.error("未找到歌曲信息", 404)
@@ -512,7 +513,7 @@ def download_music_api():
         cookies = api_service._get_cookies()
         
         # 获取音乐基本信息
-        song_info = name_v1(music_id)
+        song_info = name_v1(music_id, cached=True)
         if not song_info or 'songs' not in song_info or not song_info['songs']:
             return APIResponse.error("未找到音乐信息", 404)
         
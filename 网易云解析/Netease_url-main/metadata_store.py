@@ -0,0 +1,140 @@
+"""歌曲元数据持久化存储模块
+
+以 (平台, 歌曲ID) 为键，在本地 SQLite（WAL 模式）中保存歌曲的不变信息：
+歌名、歌手、专辑、封面、时长等。详情、歌单、专辑和下载器的查询先读本地，
+只为未见过或记录已超过 max_age 的歌曲请求接口，改名、换封面最终会被刷新。
+多线程、多进程可共用同一个数据库文件。
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+# 单条 SQL 中 IN (...) 的最大参数数
+LOOKUP_CHUNK = 500
+# 记录默认的有效期（秒）
+DEFAULT_MAX_AGE = 7 * 24 * 3600
+
+
+class MetadataStore:
+    """歌曲元数据存储"""
+
+    def __init__(self, db_path: Path, max_age: float = DEFAULT_MAX_AGE):
+        """
+        Args:
+            db_path: SQLite 数据库文件路径（目录不存在时自动创建）
+            max_age: 记录的有效期（秒），过期的记录视为未命中；0 表示永不过期
+        """
+        self.db_path = Path(db_path)
+        self.max_age = max_age
+        self._db: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+
+    @classmethod
+    def default(cls) -> "MetadataStore":
+        """默认存储：NETEASE_METADATA_DB 指定的文件，否则为模块目录下 cache/song_metadata.sqlite3；
+        有效期取 NETEASE_METADATA_MAX_AGE（秒）"""
+        path = os.getenv("NETEASE_METADATA_DB") or Path(__file__).resolve().parent / "cache" / "song_metadata.sqlite3"
+        return cls(Path(path), float(os.getenv("NETEASE_METADATA_MAX_AGE", str(DEFAULT_MAX_AGE))))
+
+    def _conn(self) -> sqlite3.Connection:
+        if self._db is None:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            db = sqlite3.connect(str(self.db_path), timeout=10, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS songs ("
+                "platform TEXT NOT NULL, song_id TEXT NOT NULL, name TEXT, artists TEXT, album TEXT, "
+                "pic_url TEXT, duration INTEGER, data TEXT NOT NULL, updated_at REAL NOT NULL, "
+                "PRIMARY KEY (platform, song_id)) WITHOUT ROWID"
+            )
+            db.commit()
+            self._db = db
+        return self._db
+
+    def upsert_many(self, platform: str, songs: Iterable[Dict[str, Any]]) -> int:
+        """批量写入歌曲元数据
+
+        Args:
+            platform: 平台标识（如 wyy）
+            songs: 歌曲详情字典，需含 id/name/ar/al，可含 dt（毫秒）
+
+        Returns:
+            写入的条数
+        """
+        now = time.time()
+        rows = []
+        for song in songs:
+            al = song.get('al') or {}
+            rows.append((
+                platform,
+                str(song['id']),
+                song.get('name', ''),
+                '/'.join(a.get('name', '') for a in song.get('ar') or []),
+                al.get('name', ''),
+                al.get('picUrl', ''),
+                int(song.get('dt') or 0),
+                json.dumps(song, ensure_ascii=False, separators=(',', ':')),
+                now,
+            ))
+        if not rows:
+            return 0
+        with self._lock:
+            db = self._conn()
+            db.executemany("INSERT OR REPLACE INTO songs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            db.commit()
+            self.writes += len(rows)
+        return len(rows)
+
+    def get_many(self, platform: str, song_ids: Iterable[Any]) -> Dict[str, Dict[str, Any]]:
+        """批量读取歌曲元数据
+
+        Args:
+            platform: 平台标识
+            song_ids: 歌曲ID列表
+
+        Returns:
+            歌曲ID（字符串）到歌曲详情字典的映射，只包含已存储且未过期的歌曲
+        """
+        ids: List[str] = list(dict.fromkeys(str(sid) for sid in song_ids))
+        found: Dict[str, Dict[str, Any]] = {}
+        min_updated = time.time() - self.max_age if self.max_age > 0 else 0.0
+        with self._lock:
+            db = self._conn()
+            for i in range(0, len(ids), LOOKUP_CHUNK):
+                chunk = ids[i:i + LOOKUP_CHUNK]
+                marks = ','.join('?' * len(chunk))
+                for song_id, data in db.execute(
+                    f"SELECT song_id, data FROM songs WHERE platform = ? AND updated_at >= ? "
+                    f"AND song_id IN ({marks})",
+                    [platform, min_updated, *chunk],
+                ):
+                    found[song_id] = json.loads(data)
+            self.hits += len(found)
+            self.misses += len(ids) - len(found)
+        return found
+
+    def get(self, platform: str, song_id: Any) -> Optional[Dict[str, Any]]:
+        """读取单首歌曲的元数据"""
+        return self.get_many(platform, [song_id]).get(str(song_id))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            size = self._conn().execute("SELECT COUNT(*) FROM songs").fetchone()[0]
+            lookups = self.hits + self.misses
+            return {
+                'size': size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'writes': self.writes,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+                'max_age': self.max_age,
+            }
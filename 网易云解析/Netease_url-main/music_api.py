@@ -10,15 +10,23 @@
 """
 
 import json
+import sqlite3
 import urllib.parse
 import time
 from random import randrange
-from typing import Dict, List, Optional, Tuple, Any
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple, Any
 from hashlib import md5
 from enum import Enum
+from http.cookiejar import DefaultCookiePolicy
 
 import requests
-from cryptography.hazmat.primitives import padding
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from metadata_store import MetadataStore
 from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
 
 
@@ -45,6 +53,7 @@ class APIConstants:
     SONG_URL_V1 = "https://interface3.music.163.com/eapi/song/enhance/player/url/v1"
     SONG_DETAIL_V3 = "https://interface3.music.163.com/api/v3/song/detail"
     LYRIC_API = "https://interface3.music.163.com/api/song/lyric"
+    BATCH_API = "https://interface3.music.163.com/eapi/batch"
     SEARCH_API = 'https://music.163.com/api/cloudsearch/pc'
     PLAYLIST_DETAIL_API = 'https://music.163.com/api/v6/playlist/detail'
     ALBUM_DETAIL_API = 'https://music.163.com/api/v1/album/'
@@ -70,10 +79,15 @@ class APIConstants:
 class CryptoUtils:
     """加密工具类"""
     
+    EAPI_SEPARATOR = "-36cd479b6b5-"
+    AES_BLOCK_SIZE = 16
+    # ECB 无 IV、各分组独立，Cipher 对象可复用，每次加密只需新建 encryptor
+    _cipher = Cipher(algorithms.AES(APIConstants.AES_KEY), modes.ECB())
+    
     @staticmethod
     def hex_digest(data: bytes) -> str:
         """将字节数据转换为十六进制字符串"""
-        return "".join([hex(d)[2:].zfill(2) for d in data])
+        return data.hex()
     
     @staticmethod
     def hash_digest(text: str) -> bytes:
@@ -83,49 +97,85 @@ class CryptoUtils:
     @staticmethod
     def hash_hex_digest(text: str) -> str:
         """计算MD5哈希值并转换为十六进制字符串"""
-        return CryptoUtils.hex_digest(CryptoUtils.hash_digest(text))
+        return md5(text.encode("utf-8")).hexdigest()
+    
+    @staticmethod
+    def _eapi_plaintext(url: str, payload: Dict[str, Any]) -> bytes:
+        """拼接 eapi 明文并做 PKCS7 填充（payload 只序列化一次）"""
+        url_path = urllib.parse.urlparse(url).path.replace("/eapi/", "/api/")
+        body = json.dumps(payload)
+        digest = md5(f"nobody{url_path}use{body}md5forencrypt".encode("utf-8")).hexdigest()
+        sep = CryptoUtils.EAPI_SEPARATOR
+        data = f"{url_path}{sep}{body}{sep}{digest}".encode()
+        pad = CryptoUtils.AES_BLOCK_SIZE - len(data) % CryptoUtils.AES_BLOCK_SIZE
+        return data + bytes((pad,)) * pad
     
     @staticmethod
     def encrypt_params(url: str, payload: Dict[str, Any]) -> str:
         """加密请求参数"""
-        url_path = urllib.parse.urlparse(url).path.replace("/eapi/", "/api/")
-        digest = CryptoUtils.hash_hex_digest(f"nobody{url_path}use{json.dumps(payload)}md5forencrypt")
-        params = f"{url_path}-36cd479b6b5-{json.dumps(payload)}-36cd479b6b5-{digest}"
+        return CryptoUtils.encrypt_many([(url, payload)])[0]
+    
+    @staticmethod
+    def encrypt_many(items: List[Tuple[str, Dict[str, Any]]]) -> List[str]:
+        """批量加密请求参数
         
-        # AES加密
-        padder = padding.PKCS7(algorithms.AES(APIConstants.AES_KEY).block_size).padder()
-        padded_data = padder.update(params.encode()) + padder.finalize()
-        cipher = Cipher(algorithms.AES(APIConstants.AES_KEY), modes.ECB())
-        encryptor = cipher.encryptor()
-        enc = encryptor.update(padded_data) + encryptor.finalize()
+        所有明文填充后拼接，由同一个 encryptor 一次加密（ECB 各分组互不影响），
+        再按各自长度切分，结果与逐个调用 encrypt_params 完全一致。
         
-        return CryptoUtils.hex_digest(enc)
+        Args:
+            items: (接口URL, payload) 列表
+            
+        Returns:
+            与输入顺序对应的加密参数列表
+        """
+        plaintexts = [CryptoUtils._eapi_plaintext(url, payload) for url, payload in items]
+        encryptor = CryptoUtils._cipher.encryptor()
+        enc = encryptor.update(b"".join(plaintexts)) + encryptor.finalize()
+        
+        out = []
+        offset = 0
+        for plaintext in plaintexts:
+            out.append(enc[offset:offset + len(plaintext)].hex())
+            offset += len(plaintext)
+        return out
 
 
 class HTTPClient:
-    """HTTP客户端类"""
+    """HTTP客户端类
+
+    持有一个带连接池的 requests.Session，同一主机的请求复用 keep-alive 连接，
+    避免每次调用都重新进行 TLS 握手。Session 不保存响应下发的 cookie，
+    不同账号按请求传入的 cookies 互不影响，可在多线程间共享。
+    """
     
-    @staticmethod
-    def post_request(url: str, params: str, cookies: Dict[str, str]) -> str:
+    def __init__(self, pool_size: int = 32, retries: int = 1):
+        """
+        Args:
+            pool_size: 每个主机保持的最大连接数
+            retries: 建立连接失败时的重试次数（请求已发出后不重试，避免重复提交）
+        """
+        self.pool_size = pool_size
+        self.session = requests.Session()
+        self.session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+        retry = Retry(total=retries, connect=retries, read=0, status=0, other=0, redirect=5)
+        adapter = HTTPAdapter(pool_connections=8, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+    
+    def post(self, url: str, **kwargs: Any) -> requests.Response:
+        """通过连接池发送POST请求"""
+        return self.session.post(url, **kwargs)
+    
+    def get(self, url: str, **kwargs: Any) -> requests.Response:
+        """通过连接池发送GET请求"""
+        return self.session.get(url, **kwargs)
+    
+    def post_request(self, url: str, params: str, cookies: Dict[str, str], timeout: float = 30) -> str:
         """发送POST请求并返回文本响应"""
-        headers = {
-            'User-Agent': APIConstants.USER_AGENT,
-            'Referer': APIConstants.REFERER,
-        }
-        
-        request_cookies = APIConstants.DEFAULT_COOKIES.copy()
-        request_cookies.update(cookies)
-        
-        try:
-            response = requests.post(url, headers=headers, cookies=request_cookies, 
-                                   data={"params": params}, timeout=30)
-            response.raise_for_status()
-            return response.text
-        except requests.RequestException as e:
-            raise APIException(f"HTTP请求失败: {e}")
+        return self.post_request_full(url, params, cookies, timeout).text
     
-    @staticmethod
-    def post_request_full(url: str, params: str, cookies: Dict[str, str]) -> requests.Response:
+    def post_request_full(self, url: str, params: str, cookies: Dict[str, str],
+                          timeout: float = 30) -> requests.Response:
         """发送POST请求并返回完整响应对象"""
         headers = {
             'User-Agent': APIConstants.USER_AGENT,
@@ -136,12 +186,16 @@ class HTTPClient:
         request_cookies.update(cookies)
         
         try:
-            response = requests.post(url, headers=headers, cookies=request_cookies, 
-                                   data={"params": params}, timeout=30)
+            response = self.post(url, headers=headers, cookies=request_cookies, 
+                                 data={"params": params}, timeout=timeout)
             response.raise_for_status()
             return response
         except requests.RequestException as e:
             raise APIException(f"HTTP请求失败: {e}")
+    
+    def close(self) -> None:
+        """关闭连接池"""
+        self.session.close()
 
 
 class APIException(Exception):
@@ -149,20 +203,144 @@ class APIException(Exception):
     pass
 
 
+class PlaylistStore:
+    """歌单快照的内存 LRU 存储，用于增量同步
+    
+    每个歌单保存最近一次看到的 trackIds 版本号（trackIds 中的 v）和已获取的
+    歌曲详情。再次打开时只需请求歌单头信息，对比 trackIds 后仅为新增或
+    版本变化的歌曲请求详情。总曲目数超过 max_tracks 时淘汰最久未访问的歌单。
+    线程安全。
+    """
+    
+    def __init__(self, max_tracks: int = 200000):
+        self.max_tracks = max(1, max_tracks)
+        self._data: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._size = 0
+        self.reused = 0
+        self.fetched = 0
+    
+    def snapshot(self, playlist_id: int, versions: Dict[int, Any]) -> Dict[int, Dict[str, Any]]:
+        """记录歌单当前的 trackIds 版本，返回仍然有效的已缓存歌曲详情
+        
+        已移出歌单或版本变化的歌曲会被丢弃。
+        """
+        with self._lock:
+            entry = self._data.pop(playlist_id, None)
+            tracks: Dict[int, Dict[str, Any]] = {}
+            if entry is not None:
+                self._size -= len(entry['tracks'])
+                old_versions = entry['versions']
+                tracks = {
+                    sid: t for sid, t in entry['tracks'].items()
+                    if sid in versions and versions[sid] == old_versions.get(sid)
+                }
+            self._data[playlist_id] = {'versions': dict(versions), 'tracks': tracks}
+            self._size += len(tracks)
+            return dict(tracks)
+    
+    def add_tracks(self, playlist_id: int, tracks: List[Dict[str, Any]]) -> None:
+        """保存新获取的歌曲详情（歌单快照需已由 snapshot 建立）"""
+        with self._lock:
+            self.fetched += len(tracks)
+            entry = self._data.get(playlist_id)
+            if entry is None:
+                return
+            for t in tracks:
+                sid = int(t['id'])
+                if sid in entry['versions'] and sid not in entry['tracks']:
+                    entry['tracks'][sid] = t
+                    self._size += 1
+            self._data.move_to_end(playlist_id)
+            while self._size > self.max_tracks and len(self._data) > 1:
+                _, evicted = self._data.popitem(last=False)
+                self._size -= len(evicted['tracks'])
+    
+    def count_reused(self, n: int) -> None:
+        with self._lock:
+            self.reused += n
+    
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'playlists': len(self._data),
+                'tracks': self._size,
+                'max_tracks': self.max_tracks,
+                'reused': self.reused,
+                'fetched': self.fetched,
+            }
+
+
 class NeteaseAPI:
-    """网易云音乐API主类"""
+    """网易云音乐API主类
     
-    def __init__(self):
-        self.http_client = HTTPClient()
+    实例持有自己的连接池（HTTPClient），应长期复用而不是每次调用新建；
+    模块级兼容函数共用 get_default_api() 返回的单例。歌曲详情的不变字段
+    写入 metadata_store，之后的详情、歌单查询优先读本地。
+    """
+    
+    METADATA_PLATFORM = 'wyy'
+    # /api/batch 返回不可用的响应后，这么多秒内直接走单独请求
+    BATCH_RETRY_AFTER = 300
+    
+    def __init__(self, http_client: Optional[HTTPClient] = None,
+                 playlist_store: Optional[PlaylistStore] = None,
+                 metadata_store: Optional[MetadataStore] = None):
+        self._http_client = http_client
+        self._http_client_lock = threading.Lock()
         self.crypto_utils = CryptoUtils()
+        self.playlist_store = playlist_store or PlaylistStore()
+        self.metadata_store = metadata_store or MetadataStore.default()
+        self._batch_disabled_until = 0.0
     
-    def get_song_url(self, song_id: int, quality: str, cookies: Dict[str, str]) -> Dict[str, Any]:
+    @property
+    def http_client(self) -> HTTPClient:
+        """连接池在第一次发请求时创建（只借用参数构造和解析的实例不会创建）"""
+        if self._http_client is None:
+            with self._http_client_lock:
+                if self._http_client is None:
+                    self._http_client = HTTPClient()
+        return self._http_client
+    
+    def song_metadata(self, song: Dict[str, Any]) -> Dict[str, Any]:
+        """提取歌曲详情中不随账号和时间变化的字段（song/detail 格式）"""
+        al = song.get('al') or {}
+        return {
+            'id': song['id'],
+            'name': song.get('name', ''),
+            'ar': [{'id': a.get('id'), 'name': a.get('name', '')} for a in song.get('ar') or []],
+            'al': {
+                'id': al.get('id'),
+                'name': al.get('name', ''),
+                'picUrl': al.get('picUrl') or self.get_pic_url(al.get('pic')),
+            },
+            'dt': song.get('dt', 0),
+            'no': song.get('no', 0),
+        }
+    
+    def remember_songs(self, songs: List[Dict[str, Any]]) -> None:
+        """将接口返回的歌曲写入元数据存储"""
+        try:
+            self.metadata_store.upsert_many(self.METADATA_PLATFORM, [self.song_metadata(s) for s in songs])
+        except (sqlite3.Error, KeyError, TypeError):
+            pass  # 存储失败不影响本次接口结果
+    
+    def lookup_songs(self, song_ids: List[int]) -> Dict[int, Dict[str, Any]]:
+        """从元数据存储批量读取歌曲（song/detail 格式），键为歌曲ID"""
+        try:
+            found = self.metadata_store.get_many(self.METADATA_PLATFORM, song_ids)
+        except sqlite3.Error:
+            return {}
+        return {int(sid): song for sid, song in found.items()}
+    
+    def get_song_url(self, song_id: int, quality: str, cookies: Dict[str, str], timeout: float = 30) -> Dict[str, Any]:
         """获取歌曲播放URL
         
         Args:
             song_id: 歌曲ID
             quality: 音质等级 (standard, exhigh, lossless, hires, sky, jyeffect, jymaster)
             cookies: 用户cookies
+            timeout: 请求超时时间（秒）
             
         Returns:
             包含歌曲URL信息的字典
@@ -171,35 +349,117 @@ class NeteaseAPI:
             APIException: API调用失败时抛出
         """
         try:
-            config = APIConstants.DEFAULT_CONFIG.copy()
-            config["requestId"] = str(randrange(20000000, 30000000))
-            
-            payload = {
-                'ids': [song_id],
-                'level': quality,
-                'encodeType': 'flac',
-                'header': json.dumps(config),
-            }
-            
-            if quality == 'sky':
-                payload['immerseType'] = 'c51'
-            
-            params = self.crypto_utils.encrypt_params(APIConstants.SONG_URL_V1, payload)
-            response_text = self.http_client.post_request(APIConstants.SONG_URL_V1, params, cookies)
-            
-            result = json.loads(response_text)
-            if result.get('code') != 200:
-                raise APIException(f"获取歌曲URL失败: {result.get('message', '未知错误')}")
-            
-            return result
+            params = self.build_song_url_params(song_id, quality)
+            response_text = self.http_client.post_request(APIConstants.SONG_URL_V1, params, cookies, timeout)
+            return self.parse_song_url_response(response_text)
         except (json.JSONDecodeError, KeyError) as e:
             raise APIException(f"解析响应数据失败: {e}")
     
-    def get_song_detail(self, song_id: int) -> Dict[str, Any]:
+    def build_song_url_params(self, song_id: int, quality: str) -> str:
+        """构造歌曲URL接口的加密参数（同步与异步客户端共用）"""
+        return self.crypto_utils.encrypt_params(APIConstants.SONG_URL_V1, self.song_url_payload(song_id, quality))
+    
+    def build_song_url_params_many(self, song_id: int, qualities: List[str]) -> Dict[str, str]:
+        """一次性构造同一首歌多个音质的加密参数"""
+        params = self.crypto_utils.encrypt_many(
+            [(APIConstants.SONG_URL_V1, self.song_url_payload(song_id, q)) for q in qualities]
+        )
+        return dict(zip(qualities, params))
+    
+    @staticmethod
+    def song_url_payload(song_id: int, quality: str) -> Dict[str, Any]:
+        """歌曲URL接口的明文参数"""
+        return NeteaseAPI.songs_url_payload([song_id], quality)
+    
+    @staticmethod
+    def songs_url_payload(song_ids: List[int], quality: str) -> Dict[str, Any]:
+        """歌曲URL接口的明文参数（ids 可含多首歌曲）"""
+        config = APIConstants.DEFAULT_CONFIG.copy()
+        config["requestId"] = str(randrange(20000000, 30000000))
+        
+        payload = {
+            'ids': list(song_ids),
+            'level': quality,
+            'encodeType': 'flac',
+            'header': json.dumps(config),
+        }
+        
+        if quality == 'sky':
+            payload['immerseType'] = 'c51'
+        
+        return payload
+    
+    def get_song_urls(self, song_ids: List[int], quality: str, cookies: Dict[str, str], timeout: float = 30,
+                      batch_size: int = 200, max_workers: int = 4) -> Dict[int, Dict[str, Any]]:
+        """批量获取歌曲播放URL（每个请求携带 batch_size 首歌曲）
+        
+        Args:
+            song_ids: 歌曲ID列表
+            quality: 音质等级
+            cookies: 用户cookies
+            timeout: 单次请求超时时间（秒）
+            batch_size: 每个请求包含的歌曲数
+            max_workers: 同时进行的请求数
+            
+        Returns:
+            歌曲ID到 url/v1 data 条目（含 url、br、size、type、level 等）的映射，
+            按 song_ids 顺序排列；接口未返回的歌曲不在其中
+            
+        Raises:
+            APIException: 任一批次请求失败时抛出
+        """
+        ids = list(dict.fromkeys(int(sid) for sid in song_ids))
+        batch_size = max(1, batch_size)
+        batches = [ids[i:i + batch_size] for i in range(0, len(ids), batch_size)]
+        if not batches:
+            return {}
+        
+        # 所有批次的参数一次加密
+        params = self.crypto_utils.encrypt_many(
+            [(APIConstants.SONG_URL_V1, self.songs_url_payload(batch, quality)) for batch in batches]
+        )
+        
+        def fetch(batch_params: str) -> List[Dict[str, Any]]:
+            try:
+                response_text = self.http_client.post_request(APIConstants.SONG_URL_V1, batch_params, cookies, timeout)
+                return self.parse_song_url_response(response_text).get('data') or []
+            except (json.JSONDecodeError, KeyError) as e:
+                raise APIException(f"解析响应数据失败: {e}")
+        
+        if len(batches) == 1:
+            items = fetch(params[0])
+        else:
+            with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(batches))),
+                                    thread_name_prefix="song-url") as executor:
+                items = [item for batch in executor.map(fetch, params) for item in batch]
+        
+        return self.index_song_urls(ids, items)
+    
+    @staticmethod
+    def index_song_urls(song_ids: List[int], items: List[Dict[str, Any]]) -> Dict[int, Dict[str, Any]]:
+        """将 url/v1 的 data 列表按 song_ids 顺序整理为 歌曲ID -> 条目 的映射"""
+        by_id = {int(item['id']): item for item in items if isinstance(item, dict) and item.get('id') is not None}
+        return {sid: by_id[sid] for sid in song_ids if sid in by_id}
+    
+    @staticmethod
+    def parse_song_url_response(response_text: str) -> Dict[str, Any]:
+        """解析歌曲URL接口响应"""
+        result = json.loads(response_text)
+        if result.get('code') != 200:
+            raise APIException(f"获取歌曲URL失败: {result.get('message', '未知错误')}")
+        
+        return result
+    
+    def get_song_detail(self, song_id: int, cookies: Optional[Dict[str, str]] = None,
+                        timeout: float = 30, cached: bool = False) -> Dict[str, Any]:
         """获取歌曲详细信息
         
         Args:
             song_id: 歌曲ID
+            cookies: 用户cookies（可选，传入后 privileges 反映该账号的可用音质）
+            timeout: 请求超时时间（秒）
+            cached: 为 True 时优先读元数据存储；命中时不请求接口，
+                    songs 只含不变字段且 privileges 为空
             
         Returns:
             包含歌曲详细信息的字典
@@ -207,21 +467,31 @@ class NeteaseAPI:
         Raises:
             APIException: API调用失败时抛出
         """
+        if cached:
+            song = self.lookup_songs([song_id]).get(int(song_id))
+            if song is not None:
+                return {'code': 200, 'songs': [song], 'privileges': []}
+        
         try:
             data = {'c': json.dumps([{"id": song_id, "v": 0}])}
-            response = requests.post(APIConstants.SONG_DETAIL_V3, data=data, timeout=30)
+            response = self.http_client.post(APIConstants.SONG_DETAIL_V3, data=data, cookies=cookies, timeout=timeout)
             response.raise_for_status()
             
-            result = response.json()
-            if result.get('code') != 200:
-                raise APIException(f"获取歌曲详情失败: {result.get('message', '未知错误')}")
-            
+            result = self.parse_song_detail_response(response.json())
+            self.remember_songs(result.get('songs') or [])
             return result
         except requests.RequestException as e:
             raise APIException(f"获取歌曲详情请求失败: {e}")
         except json.JSONDecodeError as e:
             raise APIException(f"解析歌曲详情响应失败: {e}")
     
+    @staticmethod
+    def parse_song_detail_response(result: Dict[str, Any]) -> Dict[str, Any]:
+        """检查歌曲详情接口响应"""
+        if result.get('code') != 200:
+            raise APIException(f"获取歌曲详情失败: {result.get('message', '未知错误')}")
+        return result
+    
     def get_lyric(self, song_id: int, cookies: Dict[str, str]) -> Dict[str, Any]:
         """获取歌词信息
         
@@ -236,44 +506,145 @@ class NeteaseAPI:
             APIException: API调用失败时抛出
         """
         try:
-            data = {
-                'id': song_id, 
-                'cp': 'false', 
-                'tv': '0', 
-                'lv': '0', 
-                'rv': '0', 
-                'kv': '0', 
-                'yv': '0', 
-                'ytv': '0', 
-                'yrv': '0'
-            }
+            data = self.lyric_form(song_id)
             
             headers = {
                 'User-Agent': APIConstants.USER_AGENT,
                 'Referer': APIConstants.REFERER
             }
             
-            response = requests.post(APIConstants.LYRIC_API, data=data, 
+            response = self.http_client.post(APIConstants.LYRIC_API, data=data, 
                                    headers=headers, cookies=cookies, timeout=30)
             response.raise_for_status()
             
-            result = response.json()
-            if result.get('code') != 200:
-                raise APIException(f"获取歌词失败: {result.get('message', '未知错误')}")
-            
-            return result
+            return self.parse_lyric_response(response.json())
         except requests.RequestException as e:
             raise APIException(f"获取歌词请求失败: {e}")
         except json.JSONDecodeError as e:
             raise APIException(f"解析歌词响应失败: {e}")
     
-    def search_music(self, keywords: str, cookies: Dict[str, str], limit: int = 10) -> List[Dict[str, Any]]:
+    @staticmethod
+    def lyric_form(song_id: int) -> Dict[str, Any]:
+        """歌词接口的表单参数"""
+        return {
+            'id': song_id, 
+            'cp': 'false', 
+            'tv': '0', 
+            'lv': '0', 
+            'rv': '0', 
+            'kv': '0', 
+            'yv': '0', 
+            'ytv': '0', 
+            'yrv': '0'
+        }
+    
+    @staticmethod
+    def parse_lyric_response(result: Dict[str, Any]) -> Dict[str, Any]:
+        """检查歌词接口响应"""
+        if result.get('code') != 200:
+            raise APIException(f"获取歌词失败: {result.get('message', '未知错误')}")
+        return result
+    
+    def get_song_bundle(self, song_id: int, quality: str, cookies: Dict[str, str], timeout: float = 30,
+                        cached: bool = True) -> Dict[str, Dict[str, Any]]:
+        """一次请求获取歌曲详情、播放URL和歌词
+        
+        三个接口通过 /api/batch 合并为一个 eapi 请求；batch 失败或某个子接口
+        没有返回可用结果时，只为缺少的部分单独请求。
+        
+        Args:
+            song_id: 歌曲ID
+            quality: 音质等级
+            cookies: 用户cookies
+            timeout: 请求超时时间（秒）
+            cached: 为 True 时歌曲详情优先读元数据存储，命中时 batch 只含URL和歌词
+            
+        Returns:
+            {'detail': 同 get_song_detail, 'url': 同 get_song_url, 'lyric': 同 get_lyric}
+            
+        Raises:
+            APIException: 单独请求也失败时抛出
+        """
+        bundle: Dict[str, Dict[str, Any]] = {}
+        if cached:
+            song = self.lookup_songs([song_id]).get(int(song_id))
+            if song is not None:
+                bundle['detail'] = {'code': 200, 'songs': [song], 'privileges': []}
+        
+        if time.time() >= self._batch_disabled_until:
+            try:
+                bundle.update(self._get_song_batch(song_id, quality, cookies, timeout, 'detail' not in bundle))
+            except APIException:
+                pass
+        
+        # 单独请求 batch 没有拿到的部分
+        if 'detail' not in bundle:
+            bundle['detail'] = self.get_song_detail(song_id, cookies, timeout)
+        if 'url' not in bundle:
+            bundle['url'] = self.get_song_url(song_id, quality, cookies, timeout)
+        if 'lyric' not in bundle:
+            bundle['lyric'] = self.get_lyric(song_id, cookies)
+        return bundle
+    
+    @staticmethod
+    def song_batch_payload(song_id: int, quality: str, with_detail: bool = True) -> Dict[str, Any]:
+        """/api/batch 的明文参数：子接口路径 -> JSON 字符串形式的参数"""
+        url_payload = NeteaseAPI.song_url_payload(song_id, quality)
+        url_payload.pop('header')
+        url_payload['ids'] = json.dumps(url_payload['ids'])
+        
+        payload = {
+            '/api/song/enhance/player/url/v1': json.dumps(url_payload),
+            '/api/song/lyric': json.dumps(NeteaseAPI.lyric_form(song_id)),
+        }
+        if with_detail:
+            payload['/api/v3/song/detail'] = json.dumps({'c': json.dumps([{'id': song_id, 'v': 0}])})
+        
+        config = APIConstants.DEFAULT_CONFIG.copy()
+        config["requestId"] = str(randrange(20000000, 30000000))
+        payload['header'] = json.dumps(config)
+        payload['e_r'] = False
+        return payload
+    
+    def _get_song_batch(self, song_id: int, quality: str, cookies: Dict[str, str], timeout: float,
+                        with_detail: bool) -> Dict[str, Dict[str, Any]]:
+        """发送 /api/batch 请求，返回其中可用的子结果（键为 detail/url/lyric）"""
+        params = self.crypto_utils.encrypt_params(
+            APIConstants.BATCH_API, self.song_batch_payload(song_id, quality, with_detail)
+        )
+        try:
+            result = json.loads(self.http_client.post_request(APIConstants.BATCH_API, params, cookies, timeout))
+        except json.JSONDecodeError as e:
+            raise APIException(f"解析batch响应失败: {e}")
+        
+        parts = {
+            'detail': '/api/v3/song/detail',
+            'url': '/api/song/enhance/player/url/v1',
+            'lyric': '/api/song/lyric',
+        }
+        bundle: Dict[str, Dict[str, Any]] = {}
+        for name, path in parts.items():
+            sub = result.get(path) if isinstance(result, dict) else None
+            if isinstance(sub, dict) and sub.get('code') == 200:
+                bundle[name] = sub
+        
+        if not bundle:
+            # 接口不认这个 batch（而不是网络问题），一段时间内不再尝试
+            self._batch_disabled_until = time.time() + self.BATCH_RETRY_AFTER
+            raise APIException(f"batch请求无可用结果: {result.get('message', '') if isinstance(result, dict) else ''}")
+        if 'detail' in bundle:
+            self.remember_songs(bundle['detail'].get('songs') or [])
+        return bundle
+    
+    def search_music(self, keywords: str, cookies: Dict[str, str], limit: int = 10,
+                     timeout: float = 30) -> List[Dict[str, Any]]:
         """搜索音乐
         
         Args:
             keywords: 搜索关键词
             cookies: 用户cookies
             limit: 返回数量限制
+            timeout: 请求超时时间（秒）
             
         Returns:
             歌曲信息列表
@@ -288,40 +659,46 @@ class NeteaseAPI:
                 'Referer': APIConstants.REFERER
             }
             
-            response = requests.post(APIConstants.SEARCH_API, data=data, 
-                                   headers=headers, cookies=cookies, timeout=30)
+            response = self.http_client.post(APIConstants.SEARCH_API, data=data, 
+                                   headers=headers, cookies=cookies, timeout=timeout)
             response.raise_for_status()
             
-            result = response.json()
-            if result.get('code') != 200:
-                raise APIException(f"搜索失败: {result.get('message', '未知错误')}")
-            
-            songs = []
-            for item in result.get('result', {}).get('songs', []):
-                song_info = {
-                    'id': item['id'],
-                    'name': item['name'],
-                    'artists': '/'.join(artist['name'] for artist in item['ar']),
-                    'album': item['al']['name'],
-                    'picUrl': item['al']['picUrl']
-                }
-                songs.append(song_info)
-            
-            return songs
+            return self.parse_search_response(response.json())
         except requests.RequestException as e:
             raise APIException(f"搜索请求失败: {e}")
         except (json.JSONDecodeError, KeyError) as e:
             raise APIException(f"解析搜索响应失败: {e}")
     
-    def get_playlist_detail(self, playlist_id: int, cookies: Dict[str, str]) -> Dict[str, Any]:
-        """获取歌单详情
+    @staticmethod
+    def parse_search_response(result: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """将搜索接口响应整理为歌曲信息列表"""
+        if result.get('code') != 200:
+            raise APIException(f"搜索失败: {result.get('message', '未知错误')}")
+        
+        songs = []
+        for item in result.get('result', {}).get('songs', []):
+            song_info = {
+                'id': item['id'],
+                'name': item['name'],
+                'artists': '/'.join(artist['name'] for artist in item['ar']),
+                'album': item['al']['name'],
+                'picUrl': item['al']['picUrl']
+            }
+            songs.append(song_info)
+        
+        return songs
+    
+    def get_playlist_info(self, playlist_id: int, cookies: Dict[str, str], timeout: float = 30) -> Dict[str, Any]:
+        """获取歌单基本信息及全部歌曲ID（不含歌曲详情）
         
         Args:
             playlist_id: 歌单ID
             cookies: 用户cookies
+            timeout: 请求超时时间（秒）
             
         Returns:
-            歌单详情信息
+            歌单信息，trackIds 为按歌单顺序排列的歌曲ID列表，
+            trackVersions 为歌曲ID到其版本号的映射（用于增量同步）
             
         Raises:
             APIException: API调用失败时抛出
@@ -333,57 +710,206 @@ class NeteaseAPI:
                 'Referer': APIConstants.REFERER
             }
             
-            response = requests.post(APIConstants.PLAYLIST_DETAIL_API, data=data, 
-                                   headers=headers, cookies=cookies, timeout=30)
+            response = self.http_client.post(APIConstants.PLAYLIST_DETAIL_API, data=data, 
+                                   headers=headers, cookies=cookies, timeout=timeout)
             response.raise_for_status()
             
-            result = response.json()
-            if result.get('code') != 200:
-                raise APIException(f"获取歌单详情失败: {result.get('message', '未知错误')}")
-            
-            playlist = result.get('playlist', {})
-            info = {
-                'id': playlist.get('id'),
-                'name': playlist.get('name'),
-                'coverImgUrl': playlist.get('coverImgUrl'),
-                'creator': playlist.get('creator', {}).get('nickname', ''),
-                'trackCount': playlist.get('trackCount'),
-                'description': playlist.get('description', ''),
-                'tracks': []
-            }
-            
-            # 获取所有trackIds并分批获取详细信息
-            track_ids = [str(t['id']) for t in playlist.get('trackIds', [])]
-            for i in range(0, len(track_ids), 100):
-                batch_ids = track_ids[i:i+100]
-                song_data = {'c': json.dumps([{'id': int(sid), 'v': 0} for sid in batch_ids])}
-                
-                song_resp = requests.post(APIConstants.SONG_DETAIL_V3, data=song_data, 
-                                        headers=headers, cookies=cookies, timeout=30)
-                song_resp.raise_for_status()
-                
-                song_result = song_resp.json()
-                for song in song_result.get('songs', []):
-                    info['tracks'].append({
-                        'id': song['id'],
-                        'name': song['name'],
-                        'artists': '/'.join(artist['name'] for artist in song['ar']),
-                        'album': song['al']['name'],
-                        'picUrl': song['al']['picUrl']
-                    })
-            
-            return info
+            return self.parse_playlist_info_response(response.json())
         except requests.RequestException as e:
             raise APIException(f"获取歌单详情请求失败: {e}")
         except (json.JSONDecodeError, KeyError) as e:
             raise APIException(f"解析歌单详情响应失败: {e}")
     
-    def get_album_detail(self, album_id: int, cookies: Dict[str, str]) -> Dict[str, Any]:
+    @staticmethod
+    def parse_playlist_info_response(result: Dict[str, Any]) -> Dict[str, Any]:
+        """将歌单接口响应整理为歌单信息（含 trackIds）"""
+        if result.get('code') != 200:
+            raise APIException(f"获取歌单详情失败: {result.get('message', '未知错误')}")
+        
+        playlist = result.get('playlist', {})
+        return {
+            'id': playlist.get('id'),
+            'name': playlist.get('name'),
+            'coverImgUrl': playlist.get('coverImgUrl'),
+            'creator': playlist.get('creator', {}).get('nickname', ''),
+            'trackCount': playlist.get('trackCount'),
+            'description': playlist.get('description', ''),
+            'trackIds': [int(t['id']) for t in playlist.get('trackIds', [])],
+            'trackVersions': {int(t['id']): t.get('v', 0) for t in playlist.get('trackIds', [])}
+        }
+    
+    @staticmethod
+    def format_track(song: Dict[str, Any]) -> Dict[str, Any]:
+        """将 song/detail 返回的歌曲转换为歌单曲目格式"""
+        return {
+            'id': song['id'],
+            'name': song['name'],
+            'artists': '/'.join(artist['name'] for artist in song['ar']),
+            'album': song['al']['name'],
+            'picUrl': song['al']['picUrl']
+        }
+    
+    def get_songs_detail(self, song_ids: List[int], cookies: Dict[str, str], timeout: float = 30) -> List[Dict[str, Any]]:
+        """批量获取歌曲详情（只为元数据存储中没有的歌曲发请求，建议不超过100首）
+        
+        Args:
+            song_ids: 歌曲ID列表
+            cookies: 用户cookies
+            timeout: 请求超时时间（秒）
+            
+        Returns:
+            歌单曲目格式的歌曲列表
+            
+        Raises:
+            APIException: API调用失败时抛出
+        """
+        known = self.lookup_songs(song_ids)
+        missing = [int(sid) for sid in song_ids if int(sid) not in known]
+        if not missing:
+            return [self.format_track(known[int(sid)]) for sid in song_ids]
+        
+        try:
+            headers = {
+                'User-Agent': APIConstants.USER_AGENT,
+                'Referer': APIConstants.REFERER
+            }
+            song_data = {'c': json.dumps([{'id': sid, 'v': 0} for sid in missing])}
+            
+            song_resp = self.http_client.post(APIConstants.SONG_DETAIL_V3, data=song_data, 
+                                    headers=headers, cookies=cookies, timeout=timeout)
+            song_resp.raise_for_status()
+            
+            fetched = self.parse_song_detail_response(song_resp.json()).get('songs', [])
+            self.remember_songs(fetched)
+            known.update((int(song['id']), song) for song in fetched)
+            return [self.format_track(known[int(sid)]) for sid in song_ids if int(sid) in known]
+        except requests.RequestException as e:
+            raise APIException(f"获取歌曲详情请求失败: {e}")
+        except (json.JSONDecodeError, KeyError) as e:
+            raise APIException(f"解析歌曲详情响应失败: {e}")
+    
+    def _get_songs_detail_retry(self, song_ids: List[int], cookies: Dict[str, str], timeout: float,
+                                retries: int) -> List[Dict[str, Any]]:
+        """单个分块的歌曲详情请求，失败时只重试该分块；最后一次失败的异常直接抛出"""
+        for attempt in range(max(0, retries)):
+            try:
+                return self.get_songs_detail(song_ids, cookies, timeout)
+            except APIException:
+                time.sleep(0.2 * (2 ** attempt))
+        return self.get_songs_detail(song_ids, cookies, timeout)
+    
+    def iter_songs_detail(self, song_ids: List[int], cookies: Dict[str, str], timeout: float = 30,
+                          chunk_size: int = 100, max_workers: int = 8,
+                          retries: int = 1) -> Iterator[List[Dict[str, Any]]]:
+        """并发分块获取歌曲详情，按 song_ids 顺序逐块产出
+        
+        最多同时请求 max_workers 个分块；调用方处理当前分块时后续分块已在请求中。
+        
+        Args:
+            song_ids: 歌曲ID列表
+            cookies: 用户cookies
+            timeout: 单次请求超时时间（秒）
+            chunk_size: 每个请求包含的歌曲数
+            max_workers: 同时进行的请求数
+            retries: 每个分块失败后的重试次数
+            
+        Yields:
+            每个分块的歌单曲目格式歌曲列表
+            
+        Raises:
+            APIException: 某个分块重试后仍失败时抛出
+        """
+        chunk_size = max(1, chunk_size)
+        chunks = [song_ids[i:i + chunk_size] for i in range(0, len(song_ids), chunk_size)]
+        if len(chunks) <= 1:
+            for chunk in chunks:
+                yield self._get_songs_detail_retry(chunk, cookies, timeout, retries)
+            return
+        
+        executor = ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(chunks))),
+                                      thread_name_prefix="song-detail")
+        futures = [executor.submit(self._get_songs_detail_retry, chunk, cookies, timeout, retries)
+                   for chunk in chunks]
+        try:
+            for future in futures:
+                yield future.result()
+        finally:
+            for future in futures:
+                future.cancel()
+            executor.shutdown(wait=False)
+    
+    def get_playlist_detail(self, playlist_id: int, cookies: Dict[str, str], timeout: float = 30,
+                            chunk_size: int = 100, max_workers: int = 8) -> Dict[str, Any]:
+        """获取歌单详情
+        
+        Args:
+            playlist_id: 歌单ID
+            cookies: 用户cookies
+            timeout: 单次请求超时时间（秒）
+            chunk_size: 每次歌曲详情请求包含的歌曲数
+            max_workers: 并发的歌曲详情请求数
+            
+        Returns:
+            歌单详情信息
+            
+        Raises:
+            APIException: API调用失败时抛出
+        """
+        info = self.get_playlist_info(playlist_id, cookies, timeout)
+        track_ids = info.pop('trackIds')
+        info.pop('trackVersions')
+        info['tracks'] = []
+        
+        # 分块并发获取详细信息，按歌单顺序拼接
+        for tracks in self.iter_songs_detail(track_ids, cookies, timeout, chunk_size, max_workers):
+            info['tracks'].extend(tracks)
+        
+        return info
+    
+    def sync_playlist_detail(self, playlist_id: int, cookies: Dict[str, str], timeout: float = 30,
+                             chunk_size: int = 100, max_workers: int = 8) -> Dict[str, Any]:
+        """增量获取歌单详情
+        
+        与 get_playlist_detail 返回相同的结构，但只为上次同步后新增或版本变化的
+        歌曲请求详情；歌单未变化时只需一次歌单头请求。额外的 sync 字段给出
+        复用与新获取的歌曲数。
+        
+        Args:
+            playlist_id: 歌单ID
+            cookies: 用户cookies
+            timeout: 单次请求超时时间（秒）
+            chunk_size: 每次歌曲详情请求包含的歌曲数
+            max_workers: 并发的歌曲详情请求数
+            
+        Returns:
+            歌单详情信息
+            
+        Raises:
+            APIException: API调用失败时抛出
+        """
+        info = self.get_playlist_info(playlist_id, cookies, timeout)
+        track_ids = info.pop('trackIds')
+        versions = info.pop('trackVersions')
+        
+        known = self.playlist_store.snapshot(int(playlist_id), versions)
+        missing = [sid for sid in track_ids if sid not in known]
+        for tracks in self.iter_songs_detail(missing, cookies, timeout, chunk_size, max_workers):
+            self.playlist_store.add_tracks(int(playlist_id), tracks)
+            known.update((int(t['id']), t) for t in tracks)
+        reused = len(track_ids) - len(missing)
+        self.playlist_store.count_reused(reused)
+        
+        info['tracks'] = [known[sid] for sid in track_ids if sid in known]
+        info['sync'] = {'reused': reused, 'fetched': len(missing)}
+        return info
+    
+    def get_album_detail(self, album_id: int, cookies: Dict[str, str], timeout: float = 30) -> Dict[str, Any]:
         """获取专辑详情
         
         Args:
             album_id: 专辑ID
             cookies: 用户cookies
+            timeout: 请求超时时间（秒）
             
         Returns:
             专辑详情信息
@@ -398,39 +924,43 @@ class NeteaseAPI:
                 'Referer': APIConstants.REFERER
             }
             
-            response = requests.get(url, headers=headers, cookies=cookies, timeout=30)
+            response = self.http_client.get(url, headers=headers, cookies=cookies, timeout=timeout)
             response.raise_for_status()
             
-            result = response.json()
-            if result.get('code') != 200:
-                raise APIException(f"获取专辑详情失败: {result.get('message', '未知错误')}")
-            
-            album = result.get('album', {})
-            info = {
-                'id': album.get('id'),
-                'name': album.get('name'),
-                'coverImgUrl': self.get_pic_url(album.get('pic')),
-                'artist': album.get('artist', {}).get('name', ''),
-                'publishTime': album.get('publishTime'),
-                'description': album.get('description', ''),
-                'songs': []
-            }
-            
-            for song in result.get('songs', []):
-                info['songs'].append({
-                    'id': song['id'],
-                    'name': song['name'],
-                    'artists': '/'.join(artist['name'] for artist in song['ar']),
-                    'album': song['al']['name'],
-                    'picUrl': self.get_pic_url(song['al'].get('pic'))
-                })
-            
-            return info
+            return self.parse_album_response(response.json())
         except requests.RequestException as e:
             raise APIException(f"获取专辑详情请求失败: {e}")
         except (json.JSONDecodeError, KeyError) as e:
             raise APIException(f"解析专辑详情响应失败: {e}")
     
+    def parse_album_response(self, result: Dict[str, Any]) -> Dict[str, Any]:
+        """将专辑接口响应整理为专辑详情，并写入歌曲元数据"""
+        if result.get('code') != 200:
+            raise APIException(f"获取专辑详情失败: {result.get('message', '未知错误')}")
+        
+        album = result.get('album', {})
+        info = {
+            'id': album.get('id'),
+            'name': album.get('name'),
+            'coverImgUrl': self.get_pic_url(album.get('pic')),
+            'artist': album.get('artist', {}).get('name', ''),
+            'publishTime': album.get('publishTime'),
+            'description': album.get('description', ''),
+            'songs': []
+        }
+        
+        self.remember_songs(result.get('songs', []))
+        for song in result.get('songs', []):
+            info['songs'].append({
+                'id': song['id'],
+                'name': song['name'],
+                'artists': '/'.join(artist['name'] for artist in song['ar']),
+                'album': song['al']['name'],
+                'picUrl': self.get_pic_url(song['al'].get('pic'))
+            })
+        
+        return info
+    
     def netease_encrypt_id(self, id_str: str) -> str:
         """网易云加密图片ID算法
         
@@ -613,45 +1143,99 @@ class QRLoginManager:
 
 
 # 向后兼容的函数接口
-def url_v1(song_id: int, level: str, cookies: Dict[str, str]) -> Dict[str, Any]:
+_default_api: Optional[NeteaseAPI] = None
+_default_api_lock = threading.Lock()
+
+
+def get_default_api() -> NeteaseAPI:
+    """模块级函数共用的 NeteaseAPI 单例（共享连接池）"""
+    global _default_api
+    if _default_api is None:
+        with _default_api_lock:
+            if _default_api is None:
+                _default_api = NeteaseAPI()
+    return _default_api
+
+
+def url_v1(song_id: int, level: str, cookies: Dict[str, str], timeout: float = 30) -> Dict[str, Any]:
     """获取歌曲URL（向后兼容）"""
-    api = NeteaseAPI()
-    return api.get_song_url(song_id, level, cookies)
+    api = get_default_api()
+    return api.get_song_url(song_id, level, cookies, timeout)
+
 
+def song_urls(song_ids: List[int], level: str, cookies: Dict[str, str], timeout: float = 30,
+              batch_size: int = 200, max_workers: int = 4) -> Dict[int, Dict[str, Any]]:
+    """批量获取歌曲URL（歌曲ID -> url/v1 data 条目）"""
+    api = get_default_api()
+    return api.get_song_urls(song_ids, level, cookies, timeout, batch_size, max_workers)
 
-def name_v1(song_id: int) -> Dict[str, Any]:
+
+def song_bundle(song_id: int, level: str, cookies: Dict[str, str], timeout: float = 30) -> Dict[str, Dict[str, Any]]:
+    """一次请求获取歌曲详情、URL和歌词（detail/url/lyric）"""
+    api = get_default_api()
+    return api.get_song_bundle(song_id, level, cookies, timeout)
+
+
+def name_v1(song_id: int, cookies: Optional[Dict[str, str]] = None, timeout: float = 30,
+            cached: bool = False) -> Dict[str, Any]:
     """获取歌曲详情（向后兼容）"""
-    api = NeteaseAPI()
-    return api.get_song_detail(song_id)
+    api = get_default_api()
+    return api.get_song_detail(song_id, cookies, timeout, cached)
 
 
 def lyric_v1(song_id: int, cookies: Dict[str, str]) -> Dict[str, Any]:
     """获取歌词（向后兼容）"""
-    api = NeteaseAPI()
+    api = get_default_api()
     return api.get_lyric(song_id, cookies)
 
 
-def search_music(keywords: str, cookies: Dict[str, str], limit: int = 10) -> List[Dict[str, Any]]:
+def search_music(keywords: str, cookies: Dict[str, str], limit: int = 10,
+                 timeout: float = 30) -> List[Dict[str, Any]]:
     """搜索音乐（向后兼容）"""
-    api = NeteaseAPI()
-    return api.search_music(keywords, cookies, limit)
+    api = get_default_api()
+    return api.search_music(keywords, cookies, limit, timeout)
 
 
-def playlist_detail(playlist_id: int, cookies: Dict[str, str]) -> Dict[str, Any]:
+def playlist_detail(playlist_id: int, cookies: Dict[str, str], timeout: float = 30,
+                    chunk_size: int = 100, max_workers: int = 8) -> Dict[str, Any]:
     """获取歌单详情（向后兼容）"""
-    api = NeteaseAPI()
-    return api.get_playlist_detail(playlist_id, cookies)
+    api = get_default_api()
+    return api.get_playlist_detail(playlist_id, cookies, timeout, chunk_size, max_workers)
+
+
+def playlist_sync(playlist_id: int, cookies: Dict[str, str], timeout: float = 30,
+                  chunk_size: int = 100, max_workers: int = 8) -> Dict[str, Any]:
+    """增量获取歌单详情（只请求新增歌曲的详情）"""
+    api = get_default_api()
+    return api.sync_playlist_detail(playlist_id, cookies, timeout, chunk_size, max_workers)
+
+
+def playlist_store() -> PlaylistStore:
+    """模块级函数共用的歌单快照存储"""
+    return get_default_api().playlist_store
+
+
+def playlist_info(playlist_id: int, cookies: Dict[str, str], timeout: float = 30) -> Dict[str, Any]:
+    """获取歌单信息及歌曲ID列表（不含歌曲详情）"""
+    api = get_default_api()
+    return api.get_playlist_info(playlist_id, cookies, timeout)
+
+
+def songs_detail(song_ids: List[int], cookies: Dict[str, str], timeout: float = 30) -> List[Dict[str, Any]]:
+    """批量获取歌曲详情（歌单曲目格式）"""
+    api = get_default_api()
+    return api.get_songs_detail(song_ids, cookies, timeout)
 
 
-def album_detail(album_id: int, cookies: Dict[str, str]) -> Dict[str, Any]:
+def album_detail(album_id: int, cookies: Dict[str, str], timeout: float = 30) -> Dict[str, Any]:
     """获取专辑详情（向后兼容）"""
-    api = NeteaseAPI()
-    return api.get_album_detail(album_id, cookies)
+    api = get_default_api()
+    return api.get_album_detail(album_id, cookies, timeout)
 
 
 def get_pic_url(pic_id: Optional[int], size: int = 300) -> str:
     """获取图片URL（向后兼容）"""
-    api = NeteaseAPI()
+    api = get_default_api()
     return api.get_pic_url(pic_id, size)
 
 
@@ -26,6 +26,7 @@ from mutagen.id3 import ID3, TIT2, TPE1, TALB, TDRC, TRCK, APIC
 from mutagen.mp4 import MP4
 
 from music_api import NeteaseAPI, APIException
+from async_music_api import AsyncNeteaseAPI
 from cookie_manager import CookieManager
 
 
@@ -176,55 +177,96 @@ class MusicDownloader:
             # 获取cookies
             cookies = self.cookie_manager.parse_cookies()
             
-            # 获取音乐URL信息
-            url_result = self.api.get_song_url(music_id, quality, cookies)
-            if not url_result.get('data') or not url_result['data']:
-                raise DownloadException(f"无法获取音乐ID {music_id} 的播放链接")
-            
-            song_data = url_result['data'][0]
-            download_url = song_data.get('url', '')
-            if not download_url:
-                raise DownloadException(f"音乐ID {music_id} 无可用的下载链接")
-            
-            # 获取音乐详情
-            detail_result = self.api.get_song_detail(music_id)
-            if not detail_result.get('songs') or not detail_result['songs']:
-                raise DownloadException(f"无法获取音乐ID {music_id} 的详细信息")
-            
-            song_detail = detail_result['songs'][0]
-            
-            # 获取歌词
-            lyric_result = self.api.get_lyric(music_id, cookies)
-            lyric = lyric_result.get('lrc', {}).get('lyric', '') if lyric_result else ''
-            tlyric = lyric_result.get('tlyric', {}).get('lyric', '') if lyric_result else ''
-            
-            # 构建艺术家字符串
-            artists = '/'.join(artist['name'] for artist in song_detail.get('ar', []))
-            
-            # 创建MusicInfo对象
-            music_info = MusicInfo(
-                id=music_id,
-                name=song_detail.get('name', '未知歌曲'),
-                artists=artists or '未知艺术家',
-                album=song_detail.get('al', {}).get('name', '未知专辑'),
-                pic_url=song_detail.get('al', {}).get('picUrl', ''),
-                duration=song_detail.get('dt', 0) // 1000,  # 转换为秒
-                track_number=song_detail.get('no', 0),
-                download_url=download_url,
-                file_type=song_data.get('type', 'mp3').lower(),
-                file_size=song_data.get('size', 0),
-                quality=quality,
-                lyric=lyric,
-                tlyric=tlyric
-            )
-            
-            return music_info
+            # URL、详情、歌词合并为一次请求（歌名、歌手等不变字段优先读本地元数据存储）
+            bundle = self.api.get_song_bundle(music_id, quality, cookies)
             
+            return self._build_music_info(music_id, quality, bundle['url'], bundle['detail'], bundle['lyric'])
+        
+        except DownloadException:
+            raise
         except APIException as e:
             raise DownloadException(f"API调用失败: {e}")
         except Exception as e:
             raise DownloadException(f"获取音乐信息时发生错误: {e}")
     
+    async def get_music_info_async(self, music_id: int, quality: str = "standard",
+                                   client: Optional[AsyncNeteaseAPI] = None) -> MusicInfo:
+        """异步获取音乐详细信息（URL、详情、歌词三个请求并发发出）
+        
+        Args:
+            music_id: 音乐ID
+            quality: 音质等级
+            client: 共用的异步API客户端，为空时本次调用临时创建
+        
+        Returns:
+            音乐信息对象
+        
+        Raises:
+            DownloadException: 获取信息失败时抛出
+        """
+        if client is None:
+            async with AsyncNeteaseAPI(metadata_store=self.api.metadata_store) as client:
+                return await self.get_music_info_async(music_id, quality, client)
+        
+        try:
+            cookies = self.cookie_manager.parse_cookies()
+            url_result, detail_result, lyric_result = await asyncio.gather(
+                client.get_song_url(music_id, quality, cookies),
+                client.get_song_detail(music_id, cached=True),
+                client.get_lyric(music_id, cookies)
+            )
+            return self._build_music_info(music_id, quality, url_result, detail_result, lyric_result)
+        
+        except DownloadException:
+            raise
+        except APIException as e:
+            raise DownloadException(f"API调用失败: {e}")
+        except Exception as e:
+            raise DownloadException(f"获取音乐信息时发生错误: {e}")
+    
+    def _build_music_info(self, music_id: int, quality: str, url_result: Dict[str, Any],
+                          detail_result: Dict[str, Any], lyric_result: Dict[str, Any]) -> MusicInfo:
+        """由歌曲URL、详情和歌词接口的结果构建音乐信息对象
+        
+        Raises:
+            DownloadException: 无播放链接或无歌曲详情时抛出
+        """
+        if not url_result.get('data') or not url_result['data']:
+            raise DownloadException(f"无法获取音乐ID {music_id} 的播放链接")
+        
+        song_data = url_result['data'][0]
+        download_url = song_data.get('url', '')
+        if not download_url:
+            raise DownloadException(f"音乐ID {music_id} 无可用的下载链接")
+        
+        if not detail_result.get('songs') or not detail_result['songs']:
+            raise DownloadException(f"无法获取音乐ID {music_id} 的详细信息")
+        
+        song_detail = detail_result['songs'][0]
+        
+        lyric = lyric_result.get('lrc', {}).get('lyric', '') if lyric_result else ''
+        tlyric = lyric_result.get('tlyric', {}).get('lyric', '') if lyric_result else ''
+        
+        # 构建艺术家字符串
+        artists = '/'.join(artist['name'] for artist in song_detail.get('ar', []))
+        
+        # 创建MusicInfo对象
+        return MusicInfo(
+            id=music_id,
+            name=song_detail.get('name', '未知歌曲'),
+            artists=artists or '未知艺术家',
+            album=song_detail.get('al', {}).get('name', '未知专辑'),
+            pic_url=song_detail.get('al', {}).get('picUrl', ''),
+            duration=song_detail.get('dt', 0) // 1000,  # 转换为秒
+            track_number=song_detail.get('no', 0),
+            download_url=download_url,
+            file_type=song_data.get('type', 'mp3').lower(),
+            file_size=song_data.get('size', 0),
+            quality=quality,
+            lyric=lyric,
+            tlyric=tlyric
+        )
+    
     def download_music_file(self, music_id: int, quality: str = "standard") -> DownloadResult:
         """下载音乐文件到本地
         
@@ -289,19 +331,25 @@ class MusicDownloader:
                 error_message=f"下载过程中发生错误: {e}"
             )
     
-    async def download_music_file_async(self, music_id: int, quality: str = "standard") -> DownloadResult:
+    async def download_music_file_async(self, music_id: int, quality: str = "standard",
+                                        client: Optional[AsyncNeteaseAPI] = None) -> DownloadResult:
         """异步下载音乐文件到本地
         
         Args:
             music_id: 音乐ID
             quality: 音质等级
+            client: 共用的异步API客户端（接口请求和文件下载共用其连接池），为空时临时创建
             
         Returns:
             下载结果对象
         """
+        if client is None:
+            async with AsyncNeteaseAPI(metadata_store=self.api.metadata_store) as client:
+                return await self.download_music_file_async(music_id, quality, client)
+        
         try:
-            # 获取音乐信息（同步操作）
-            music_info = self.get_music_info(music_id, quality)
+            # 获取音乐信息
+            music_info = await self.get_music_info_async(music_id, quality, client)
             
             # 生成文件名
             filename = f"{music_info.artists} - {music_info.name}"
@@ -321,13 +369,12 @@ class MusicDownloader:
                 )
             
             # 异步下载文件
-            async with aiohttp.ClientSession() as session:
-                async with session.get(music_info.download_url) as response:
-                    response.raise_for_status()
-                    
-                    async with aiofiles.open(file_path, 'wb') as f:
-                        async for chunk in response.content.iter_chunked(8192):
-                            await f.write(chunk)
+            async with client.session.get(music_info.download_url) as response:
+                response.raise_for_status()
+                
+                async with aiofiles.open(file_path, 'wb') as f:
+                    async for chunk in response.content.iter_chunked(8192):
+                        await f.write(chunk)
             
             # 写入音乐标签
             self._write_music_tags(file_path, music_info)
@@ -397,12 +444,13 @@ class MusicDownloader:
         """
         semaphore = asyncio.Semaphore(self.max_concurrent)
         
-        async def download_with_semaphore(music_id: int) -> DownloadResult:
-            async with semaphore:
-                return await self.download_music_file_async(music_id, quality)
-        
-        tasks = [download_with_semaphore(music_id) for music_id in music_ids]
-        results = await asyncio.gather(*tasks, return_exceptions=True)
+        async with AsyncNeteaseAPI(metadata_store=self.api.metadata_store) as client:
+            async def download_with_semaphore(music_id: int) -> DownloadResult:
+                async with semaphore:
+                    return await self.download_music_file_async(music_id, quality, client)
+            
+            tasks = [download_with_semaphore(music_id) for music_id in music_ids]
+            results = await asyncio.gather(*tasks, return_exceptions=True)
         
         # 处理异常结果
         processed_results = []